@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+import threading
+from funcs import get_wallets, get_balances_batch, format_wallet_balances
+from provider import get_web3, get_usdc_contract
+
+# In-memory snapshot of the fleet's USDC and ETH balances for the dashboard. A background
+# thread re-reads all balances (one Multicall3 pass pinned to one block) when a new block
+# arrives, at most once per BALANCE_REFRESH_INTERVAL, so any number of page loads share
+# one chain scan instead of each starting their own.
+
+BALANCE_REFRESH_INTERVAL = float(os.getenv("BALANCE_REFRESH_INTERVAL", "60"))  # Min seconds between refreshes
+BLOCK_POLL_INTERVAL = 4  # Seconds between eth_blockNumber checks
+
+
+class BalanceCache:
+    def __init__(self, refresh_interval=BALANCE_REFRESH_INTERVAL, poll_interval=BLOCK_POLL_INTERVAL, web3=None):
+        self.refresh_interval = refresh_interval
+        self.poll_interval = poll_interval
+        self.web3 = web3
+        self.block_number = None
+        self.fetched_at = 0.0
+        self.started_at = None  # time.monotonic() when the read behind the snapshot started
+        self.balances = {}  # checksum address -> (usdc_raw, eth_wei)
+        self.requested = set()  # Addresses the snapshot tried to read, those missing from balances failed
+        self._refresh_lock = threading.Lock()  # One chain scan at a time
+        self._thread = None
+        self._stop = threading.Event()
+
+    def refresh(self, wallets=None):
+        """Read every wallet's balances at the latest block and swap in the new snapshot.
+
+        Callers arriving while a refresh runs wait for it, and reuse its result only if that
+        read started after their request. One already in flight when they asked may predate
+        changes they want to see (e.g. a forced refresh), so they read again.
+        """
+        requested_at = time.monotonic()
+        with self._refresh_lock:
+            if self.started_at is not None and self.started_at > requested_at:
+                return  # A refresh that started after our request already finished
+            web3 = self.web3 or get_web3()
+            wallets = get_wallets() if wallets is None else wallets
+            started_at = time.monotonic()
+            started = time.time()
+            addresses = [web3.to_checksum_address(w["address"]) for w in wallets]
+            block_number, balances = get_balances_batch(addresses, get_usdc_contract(), web3)
+            self.balances = balances
+            self.requested = set(addresses)
+            self.block_number = block_number
+            self.started_at = started_at
+            self.fetched_at = time.time()
+            logging.info(f"Balance cache refreshed at block {block_number}: {len(balances)} wallets in {self.fetched_at - started:.2f}s")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if time.time() - self.fetched_at >= self.refresh_interval:
+                    web3 = self.web3 or get_web3()
+                    if self.block_number is None or web3.eth.block_number > self.block_number:
+                        self.refresh()
+            except Exception as e:
+                logging.error(f"Balance cache refresh failed: {str(e)}")
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start the background refresher (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="balance-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh_new(self, addresses):
+        """Read only the addresses the snapshot never tried (e.g. wallets generated since) and merge them in.
+
+        They are read at the snapshot's block, so every entry and the reported block still match.
+        """
+        with self._refresh_lock:
+            new = [a for a in addresses if a not in self.requested]
+            if not new:
+                return
+            web3 = self.web3 or get_web3()
+            _, balances = get_balances_batch(new, get_usdc_contract(), web3, block_number=self.block_number)
+            self.balances = {**self.balances, **balances}
+            self.requested = self.requested | set(new)  # Failed ones wait for the next full refresh
+            logging.info(f"Balance cache added {len(balances)} of {len(new)} new wallets at block {self.block_number}")
+
+    def wallet_balances(self, wallets, force=False):
+        """Balances for the given wallets from the snapshot (funcs.format_wallet_balances rows).
+
+        Refreshes everything synchronously on force or before the first snapshot. Wallets the
+        snapshot has not covered yet (e.g. just generated) are read on their own. Wallets whose
+        read failed show as unknown (None) until the background refresh gets them, instead of
+        every page load re-reading the whole fleet. The result carries "block" and "age" (seconds).
+        """
+        web3 = self.web3 or get_web3()
+        addresses = [web3.to_checksum_address(w["address"]) for w in wallets]
+        if force or self.block_number is None:
+            self.refresh()
+        elif any(a not in self.requested for a in addresses):
+            self.refresh_new(addresses)
+
+        return {
+            "wallets": format_wallet_balances(wallets, self.balances, web3),
+            "block": self.block_number,
+            "age": round(time.time() - self.fetched_at, 1),
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_balance_cache():
+    """Return the process-wide BalanceCache, starting its refresher on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = BalanceCache()
+                _cache.start()
+    return _cache
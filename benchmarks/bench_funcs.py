@@ -0,0 +1,198 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import datetime
+import statistics
+import tempfile
+from web3 import Web3
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import funcs
+from funcs import generate_wallets, get_wallets, save_wallets, search_wallets, read_last_n_lines
+from wallet_db import load_or_create_key
+from bench_log_tail import write_log
+
+# Repeatable benchmarks for the wallet store and log hot paths in funcs.py. Everything runs
+# offline in a temp dir (no RPC). Each run is saved as JSON under benchmarks/results/ and
+# compared with the previous run (or --baseline), metrics slower by more than --threshold
+# are flagged as regressions.
+# Usage: python benchmarks/bench_funcs.py --sizes 1000,10000,100000 --repeat 3
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MNEMONIC = "test test test test test test test test test test test junk"
+
+
+def synthetic_wallets(count, seed=1):
+    """Wallet records in the generate_wallets format with random keys (no HD derivation, so 100k is quick)."""
+    rng = random.Random(seed)
+    wallets = []
+    for i in range(count):
+        wallets.append({
+            "address": Web3.to_checksum_address(rng.randbytes(20).hex()),
+            "private_key": rng.randbytes(32).hex(),
+            "name": f"User {i}",
+            "email": f"user{i}@example.com",
+            "kraken_nickname": f"Wallet#{i}",
+            "enabled": True,
+            "index": i,
+        })
+    return wallets
+
+def measure(fn, repeat, setup=None):
+    """Run fn repeat times (setup() before each, untimed) and return timing stats in seconds."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(times), "min": min(times), "runs": repeat}
+
+def store_paths(workdir, name):
+    return os.path.join(workdir, f"{name}.enc"), os.path.join(workdir, f"{name}.key")
+
+def remove_store(wallets_file, key_file):
+    for path in (funcs.db_path_for(wallets_file), key_file):
+        if os.path.exists(path):
+            os.remove(path)
+    funcs._wallet_cache.clear()
+
+def bench_generate(workdir, count, repeat, workers):
+    wallets_file, key_file = store_paths(workdir, "generate")
+    result = measure(lambda: generate_wallets(count, wallets_file, key_file, workers=workers), repeat,
+                     setup=lambda: remove_store(wallets_file, key_file))
+    result["per_second"] = round(count / result["seconds"], 1)
+    return result
+
+def bench_store(workdir, size, repeat, queries):
+    """save_wallets, cold and cached get_wallets and search_wallets on a fleet of size wallets."""
+    results = {}
+    wallets = synthetic_wallets(size)
+    wallets_file, key_file = store_paths(workdir, f"fleet_{size}")
+
+    def fresh_store():
+        remove_store(wallets_file, key_file)
+        load_or_create_key(key_file)
+    results[f"save_wallets[{size}]"] = measure(lambda: save_wallets(wallets, MNEMONIC, wallets_file, key_file), repeat, setup=fresh_store)
+
+    # Cold: decrypt and parse every row. Cached: the mtime-stamped in-process cache hit
+    results[f"get_wallets_cold[{size}]"] = measure(lambda: get_wallets(wallets_file, key_file), repeat, setup=funcs._wallet_cache.clear)
+    results[f"get_wallets_cached[{size}]"] = measure(lambda: get_wallets(wallets_file, key_file), repeat)
+
+    rng = random.Random(size)
+    targets = [rng.randrange(size) for _ in range(queries)]
+    for match in ("exact", "iexact"):
+        def run_queries():
+            for i in targets:
+                if not search_wallets(f"User {i}", f"user{i}@example.com", wallets_file, key_file, match=match):
+                    raise RuntimeError(f"search_wallets found nothing for wallet {i}")
+        result = measure(run_queries, repeat)
+        result["seconds"] /= queries  # Per query
+        result["min"] /= queries
+        result["queries"] = queries
+        results[f"search_wallets_{match}[{size}]"] = result
+    return results
+
+def bench_log(workdir, size_mb, lines, repeat):
+    log_file = os.path.join(workdir, "usdc_transfer.log")
+    write_log(log_file, size_mb)
+    return {
+        f"read_last_n_lines[{size_mb}MB,{lines}]": measure(lambda: read_last_n_lines(lines, log_file), repeat),
+        f"read_last_n_lines_error[{size_mb}MB,{lines}]": measure(lambda: read_last_n_lines(lines, log_file, level="ERROR"), repeat),
+    }
+
+def latest_result(exclude=None):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, "funcs-*.json")) if p != exclude)
+    return paths[-1] if paths else None
+
+def compare(results, baseline, threshold):
+    """Return [(metric, baseline_seconds, seconds, change)] for metrics slower than threshold."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before["seconds"]:
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        if change > threshold:
+            regressions.append((name, before["seconds"], result["seconds"], change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the wallet store and log paths in funcs.py")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated fleet sizes for the store benchmarks")
+    parser.add_argument("--generate", type=int, default=500, help="Wallets derived by the generate_wallets benchmark")
+    parser.add_argument("--workers", type=int, default=None, help="generate_wallets derivation workers")
+    parser.add_argument("--queries", type=int, default=200, help="search_wallets lookups per run")
+    parser.add_argument("--log-mb", type=int, default=100, help="Size of the generated log")
+    parser.add_argument("--lines", type=int, default=250, help="Lines to tail")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per metric, the median is reported")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/funcs-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Result file to compare with (default: the latest earlier run)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown flagged as a regression (0.25 = 25%%)")
+    parser.add_argument("--strict", action="store_true", help="Exit with status 1 when a regression is found")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else os.path.join(
+        RESULTS_DIR, f"funcs-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    baseline_file = args.baseline or latest_result(exclude=output)
+
+    workdir = tempfile.mkdtemp(prefix="bench_funcs_")
+    results = {}
+    try:
+        print(f"generate_wallets x{args.generate}...")
+        results[f"generate_wallets[{args.generate}]"] = bench_generate(workdir, args.generate, args.repeat, args.workers)
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"Wallet store with {size} wallets...")
+            results.update(bench_store(workdir, size, args.repeat, args.queries))
+        print(f"read_last_n_lines on a {args.log_mb} MB log...")
+        results.update(bench_log(workdir, args.log_mb, args.lines, args.repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if baseline_file and os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+
+    print(f"\n{'metric':<44} {'median':>12} {'min':>12} {'baseline':>12} {'change':>8}")
+    for name, result in results.items():
+        before = (baseline or {}).get("results", {}).get(name)
+        change = f"{(result['seconds'] / before['seconds'] - 1) * 100:+.0f}%" if before and before["seconds"] else ""
+        before_ms = f"{before['seconds'] * 1000:.3f}ms" if before else ""
+        print(f"{name:<44} {result['seconds'] * 1000:>10.3f}ms {result['min'] * 1000:>10.3f}ms {before_ms:>12} {change:>8}")
+    print(f"\nSaved {output}")
+
+    if baseline is None:
+        print("No baseline to compare with")
+        return
+    regressions = compare(results, baseline, args.threshold)
+    print(f"Compared with {baseline_file}")
+    for name, before, after, change in regressions:
+        print(f"  REGRESSION {name}: {before * 1000:.3f}ms -> {after * 1000:.3f}ms ({change * 100:+.0f}%)")
+    if not regressions:
+        print(f"  No metric slower by more than {args.threshold * 100:.0f}%")
+    elif args.strict:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import argparse
+from eth_account import Account
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from funcs import derive_accounts
+
+# Compares the per-wallet Account.from_mnemonic loop generate_wallets used to run against
+# the bulk derive_accounts path, and checks both produce the same keys.
+# Usage: python benchmarks/bench_hd_derivation.py --count 200
+
+
+def derive_with_from_mnemonic(mnemonic, start_index, count):
+    accounts = []
+    for i in range(start_index, start_index + count):
+        account = Account.from_mnemonic(mnemonic, account_path=f"m/44'/60'/0'/0/{i}")
+        accounts.append((account.address, account.key.hex()))
+    return accounts
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HD wallet derivation")
+    parser.add_argument("--count", type=int, default=200, help="Number of wallets to derive")
+    parser.add_argument("--start", type=int, default=0, help="First HD index")
+    args = parser.parse_args()
+
+    Account.enable_unaudited_hdwallet_features()
+    _, mnemonic = Account.create_with_mnemonic()
+
+    start = time.perf_counter()
+    legacy = derive_with_from_mnemonic(mnemonic, args.start, args.count)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bulk = derive_accounts(mnemonic, args.start, args.count)
+    bulk_seconds = time.perf_counter() - start
+
+    if legacy != bulk:
+        print("MISMATCH: derive_accounts does not match Account.from_mnemonic")
+        sys.exit(1)
+
+    print(f"Derived {args.count} wallets from index {args.start}")
+    print(f"  Account.from_mnemonic loop: {legacy_seconds:.3f}s ({args.count / legacy_seconds:.1f} wallets/s)")
+    print(f"  derive_accounts:            {bulk_seconds:.3f}s ({args.count / bulk_seconds:.1f} wallets/s)")
+    print(f"  Speedup: {legacy_seconds / bulk_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from funcs import CustomFileReader
+
+# Compares the old byte-at-a-time read_last_n_lines against the block-buffered reader on a
+# generated log in the usdc_transfer.log format (with some multibyte UTF-8 in the messages).
+# The log is generated once in the temp dir and reused by later runs.
+# Usage: python benchmarks/bench_log_tail.py --size-mb 300 --lines 250
+
+
+def legacy_read_last_n_lines(file, n):
+    # The previous implementation: one seek + read(1) per byte from the end
+    file.seek(0, 2)
+    pos = file.tell()
+    num_lines = 0
+    while pos > 0:
+        pos -= 1
+        file.seek(pos)
+        if file.read(1) == b'\n':
+            num_lines += 1
+            if num_lines == n:
+                break
+    return [line.decode() for line in file.readlines()]
+
+def write_log(path, size_mb):
+    levels = ["INFO"] * 97 + ["WARNING"] * 2 + ["ERROR"]
+    target = size_mb * 1024 * 1024
+    random.seed(1)
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        i = 0
+        while written < target:
+            level = random.choice(levels)
+            line = f"2026-01-01 00:{(i // 60) % 60:02d}:{i % 60:02d},{i % 1000:03d} - {level} - Wallet 0x{i:040x} has {i % 997}.5 USDC — transfer ✓ #{i}\n"
+            f.write(line)
+            written += len(line.encode("utf-8"))
+            i += 1
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark log tailing")
+    parser.add_argument("--size-mb", type=int, default=300, help="Size of the generated log")
+    parser.add_argument("--lines", type=int, default=250, help="Lines to tail")
+    parser.add_argument("--log", default=os.path.join(tempfile.gettempdir(), "bench_usdc_transfer.log"),
+                        help="Log file to generate/reuse (default: in the temp dir)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log) or os.path.getsize(args.log) < args.size_mb * 1024 * 1024:
+        print(f"Generating {args.size_mb} MB log at {args.log}...")
+        write_log(args.log, args.size_mb)
+
+    with open(args.log, "rb") as f:
+        # The old reader stops after n newlines counting the trailing one, so ask it for one more
+        legacy, legacy_seconds = timed(lambda: legacy_read_last_n_lines(f, args.lines + 1))
+    with CustomFileReader(args.log, "rb") as f:
+        blocked, blocked_seconds = timed(lambda: f.read_last_n_lines(args.lines))
+    if legacy != blocked:
+        print("MISMATCH: block reader output differs from the legacy reader")
+        sys.exit(1)
+    with CustomFileReader(args.log, "rb") as f:
+        errors, errors_seconds = timed(lambda: f.read_last_n_lines(args.lines, level="ERROR"))
+
+    print(f"Tail {args.lines} lines of {os.path.getsize(args.log) / 1024 / 1024:.0f} MB log")
+    print(f"  byte-at-a-time reader: {legacy_seconds * 1000:.1f} ms")
+    print(f"  block reader:          {blocked_seconds * 1000:.1f} ms ({legacy_seconds / blocked_seconds:.0f}x)")
+    print(f"  block reader, last {len(errors)} ERROR lines: {errors_seconds * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Runs a full sweep (and the gas refill planner) against the in-memory SimulatedChain, so
+# throughput changes can be measured without mainnet or real funds.
+# Usage: python benchmarks/bench_sweep_sim.py --wallets 10000 --latency-ms 30 --error-rate 0.01
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline sweep simulation on a synthetic fleet")
+    parser.add_argument("--wallets", type=int, default=10000)
+    parser.add_argument("--active-share", type=float, default=0.2, help="Share of wallets holding sweepable USDC")
+    parser.add_argument("--mode", choices=["full", "deposits", "planned"], default="full")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every RPC round trip")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of RPC calls answered with an error")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of transactions that are never mined")
+    parser.add_argument("--block-time", type=float, default=1.0, help="Simulated seconds per block")
+    parser.add_argument("--base-fee-gwei", type=float, default=20.0)
+    parser.add_argument("--eth-price", type=float, default=2500.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-gas-plan", action="store_true")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # Everything the run writes (log, Sheets spool, price cache, deposit db) stays in a temp dir
+    workdir = tempfile.mkdtemp(prefix="sweep_sim_")
+    os.chdir(workdir)
+    logging.basicConfig(filename=os.path.join(workdir, "usdc_transfer.log"), level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from web3 import Web3
+    import provider
+    import prices
+    from sim_chain import SimulatedChain, SimulatedProvider, generate_fleet, fund_fleet, SimCoinGecko, NullWorksheet
+
+    master = "0x000000000000000000000000000000000000bEEF"
+    os.environ["KRAKEN_ADDRESS"] = master
+    os.environ["KRAKEN_FAKE"] = "1"
+    chain = SimulatedChain(base_fee_gwei=args.base_fee_gwei, block_time=args.block_time, drop_rate=args.drop_rate, seed=args.seed)
+    sim_provider = SimulatedProvider(chain, latency=args.latency_ms / 1000, error_rate=args.error_rate, seed=args.seed)
+    provider.set_web3(Web3(sim_provider))
+    prices.cg = SimCoinGecko(args.eth_price)
+    prices.PRICE_CACHE_FILE = os.path.join(workdir, "eth_price.json")
+
+    import sweep_to_main
+    from deposit_indexer import DepositIndexer
+    sweep_to_main.CONFIRM_POLL_INTERVAL = args.block_time / 4
+    sweep_to_main.sheet_logger._worksheet = NullWorksheet()
+
+    started = time.time()
+    wallets, funding = generate_fleet(args.wallets, eth_price_usd=args.eth_price, active_share=args.active_share, seed=args.seed)
+    print(f"Generated {len(wallets)} wallets in {time.time() - started:.1f}s (work dir {workdir})")
+
+    indexer = None
+    if args.mode == "deposits":
+        # Seed the indexer while the fleet is empty, so the funding shows up as deposits
+        indexer = DepositIndexer(db_file=os.path.join(workdir, "deposits.db"), confirmations=0)
+        indexer.track([w["address"] for w in wallets], block_number=chain.block_number)
+    fund_fleet(chain, funding)
+    expected_usdc = sum(usdc for _, usdc in funding.values() if usdc >= sweep_to_main.MIN_SWEEP_USDC * 10**6)
+    time.sleep(args.block_time * 1.5)  # Let the funding block be mined
+
+    report = {"wallets": len(wallets), "mode": args.mode, "workers": args.workers, "latency_ms": args.latency_ms,
+              "error_rate": args.error_rate, "drop_rate": args.drop_rate, "block_time": args.block_time}
+
+    # A stage that raises is recorded in the report ("error") and the run goes on, so error
+    # injection measures how the pipeline degrades instead of ending the benchmark
+    if not args.skip_gas_plan:
+        import send_out_gas
+        sim_provider.reset_counters()
+        started = time.time()
+        try:
+            plan = send_out_gas.plan_gas_refills(wallets)
+            report["gas_plan"] = {
+                "refills": len(plan["refills"]),
+                "unread": len(plan["unread"]),
+            }
+        except Exception as e:
+            report["gas_plan"] = {"error": repr(e)}
+        report["gas_plan"].update({
+            "seconds": round(time.time() - started, 3),
+            "rpc_calls": sum(sim_provider.calls.values()),
+            "rpc_calls_per_wallet": round(sum(sim_provider.calls.values()) / len(wallets), 4),
+        })
+
+    sim_provider.reset_counters()
+    sim_before = chain.sim_seconds
+    started = time.time()
+    try:
+        if args.mode == "full":
+            summary = sweep_to_main.sweep_wallets(wallets, max_workers=args.workers)
+        elif args.mode == "deposits":
+            candidates, balances, _ = sweep_to_main.select_deposit_candidates(wallets, indexer)
+            summary = sweep_to_main.sweep_wallets(candidates, max_workers=args.workers, balances=balances)
+        else:
+            import sweep_planner
+            _, summary = sweep_planner.sweep_planned(wallets, max_workers=args.workers)
+    except Exception as e:
+        summary = {"error": repr(e)}
+    wall = time.time() - started
+    rpc_calls = sum(sim_provider.calls.values())
+    swept_usdc = chain.usdc[Web3.to_checksum_address(master)]
+
+    report["sweep"] = {
+        "wall_seconds": round(wall, 2),
+        "simulator_seconds": round(chain.sim_seconds - sim_before, 2),
+        "wallets_per_second": round(len(wallets) / wall, 1),
+        "swept": summary.get("swept", 0),
+        "skipped": summary.get("skipped", 0),
+        "failed": summary.get("failed", 0),
+        "failed_stages": summary.get("failed_stages", {}),
+        "rpc_calls": rpc_calls,
+        "rpc_round_trips": sim_provider.round_trips,
+        "rpc_calls_per_wallet": round(rpc_calls / len(wallets), 3),
+        "rpc_calls_by_method": dict(sim_provider.calls.most_common()),
+        "blocks": chain.block_number,
+        "final_base_fee_gwei": round(chain.base_fee / 10**9, 2),
+        "usdc_swept": swept_usdc / 10**6,
+        "usdc_sweepable": expected_usdc / 10**6,
+    }
+    if "error" in summary:
+        report["sweep"]["error"] = summary["error"]
+
+    print(json.dumps(report, indent=2))
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
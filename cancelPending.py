@@ -1,14 +1,15 @@
 from web3 import Web3
 import os
 from dotenv import load_dotenv
+from provider import get_web3
+from fees import get_fee_oracle
 
 load_dotenv()
-INFURA_API_KEY = os.getenv("INFURA_API_KEY")
 KRAKEN_ADDRESS = os.getenv("KRAKEN_ADDRESS")
 KRAKEN_ADDRESS = Web3.to_checksum_address(KRAKEN_ADDRESS)
 
-# Connect to Ethereum node
-web3 = Web3(Web3.HTTPProvider(f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"))
+# Connect to Ethereum node (shared, pooled provider)
+web3 = get_web3()
 
 # Example sender address and private key
 sender_address = '0xe18f986B9FD463e049B0c8Bb4412f4c4F599EA3D'
@@ -29,11 +30,12 @@ def cancel_pending_transaction(address, private_key, web3):
             'chainId': web3.eth.chain_id
         }
 
-        # Get current gas price and increase it by 20% to ensure replacement
-        current_gas_price = web3.eth.gas_price
-        new_gas_price = int(current_gas_price * 1.2)  # 20% higher gas price
+        # Take current fees from the shared oracle and increase them by 20% to ensure replacement
+        fees = get_fee_oracle().suggest(multiplier=1.2)
+        new_gas_price = fees['maxFeePerGas']
 
-        tx['gasPrice'] = new_gas_price
+        tx['maxFeePerGas'] = new_gas_price
+        tx['maxPriorityFeePerGas'] = fees['maxPriorityFeePerGas']
 
         # Estimate gas (should be 21000 for a simple transfer, but confirm)
         estimated_gas = web3.eth.estimate_gas(tx)
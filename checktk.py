@@ -5,8 +5,7 @@ from datetime import datetime, timedelta
 import time
 import logging
 
-import gspread
-from google.oauth2.service_account import Credentials
+from sheets_logger import SheetLogger, transaction_row
 
 
 #Add this to your .env file
@@ -16,9 +15,6 @@ USERNAME = os.getenv("TAEKUS_USERNAME")
 SHEET_NAME_TAEKUS = os.getenv("SHEET_NAME_TAEKUS") # Name of the worksheet in your Google Sheet for Taekus transactions
 SHEET_ID = os.getenv("SHEET_ID") # Found in the Google Sheet URL: https://docs.google.com/spreadsheets/d/<SHEET_ID>/edit
 
-# Define the scope and load credentials
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-CREDS_FILE = "credentials.json"
 
 # Set up logging
 logging.basicConfig(filename='taekus.log', level=logging.INFO, 
@@ -46,29 +42,12 @@ class Account:
         return f"Account(uuid={self.uuid}, name={self.name})"
     
 
+# Sheets ledger: rows are spooled locally and appended in batches (see sheets_logger.py)
+sheet_logger = SheetLogger(SHEET_ID, SHEET_NAME_TAEKUS, "taekus_sheets_spool.jsonl")
+
 def log_transaction(transaction_data):
     try:
-        # Authenticate with Google Sheets API
-        creds = Credentials.from_service_account_file(CREDS_FILE, scopes=SCOPES)
-        client = gspread.authorize(creds)
-
-        # Open the Google Sheet
-        spreadsheet = client.open_by_key(SHEET_ID)
-        worksheet = spreadsheet.worksheet(SHEET_NAME_TAEKUS)
-
-        # Prepare transaction data (example format)
-        # Assuming transaction_data is a dict like: {"amount": 100.50, "recipient": "John Doe", "status": "Success"}
-        row = [
-            datetime.datetime.now().isoformat(),  # Timestamp
-            transaction_data.get("recipient", ""),
-            transaction_data.get("email", ""),
-            transaction_data.get("address", ""),
-            transaction_data.get("amount", ""),
-            transaction_data.get("gasUSD", ""),
-        ]
-        # Append the row to the Google Sheet
-        worksheet.append_row(row)
-        logging.info("Transaction logged successfully!")
+        sheet_logger.log(transaction_row(transaction_data))
     except Exception as e:
         logging.info(f"Error logging transaction: {e}")
 
@@ -88,6 +67,7 @@ def main():
     for account in accountsList:
         time.sleep(2)
         fetchListPaymentCardTransactions(BusinessUUID, account.uuid)
+    sheet_logger.flush()
 
 
 
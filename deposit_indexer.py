@@ -0,0 +1,290 @@
+import os
+import time
+import logging
+import sqlite3
+from funcs import get_wallets, get_balances_batch
+from provider import get_web3, get_usdc_contract, USDC_CONTRACT_ADDRESS
+
+# Incremental USDC deposit indexer. Instead of calling balanceOf for every wallet, scan the
+# USDC Transfer logs that touch our addresses (eth_getLogs with the addresses as topics) over
+# block ranges since the last checkpoint, and keep a local ledger and balance per wallet.
+# Work per run is proportional to the number of new transfers, not the size of the fleet.
+#
+# Balances are seeded once per wallet with a Multicall3 read at the checkpoint block, after
+# that every Transfer in or out adjusts them. Only blocks CONFIRMATIONS deep are indexed so
+# a reorg does not leave phantom deposits in the ledger.
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"  # Transfer(address,address,uint256)
+DEPOSIT_DB_FILE = "deposits.db"
+CONFIRMATIONS = 12
+MAX_BLOCK_RANGE = 2000  # Upper bound for one eth_getLogs range, shrinks adaptively
+ADDRESS_TOPIC_CHUNK = 500  # Addresses per topic "or" list, providers limit filter size
+RPC_ATTEMPTS = 3  # Tries per node call before a sync gives up (it resumes from the checkpoint next time)
+RPC_RETRY_DELAY = 0.5  # Seconds, doubled after each failed try
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS balances (
+    address TEXT PRIMARY KEY,
+    usdc_raw INTEGER NOT NULL,
+    seeded_block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    address TEXT NOT NULL,
+    counterparty TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    PRIMARY KEY (tx_hash, log_index, direction)
+);
+CREATE INDEX IF NOT EXISTS idx_ledger_address_block ON ledger (address, block_number);
+CREATE INDEX IF NOT EXISTS idx_ledger_block ON ledger (block_number);
+"""
+
+# Error fragments providers use when a getLogs range returns too many results or takes too long
+RANGE_ERROR_HINTS = ("more than", "too many", "limit exceeded", "response size", "block range", "query timeout", "-32005")
+
+
+def _address_topic(address):
+    return "0x" + "0" * 24 + address[2:].lower()
+
+def _topic_address(web3, topic):
+    return web3.to_checksum_address("0x" + bytes(topic)[-20:].hex())
+
+def _is_range_error(error):
+    message = str(error).lower()
+    return any(hint in message for hint in RANGE_ERROR_HINTS)
+
+
+class DepositIndexer:
+    def __init__(self, db_file=DEPOSIT_DB_FILE, web3=None, confirmations=CONFIRMATIONS, max_range=MAX_BLOCK_RANGE,
+                 address_chunk=ADDRESS_TOPIC_CHUNK):
+        self.web3 = web3
+        self.confirmations = confirmations
+        self.max_range = max_range
+        self.range = max_range  # Current range, halves on provider limits and grows back on success
+        self.address_chunk = address_chunk
+        self.conn = sqlite3.connect(db_file)
+        self.conn.executescript(SCHEMA)
+        self.rpc_calls = 0
+        self._split = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def _web3(self):
+        return self.web3 or get_web3()
+
+    def _latest_block(self):
+        for attempt in range(RPC_ATTEMPTS):
+            try:
+                self.rpc_calls += 1
+                return self._web3().eth.block_number
+            except Exception as e:
+                if attempt == RPC_ATTEMPTS - 1:
+                    raise
+                logging.warning(f"Deposit indexer could not read the block number ({e}), retrying")
+                time.sleep(RPC_RETRY_DELAY * 2 ** attempt)
+
+    # Checkpoint and markers
+
+    def get_state(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_state(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, int(value)))
+
+    @property
+    def last_block(self):
+        """Last fully indexed block, None before the first sync."""
+        return self.get_state("last_block")
+
+    # Seeding
+
+    def track(self, addresses, block_number=None):
+        """Seed balances for addresses not in the ledger yet, read at the checkpoint block.
+
+        The first call on an empty database also sets the checkpoint (default: the latest
+        confirmed block, or DEPOSIT_INDEXER_START_BLOCK from the environment).
+        Addresses whose balance read fails stay untracked and are seeded by a later call.
+        Returns the number of newly tracked addresses.
+        """
+        web3 = self._web3()
+        if self.last_block is None:
+            if block_number is None:
+                start = os.getenv("DEPOSIT_INDEXER_START_BLOCK")
+                block_number = int(start) if start else self._latest_block() - self.confirmations
+            self.set_state("last_block", block_number)
+        block_number = self.last_block
+
+        known = {row[0] for row in self.conn.execute("SELECT address FROM balances")}
+        new_addresses = [a for a in dict.fromkeys(web3.to_checksum_address(a) for a in addresses) if a not in known]
+        if not new_addresses:
+            return 0
+        _, balances = get_balances_batch(new_addresses, get_usdc_contract(), web3, block_number=block_number)
+        self.rpc_calls += 1
+        seeded = [a for a in new_addresses if a in balances]
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO balances (address, usdc_raw, seeded_block) VALUES (?, ?, ?)",
+                                  [(a, balances[a][0], block_number) for a in seeded])
+        logging.info(f"Deposit indexer seeded {len(seeded)} wallets at block {block_number}")
+        if len(seeded) < len(new_addresses):
+            logging.warning(f"Deposit indexer could not read {len(new_addresses) - len(seeded)} wallets at block {block_number}, "
+                            f"retrying on the next sync")
+        return len(seeded)
+
+    # Log scanning
+
+    def _get_logs(self, from_block, to_block, topics, attempt=0):
+        """eth_getLogs over [from_block, to_block], halving the range while the provider refuses it.
+
+        The reduced range is kept in self.range, so later queries start from a size that worked.
+        Other errors are retried RPC_ATTEMPTS times.
+        """
+        step = self.range
+        if to_block - from_block + 1 > step:
+            return [log for start in range(from_block, to_block + 1, step)
+                    for log in self._get_logs(start, min(start + step - 1, to_block), topics)]
+        try:
+            self.rpc_calls += 1
+            return list(self._web3().eth.get_logs({
+                "fromBlock": from_block,
+                "toBlock": to_block,
+                "address": USDC_CONTRACT_ADDRESS,
+                "topics": topics,
+            }))
+        except Exception as e:
+            if not _is_range_error(e) and attempt < RPC_ATTEMPTS - 1:
+                logging.warning(f"getLogs {from_block}-{to_block} failed ({e}), retrying")
+                time.sleep(RPC_RETRY_DELAY * 2 ** attempt)
+                return self._get_logs(from_block, to_block, topics, attempt + 1)
+            if from_block >= to_block or not _is_range_error(e):
+                raise
+            self.range = max(1, (to_block - from_block + 1) // 2)
+            self._split = True
+            logging.warning(f"getLogs {from_block}-{to_block} refused ({e}), retrying with {self.range} block ranges")
+            return self._get_logs(from_block, to_block, topics)
+
+    def _scan_range(self, from_block, to_block, addresses):
+        """All Transfer logs in range with one of addresses as sender or recipient, deduplicated."""
+        logs = {}
+        for i in range(0, len(addresses), self.address_chunk):
+            chunk = [_address_topic(a) for a in addresses[i:i + self.address_chunk]]
+            for topics in ([TRANSFER_TOPIC, None, chunk], [TRANSFER_TOPIC, chunk, None]):
+                for log in self._get_logs(from_block, to_block, topics):
+                    logs[(bytes(log["transactionHash"]), log["logIndex"])] = log
+        return [logs[key] for key in sorted(logs, key=lambda k: (logs[k]["blockNumber"], k[1]))]
+
+    def _apply(self, logs, tracked, to_block):
+        """Write ledger rows and balance changes for logs and move the checkpoint, atomically."""
+        web3 = self._web3()
+        seeded = dict(self.conn.execute("SELECT address, seeded_block FROM balances"))
+        deposits = 0
+        with self.conn:
+            for log in logs:
+                if len(log["topics"]) < 3:
+                    continue
+                sender = _topic_address(web3, log["topics"][1])
+                recipient = _topic_address(web3, log["topics"][2])
+                amount = int.from_bytes(bytes(log["data"]), "big")
+                tx_hash = web3.to_hex(log["transactionHash"])
+                block_number = log["blockNumber"]
+                for direction, address, counterparty, delta in (("in", recipient, sender, amount), ("out", sender, recipient, -amount)):
+                    # Skip addresses seeded at or after this block, their balance already includes it
+                    if address not in tracked or block_number <= seeded.get(address, block_number):
+                        continue
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO ledger (tx_hash, log_index, direction, address, counterparty, amount, block_number) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (tx_hash, log["logIndex"], direction, address, counterparty, amount, block_number))
+                    if cursor.rowcount:
+                        self.conn.execute("UPDATE balances SET usdc_raw = usdc_raw + ? WHERE address = ?", (delta, address))
+                        deposits += direction == "in"
+            self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('last_block', ?)", (to_block,))
+        return deposits
+
+    def sync(self, addresses=None, to_block=None):
+        """Index Transfer logs from the checkpoint up to to_block (default: latest confirmed block).
+
+        addresses defaults to every wallet in the store; untracked ones are seeded first.
+        Returns a summary dict with the scanned block range, events, deposits and RPC calls.
+        """
+        started = time.time()
+        calls_before = self.rpc_calls
+        if addresses is None:
+            addresses = [w["address"] for w in get_wallets()]
+        self.track(addresses)
+        tracked = {row[0] for row in self.conn.execute("SELECT address FROM balances")}
+        addresses = sorted(tracked)
+
+        if to_block is None:
+            to_block = self._latest_block() - self.confirmations
+        start_block = self.last_block + 1
+        summary = {"from_block": start_block, "to_block": to_block, "events": 0, "deposits": 0}
+
+        from_block = start_block
+        while from_block <= to_block:
+            end_block = min(from_block + self.range - 1, to_block)
+            self._split = False
+            logs = self._scan_range(from_block, end_block, addresses)
+            summary["events"] += len(logs)
+            summary["deposits"] += self._apply(logs, tracked, end_block)
+            from_block = end_block + 1
+            if not self._split:
+                self.range = min(self.max_range, self.range * 2)  # Grow back while the provider accepts it
+
+        summary["rpc_calls"] = self.rpc_calls - calls_before
+        summary["seconds"] = round(time.time() - started, 2)
+        if start_block <= to_block:
+            logging.info(f"Deposit indexer scanned blocks {start_block}-{to_block} for {len(addresses)} wallets: "
+                         f"{summary['events']} transfers, {summary['deposits']} deposits, "
+                         f"{summary['rpc_calls']} RPC calls in {summary['seconds']}s")
+        return summary
+
+    # Queries
+
+    def balance(self, address):
+        """Indexed USDC balance (raw units) as of the checkpoint, None if untracked."""
+        row = self.conn.execute("SELECT usdc_raw FROM balances WHERE address = ?",
+                                (self._web3().to_checksum_address(address),)).fetchone()
+        return None if row is None else row[0]
+
+    def balances(self):
+        return dict(self.conn.execute("SELECT address, usdc_raw FROM balances"))
+
+    def deposits_since(self, block_number, address=None):
+        """Incoming transfers after block_number as dicts, oldest first."""
+        query = "SELECT tx_hash, log_index, address, counterparty, amount, block_number FROM ledger WHERE direction = 'in' AND block_number > ?"
+        params = [block_number]
+        if address:
+            query += " AND address = ?"
+            params.append(self._web3().to_checksum_address(address))
+        query += " ORDER BY block_number, log_index"
+        columns = ("tx_hash", "log_index", "address", "from", "amount", "block_number")
+        return [dict(zip(columns, row)) for row in self.conn.execute(query, params)]
+
+    def addresses_with_deposits_since(self, block_number):
+        return {row[0] for row in self.conn.execute(
+            "SELECT DISTINCT address FROM ledger WHERE direction = 'in' AND block_number > ?", (block_number,))}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(filename='usdc_transfer.log', level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    with DepositIndexer() as indexer:
+        print(indexer.sync())
@@ -0,0 +1,110 @@
+import time
+import math
+import logging
+import threading
+from provider import get_web3
+
+# Shared EIP-1559 fee oracle. One eth_feeHistory call per new block feeds every transaction
+# builder, instead of each builder asking for gas_price / max_priority_fee itself. The block
+# number is checked at most every BLOCK_CHECK_INTERVAL, so a burst of builders shares one check.
+
+FEE_HISTORY_BLOCKS = 10  # Blocks of history the priority fee percentiles are taken over
+REWARD_PERCENTILES = (10, 25, 50, 75, 90)
+DEFAULT_PERCENTILE = 50
+BLOCK_CHECK_INTERVAL = 1  # Seconds between eth_blockNumber checks
+BASE_FEE_HEADROOM = 1.25  # maxFeePerGas covers this much base fee growth (12.5% per full block)
+REPLACEMENT_BUMP = 1.125  # Nodes need >= 10% higher fees to replace a pending transaction
+MIN_PRIORITY_FEE = 10**8  # 0.1 gwei
+REFRESH_ATTEMPTS = 3  # RPC attempts per refresh before falling back to the last snapshot
+REFRESH_RETRY_DELAY = 0.25  # Seconds, doubled after each failed attempt
+
+
+class FeeOracle:
+    def __init__(self, web3=None, percentiles=REWARD_PERCENTILES, blocks=FEE_HISTORY_BLOCKS, block_check_interval=BLOCK_CHECK_INTERVAL):
+        self.web3 = web3
+        self.percentiles = tuple(percentiles)
+        self.blocks = blocks
+        self.block_check_interval = block_check_interval
+        self.block_number = None
+        self.next_base_fee = None
+        self.priority_fees = {}  # percentile -> wei, median over the history window
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Pull eth_feeHistory when a new block was mined since the last snapshot.
+
+        RPC errors are retried REFRESH_ATTEMPTS times, then the last snapshot is kept. Raises
+        only when there has never been one.
+        """
+        with self._lock:
+            if not force and self.next_base_fee is not None and time.time() - self.checked_at < self.block_check_interval:
+                return
+            for attempt in range(REFRESH_ATTEMPTS):
+                try:
+                    self._refresh_locked(force)
+                    return
+                except Exception as e:
+                    if attempt < REFRESH_ATTEMPTS - 1:
+                        logging.warning(f"Fee oracle refresh failed ({str(e)}), retrying")
+                        time.sleep(REFRESH_RETRY_DELAY * 2 ** attempt)
+                    elif self.next_base_fee is None:
+                        raise
+                    else:
+                        logging.warning(f"Fee oracle refresh failed ({str(e)}), using the snapshot from block {self.block_number}")
+                        self.checked_at = time.time()  # Next check after the usual interval, not on every call
+
+    def _refresh_locked(self, force):
+        web3 = self.web3 or get_web3()
+        block_number = web3.eth.block_number
+        if not force and block_number == self.block_number:
+            self.checked_at = time.time()
+            return
+        history = web3.eth.fee_history(self.blocks, block_number, list(self.percentiles))
+        self.checked_at = time.time()
+        base_fees = history["baseFeePerGas"]
+        # baseFeePerGas has one extra entry: the base fee of the next (pending) block
+        self.next_base_fee = int(base_fees[-1])
+        self.block_number = block_number
+        rewards = history.get("reward") or []
+        for i, percentile in enumerate(self.percentiles):
+            values = sorted(int(block_rewards[i]) for block_rewards in rewards if block_rewards)
+            self.priority_fees[percentile] = max(values[len(values) // 2], MIN_PRIORITY_FEE) if values else MIN_PRIORITY_FEE
+        logging.info(f"Fee oracle at block {self.block_number}: next base fee {self.next_base_fee / 10**9:.2f} gwei, "
+                     f"priority p{DEFAULT_PERCENTILE} {self.priority_fees.get(DEFAULT_PERCENTILE, 0) / 10**9:.2f} gwei")
+
+    def base_fee(self):
+        self.refresh()
+        return self.next_base_fee
+
+    def suggest(self, percentile=DEFAULT_PERCENTILE, multiplier=1.0):
+        """EIP-1559 fee fields for a transaction sent now.
+
+        percentile picks the priority fee from the recent history. multiplier scales both
+        fees, e.g. REPLACEMENT_BUMP ** attempt when re-sending with the same nonce.
+        Returns a dict with maxFeePerGas, maxPriorityFeePerGas and the expected per-gas
+        cost (base fee + tip) under "expectedGasPrice".
+        """
+        self.refresh()
+        if percentile not in self.priority_fees:
+            percentile = min(self.priority_fees, key=lambda p: abs(p - percentile))
+        priority_fee = math.ceil(self.priority_fees[percentile] * multiplier)
+        max_fee = math.ceil((self.next_base_fee * BASE_FEE_HEADROOM + self.priority_fees[percentile]) * multiplier)
+        return {
+            "maxFeePerGas": max_fee,
+            "maxPriorityFeePerGas": priority_fee,
+            "expectedGasPrice": self.next_base_fee + priority_fee,
+        }
+
+
+_oracle = None
+_oracle_lock = threading.Lock()
+
+def get_fee_oracle():
+    """Return the process-wide FeeOracle bound to the shared Web3 instance."""
+    global _oracle
+    if _oracle is None:
+        with _oracle_lock:
+            if _oracle is None:
+                _oracle = FeeOracle()
+    return _oracle
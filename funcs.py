@@ -1,12 +1,136 @@
 import os
-import json
+import csv
+import time
+import datetime
 import logging
-from web3 import Web3
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from eth_account import Account
-from cryptography.fernet import Fernet
+try:
+    # Private eth_account internals, only used by the bulk path in derive_accounts
+    from eth_account.hdaccount import seed_from_mnemonic
+    from eth_account.hdaccount.deterministic import Node, SoftNode, SECP256K1_N, derive_child_key, ec_point, hmac_sha512
+except ImportError:
+    seed_from_mnemonic = None
+from eth_keys import keys
 from dotenv import load_dotenv
+from provider import get_usdc_contract, ensure_connected
+from fees import get_fee_oracle
+from nonces import get_nonce_manager, is_stale_nonce_error, is_known_transaction_error, NONCE_RESYNC_ATTEMPTS
+from wallet_db import WalletDB, db_path_for, load_or_create_key, migrate_from_enc
+from metrics import WALLET_STORE_LOAD, WALLET_STORE_CACHE_HITS
+
+
+
+ETH_ACCOUNT_PARENT_PATH = "m/44'/60'/0'/0"  # Wallet i lives at m/44'/60'/0'/0/i
+SELF_CHECK_MNEMONIC = "test test test test test test test test test test test junk"  # Known vector for the fast path check
+
+_fast_derivation_ok = None  # Result of the one-time self-check, None until it ran
+
+def _derive_accounts_slow(mnemonic, start_index, count, passphrase=""):
+    Account.enable_unaudited_hdwallet_features()
+    accounts = []
+    for index in range(start_index, start_index + count):
+        account = Account.from_mnemonic(mnemonic, passphrase=passphrase, account_path=f"{ETH_ACCOUNT_PARENT_PATH}/{index}")
+        accounts.append((account.address, account.key.hex()))
+    return accounts
+
+def _derive_accounts_fast(mnemonic, start_index, count, passphrase=""):
+    seed = seed_from_mnemonic(mnemonic, passphrase)
+    main_node = hmac_sha512(b"Bitcoin seed", seed)
+    parent_key, parent_chain_code = main_node[:32], main_node[32:]
+    for node in ETH_ACCOUNT_PARENT_PATH.split("/")[1:]:
+        parent_key, parent_chain_code = derive_child_key(parent_key, parent_chain_code, Node.decode(node))
+    parent_point = ec_point(parent_key)
+    parent_int = int.from_bytes(parent_key, "big")
+
+    accounts = []
+    for index in range(start_index, start_index + count):
+        node = SoftNode(index)
+        child = hmac_sha512(parent_chain_code, parent_point + node.serialize())
+        child_int = (int.from_bytes(child[:32], "big") + parent_int) % SECP256K1_N
+        if int.from_bytes(child[:32], "big") >= SECP256K1_N or child_int == 0:
+            # Invalid child (< 2**-127 chance), let eth_account apply the BIP32 rule
+            child_key, _ = derive_child_key(parent_key, parent_chain_code, node)
+        else:
+            child_key = child_int.to_bytes(32, "big")
+        address = keys.PrivateKey(child_key).public_key.to_checksum_address()
+        accounts.append((address, child_key.hex()))
+    return accounts
+
+def _fast_derivation_available():
+    """Whether the fast path can be used: the internals import and still derive the keys eth_account does.
+
+    Checked once per process by deriving index 0 of SELF_CHECK_MNEMONIC both ways, so an
+    eth_account upgrade that changes a helper's behaviour cannot make wallets silently stop
+    matching the mnemonic.
+    """
+    global _fast_derivation_ok
+    if _fast_derivation_ok is None:
+        if seed_from_mnemonic is None:
+            _fast_derivation_ok = False
+        else:
+            try:
+                fast = _derive_accounts_fast(SELF_CHECK_MNEMONIC, 0, 1)
+            except Exception as e:
+                logging.warning(f"Fast HD derivation failed its self-check ({str(e)}), using Account.from_mnemonic")
+                fast = None
+            _fast_derivation_ok = fast == _derive_accounts_slow(SELF_CHECK_MNEMONIC, 0, 1)
+            if fast is not None and not _fast_derivation_ok:
+                logging.warning("Fast HD derivation does not match Account.from_mnemonic, using Account.from_mnemonic")
+    return _fast_derivation_ok
+
+def derive_accounts(mnemonic, start_index, count, passphrase=""):
+    """Derive (address, private_key_hex) pairs for HD indices start_index .. start_index+count-1.
+
+    Same keys as Account.from_mnemonic(mnemonic, account_path=f"m/44'/60'/0'/0/{i}"), but the
+    PBKDF2 seed stretch and the derivation down to the m/44'/60'/0'/0 parent node happen once,
+    and the parent public key is computed once, so each wallet only costs one HMAC and one
+    public key for its address. If an eth_account upgrade moves or changes those internals
+    (see _fast_derivation_available), this falls back to the slower public Account.from_mnemonic.
+    """
+    if not _fast_derivation_available():
+        return _derive_accounts_slow(mnemonic, start_index, count, passphrase)
+    return _derive_accounts_fast(mnemonic, start_index, count, passphrase)
+
+def _derive_accounts_shard(args):
+    # Top-level so it can be pickled for the process pool
+    return derive_accounts(*args)
+
+def derive_accounts_parallel(mnemonic, start_index, count, workers=None, shard_size=None):
+    """derive_accounts sharded across a process pool, merged back in HD index order."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or count < 2:
+        return derive_accounts(mnemonic, start_index, count)
+    shard_size = shard_size or max(1, -(-count // (workers * 4)))  # ~4 shards per worker to balance load
+    shards = [(mnemonic, start, min(shard_size, start_index + count - start))
+              for start in range(start_index, start_index + count, shard_size)]
+    accounts = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() yields results in submission order, so the merge is deterministic
+        for shard_accounts in executor.map(_derive_accounts_shard, shards):
+            accounts.extend(shard_accounts)
+    return accounts
+
+def load_user_data_csv(csv_file):
+    """Read name/email rows for generate_wallets from a CSV file with a name,email header."""
+    user_data = []
+    with open(csv_file, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or "name" not in reader.fieldnames or "email" not in reader.fieldnames:
+            raise ValueError(f"{csv_file} must have a header row with 'name' and 'email' columns")
+        for line_number, row in enumerate(reader, start=2):
+            name = (row.get("name") or "").strip()
+            email = (row.get("email") or "").strip()
+            if not name or not email:
+                raise ValueError(f"{csv_file} line {line_number}: name and email are both required")
+            user_data.append({"name": name, "email": email})
+    return user_data
 
-
+def generate_wallets_from_csv(csv_file, wallets_file="wallets.enc", key_file="encryption_key.txt", workers=None):
+    user_data = load_user_data_csv(csv_file)
+    logging.info(f"Loaded {len(user_data)} users from {csv_file}")
+    return generate_wallets(num_wallets=len(user_data), wallets_file=wallets_file, key_file=key_file, user_data=user_data, workers=workers)
 
 def verifyUserData(user_data, highest_index, num_wallets):
     # If user_data is not provided, create placeholder name/email pairs
@@ -22,32 +146,108 @@ def verifyUserData(user_data, highest_index, num_wallets):
                 raise ValueError("Each user_data entry must be a dict with 'name' and 'email' keys")
     return user_data
 
-def save_wallets(wallets, mnemonic, wallets_file="wallets.enc", key_file="encryption_key.txt"):
-    data = {
-        "metadata": {
-            "mnemonic": mnemonic
-        },
-        "wallets": wallets
-    }
+def _ensure_wallet_db(wallets_file, key_file):
+    """Migrate a legacy wallets_file into its SQLite store on first use. Returns the db path."""
+    migrate_from_enc(wallets_file, key_file)
+    return db_path_for(wallets_file)
+
+def _wallet_store_exists(wallets_file, key_file):
+    return os.path.exists(key_file) and (os.path.exists(db_path_for(wallets_file)) or os.path.exists(wallets_file))
+
+def _open_wallet_db(wallets_file, key_file):
+    return WalletDB(_ensure_wallet_db(wallets_file, key_file), load_or_create_key(key_file))
 
-    # Save wallets securely
+def save_wallets(wallets, mnemonic, wallets_file="wallets.enc", key_file="encryption_key.txt"):
+    """Bulk write of all wallets, single wallet changes go through the row-level helpers instead."""
     logging.info("Saving wallets securely...")
-    key = Fernet.generate_key()
-    cipher = Fernet(key)
-    with open(wallets_file, "wb") as f:
-        f.write(cipher.encrypt(json.dumps(data).encode()))
-    with open(key_file, "wb") as f:
-        f.write(key)
+    records = [dict(w, index=w.get("index", i)) for i, w in enumerate(wallets)]
+    with _open_wallet_db(wallets_file, key_file) as db:
+        db.save_all(records, mnemonic)
+    # Refresh the cache with what was just written so the next read skips the decrypt
+    _cache_wallet_data(wallets_file, key_file, {"metadata": {"mnemonic": mnemonic}, "wallets": records})
+
+# In-process cache of decrypted wallet stores, keyed by (db file, key file).
+# An entry is valid while both files keep the mtime and size they had when it was stored.
+_wallet_cache = {}
+_wallet_cache_lock = threading.Lock()
+
+def _wallet_cache_key(wallets_file, key_file):
+    return (os.path.abspath(db_path_for(wallets_file)), os.path.abspath(key_file))
+
+def _wallet_file_stamp(wallets_file, key_file):
+    db_stat = os.stat(db_path_for(wallets_file))
+    key_stat = os.stat(key_file)
+    return (db_stat.st_mtime_ns, db_stat.st_size, key_stat.st_mtime_ns, key_stat.st_size)
+
+def _cache_wallet_data(wallets_file, key_file, data):
+    with _wallet_cache_lock:
+        _wallet_cache[_wallet_cache_key(wallets_file, key_file)] = {
+            "stamp": _wallet_file_stamp(wallets_file, key_file),
+            "data": data,
+        }
+
+def _update_cached_wallets(wallets_file, key_file, stamp_before_write, update):
+    """Apply update(data) to the cache after a row-level write made by this process.
+
+    If the store changed before our write (another process), the entry is dropped instead.
+    """
+    cache_key = _wallet_cache_key(wallets_file, key_file)
+    with _wallet_cache_lock:
+        cached = _wallet_cache.get(cache_key)
+        if cached is None:
+            return
+        if cached["stamp"] != stamp_before_write:
+            del _wallet_cache[cache_key]
+            return
+        update(cached["data"])
+        cached["stamp"] = _wallet_file_stamp(wallets_file, key_file)
+
+def _load_wallet_data(wallets_file, key_file):
+    """Return the decrypted {"metadata", "wallets"} dict, decrypting only when the store changed.
+
+    The returned dict is shared with the cache, callers must copy before mutating.
+    """
+    _ensure_wallet_db(wallets_file, key_file)
+    cache_key = _wallet_cache_key(wallets_file, key_file)
+    stamp = _wallet_file_stamp(wallets_file, key_file)
+    with _wallet_cache_lock:
+        cached = _wallet_cache.get(cache_key)
+        if cached and cached["stamp"] == stamp:
+            WALLET_STORE_CACHE_HITS.inc()
+            return cached["data"]
+
+    with WALLET_STORE_LOAD.time(), _open_wallet_db(wallets_file, key_file) as db:
+        data = {"metadata": {"mnemonic": db.get_mnemonic()}, "wallets": db.load_wallets()}
+    logging.info(f"Decrypted {len(data['wallets'])} wallets from {db_path_for(wallets_file)}")
+    with _wallet_cache_lock:
+        _wallet_cache[cache_key] = {"stamp": stamp, "data": data}
+    return data
+
+def _set_wallet_enabled(wallet, enabled, wallets_file, key_file):
+    """Single-row write of the enabled flag, kept in step with the cache."""
+    stamp = _wallet_file_stamp(wallets_file, key_file)
+    with _open_wallet_db(wallets_file, key_file) as db:
+        updated = db.set_enabled(wallet["address"], enabled)
+
+    def update(data):
+        for cached_wallet in data["wallets"]:
+            if cached_wallet["address"] == wallet["address"]:
+                cached_wallet["enabled"] = enabled
+    _update_cached_wallets(wallets_file, key_file, stamp, update)
+    wallet["enabled"] = enabled
+    return updated
+
+def _add_wallets(new_wallets, wallets_file, key_file):
+    """Insert new wallet rows in one transaction, kept in step with the cache."""
+    stamp = _wallet_file_stamp(wallets_file, key_file)
+    with _open_wallet_db(wallets_file, key_file) as db:
+        db.add_wallets(new_wallets)
+    _update_cached_wallets(wallets_file, key_file, stamp, lambda data: data["wallets"].extend(dict(w) for w in new_wallets))
 
 def get_mnemonic(wallets_file="wallets.enc", key_file="encryption_key.txt"):
-    if os.path.exists(wallets_file) and os.path.exists(key_file):
+    if _wallet_store_exists(wallets_file, key_file):
         logging.info("Loading existing wallets")
-        with open(key_file, "rb") as f:
-            key = f.read()
-        cipher = Fernet(key)
-        with open(wallets_file, "rb") as f:
-            encrypted_data = f.read()
-        data = json.loads(cipher.decrypt(encrypted_data).decode())
+        data = _load_wallet_data(wallets_file, key_file)
         mnemonic = data["metadata"]["mnemonic"]
         return mnemonic
     else:
@@ -55,50 +255,45 @@ def get_mnemonic(wallets_file="wallets.enc", key_file="encryption_key.txt"):
         return None
 
 # Generate wallets with mnemonic and user data
-def generate_wallets(num_wallets=1, wallets_file="wallets.enc", key_file="encryption_key.txt", user_data=None):
+# workers > 1 derives keys on a process pool (for large onboarding batches), None/1 stays serial
+def generate_wallets(num_wallets=1, wallets_file="wallets.enc", key_file="encryption_key.txt", user_data=None, workers=None):
     logging.info("Generating wallets...")
+    started = time.time()
 
     if wallets_file == "masterWallets.enc":
         logging.info("Generating master wallets...")
-        if os.path.exists(wallets_file) and os.path.exists(key_file):
+        if _wallet_store_exists(wallets_file, key_file):
             logging.error("Master wallet already exists. Stopping override.")
             return False
 
-    # Check if wallets file and key file exist
-    if os.path.exists(wallets_file) and os.path.exists(key_file):
+    # Check if wallet store and key file exist
+    if _wallet_store_exists(wallets_file, key_file):
         logging.info("Loading existing wallets")
-        with open(key_file, "rb") as f:
-            key = f.read()
-        cipher = Fernet(key)
-        with open(wallets_file, "rb") as f:
-            encrypted_data = f.read()
-        data = json.loads(cipher.decrypt(encrypted_data).decode())
-        wallets = data["wallets"]
+        data = _load_wallet_data(wallets_file, key_file)
         mnemonic = data["metadata"]["mnemonic"]
-        highest_index = len(wallets) - 1
+        highest_index = max((w["index"] for w in data["wallets"]), default=-1)
         user_data = verifyUserData(user_data, highest_index+1, num_wallets)
         
         # Generate new wallets with incremented address_index
         logging.info(f"Appending {num_wallets} new wallets starting at address_index {highest_index + 1}")
-        Account.enable_unaudited_hdwallet_features()
         new_wallets = []
-        for i in range(num_wallets):
-            account = Account.from_mnemonic(mnemonic, account_path=f"m/44'/60'/0'/0/{highest_index + 1 + i}")
+        accounts = derive_accounts_parallel(mnemonic, highest_index + 1, num_wallets, workers=workers or 1)
+        for i, (address, private_key) in enumerate(accounts):
             new_wallets.append({
-                "address": account.address,
-                "private_key": account.key.hex(),
+                "address": address,
+                "private_key": private_key,
                 #"mnemonic": mnemonic,
                 "name": user_data[i]["name"],
                 "email": user_data[i]["email"],
                 "kraken_nickname": f"Wallet#{highest_index + 1 + i}",
-                "enabled": True
+                "enabled": True,
+                "index": highest_index + 1 + i
             })
-            logging.info(f"Generated new wallet with address_index {highest_index + 1 + i}: {account.address}")
+            logging.info(f"Generated new wallet with address_index {highest_index + 1 + i}: {address}")
         
-        # Append new wallets to existing list
-        wallets.extend(new_wallets)
-        save_wallets(wallets, mnemonic, wallets_file, key_file)
-
+        # Insert only the new rows
+        _add_wallets(new_wallets, wallets_file, key_file)
+        _log_generation_throughput(num_wallets, started)
         return True
     else:
         # Generate new wallets and mnemonic
@@ -108,35 +303,37 @@ def generate_wallets(num_wallets=1, wallets_file="wallets.enc", key_file="encryp
         wallets = []
         user_data = verifyUserData(user_data, 0, num_wallets)
         logging.info(f"Generated mnemonic: {mnemonic}")
-        for i in range(num_wallets):
-            account = Account.from_mnemonic(mnemonic, account_path=f"m/44'/60'/0'/0/{i}")
+        accounts = derive_accounts_parallel(mnemonic, 0, num_wallets, workers=workers or 1)
+        for i, (address, private_key) in enumerate(accounts):
             wallets.append({
-                "address": account.address,
-                "private_key": account.key.hex(),
+                "address": address,
+                "private_key": private_key,
                 #"mnemonic": mnemonic,
                 "name": user_data[i]["name"],
                 "email": user_data[i]["email"],
                 "kraken_nickname": f"Wallet#{i}",
-                "enabled": True
+                "enabled": True,
+                "index": i
             })
 
-            logging.info(f"Generated wallet with address_index {i}: {account.address}")
+            logging.info(f"Generated wallet with address_index {i}: {address}")
         
         save_wallets(wallets, mnemonic, wallets_file, key_file)
+        _log_generation_throughput(num_wallets, started)
         return True
 
+def _log_generation_throughput(num_wallets, started):
+    seconds = max(time.time() - started, 1e-9)
+    logging.info(f"Generated {num_wallets} wallets in {seconds:.2f}s ({num_wallets / seconds:.1f} wallets/s)")
+
 
 def get_wallets(wallets_file="wallets.enc", key_file="encryption_key.txt"):
-    if not os.path.exists(wallets_file) or not os.path.exists(key_file):
+    if not _wallet_store_exists(wallets_file, key_file):
         logging.error("Wallets file or key file does not exist")
         return []
-    with open(key_file, "rb") as f:
-        key = f.read()
-    cipher = Fernet(key)
-    with open(wallets_file, "rb") as f:
-        encrypted_data = f.read()
-    data = json.loads(cipher.decrypt(encrypted_data).decode())
-    wallets = data["wallets"]
+    data = _load_wallet_data(wallets_file, key_file)
+    # Copy each record so callers can mutate them without touching the cache
+    wallets = [dict(w) for w in data["wallets"]]
     logging.info(f"Loaded {len(wallets)} wallets from file")
     return wallets
 
@@ -152,39 +349,120 @@ def getUSDC(wallet_address, usdc_contract, web3):
         return 0.0
     
 def getUSDCContractAndWeb3():
-    # Load environment variables
-    load_dotenv()
-    INFURA_API_KEY = os.getenv('INFURA_API_KEY')
-    
-    # Ethereum mainnet configuration
-    MAINNET_RPC_URL = f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"
-    USDC_CONTRACT_ADDRESS = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"  # USDC on Ethereum mainnet
-    USDC_ABI = [
-        {
-            "constant": True,
-            "inputs": [{"name": "_owner", "type": "address"}],
-            "name": "balanceOf",
-            "outputs": [{"name": "balance", "type": "uint256"}],
-            "type": "function"
-        },
-        {
-            "constant": False,
-            "inputs": [{"name": "_to", "type": "address"}, {"name": "_value", "type": "uint256"}],
-            "name": "transfer",
-            "outputs": [{"name": "", "type": "bool"}],
-            "type": "function"
-        }
-    ]
-    
-    # Connect to Ethereum mainnet
-    web3 = Web3(Web3.HTTPProvider(MAINNET_RPC_URL))
-    usdc_contract = web3.eth.contract(address=USDC_CONTRACT_ADDRESS, abi=USDC_ABI)
-    
-    if not web3.is_connected():
-        logging.error("Failed to connect to Ethereum mainnet")
-        raise ConnectionError("Cannot connect to Ethereum mainnet")
-    
-    return usdc_contract, web3
+    # Shared provider and contract, the connection check is cached (see provider.py)
+    web3 = ensure_connected()
+    return get_usdc_contract(), web3
+
+# Multicall3 is deployed at the same address on mainnet and most other chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL_ATTEMPTS = 3  # Tries per chunk before the per-wallet fallback
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"}
+                ],
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"}
+                ],
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"name": "addr", "type": "address"}],
+        "name": "getEthBalance",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+def _get_balances_per_wallet(addresses, usdc_contract, web3, block_number):
+    """Fallback for get_balances_batch: two RPCs per wallet, still pinned to block_number."""
+    balances = {}
+    for address in addresses:
+        try:
+            usdc_raw = usdc_contract.functions.balanceOf(address).call(block_identifier=block_number)
+            eth_wei = web3.eth.get_balance(address, block_identifier=block_number)
+            balances[address] = (usdc_raw, eth_wei)
+        except Exception as e:
+            logging.error(f"Error getting balances for {address}: {str(e)}")
+    return balances
+
+def get_balances_batch(addresses, usdc_contract, web3, chunk_size=250, block_number=None):
+    """Get raw USDC and ETH balances for many addresses through Multicall3.
+
+    Every chunk of chunk_size wallets is a single eth_call, and all chunks are pinned to the
+    same block so the snapshot is consistent. A chunk that keeps failing falls back to
+    per-wallet calls (e.g. Multicall3 unavailable). Returns (block_number, {checksum_address: (usdc_raw, eth_wei)}).
+    """
+    addresses = [web3.to_checksum_address(a) for a in addresses]
+    if block_number is None:
+        block_number = web3.eth.block_number
+    if not addresses:
+        return block_number, {}
+
+    multicall = web3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+    balances = {}
+    for start in range(0, len(addresses), chunk_size):
+        chunk = addresses[start:start + chunk_size]
+        calls = []
+        for address in chunk:
+            calls.append((usdc_contract.address, True, usdc_contract.encode_abi("balanceOf", args=[address])))
+            calls.append((MULTICALL3_ADDRESS, True, multicall.encode_abi("getEthBalance", args=[address])))
+        # Retry a failed chunk before giving up on it, a transient RPC error should not turn
+        # into two calls per wallet
+        for attempt in range(MULTICALL_ATTEMPTS):
+            try:
+                results = multicall.functions.aggregate3(calls).call(block_identifier=block_number)
+                break
+            except Exception as e:
+                error = e
+        else:
+            logging.warning(f"Multicall balance batch failed ({str(error)}), falling back to per-wallet calls for {len(chunk)} wallets")
+            balances.update(_get_balances_per_wallet(chunk, usdc_contract, web3, block_number))
+            continue
+        for i, address in enumerate(chunk):
+            (usdc_ok, usdc_data), (eth_ok, eth_data) = results[2 * i], results[2 * i + 1]
+            if not usdc_ok or not eth_ok:
+                logging.error(f"Multicall balance lookup failed for {address}")
+                continue
+            balances[address] = (int.from_bytes(usdc_data, "big"), int.from_bytes(eth_data, "big"))
+
+    logging.info(f"Loaded balances for {len(balances)}/{len(addresses)} wallets at block {block_number}")
+    return block_number, balances
+
+def format_wallet_balances(wallets, balances, web3):
+    """Rows for the balances table from a get_balances_batch result.
+
+    Wallets missing from balances (their read failed) get None for USDC and ETH instead of 0.
+    """
+    rows = []
+    for wallet in wallets:
+        entry = balances.get(web3.to_checksum_address(wallet["address"]))
+        usdc_raw, eth_wei = entry if entry is not None else (None, None)
+        rows.append({
+            "name": wallet["name"],
+            "USDC": usdc_raw / 10**6 if usdc_raw is not None else None,
+            "ETH": web3.from_wei(eth_wei, 'ether') if eth_wei is not None else None,
+            "Address": wallet["address"],
+        })
+    return rows
 
 def jsonify_walletBalances(wallets_file="wallets.enc", key_file="encryption_key.txt", wallets=None):
     if not wallets:
@@ -192,32 +470,61 @@ def jsonify_walletBalances(wallets_file="wallets.enc", key_file="encryption_key.
         return {"wallets": []}
     
     usdc_contract, web3 = getUSDCContractAndWeb3()
-    
-    message = {"wallets": []}
-    for wallet in wallets:
-        message["wallets"].append({
-            "name": wallet["name"],
-            "USDC": getUSDC(wallet["address"], usdc_contract, web3),
-            "ETH": web3.from_wei(web3.eth.get_balance(wallet["address"]), 'ether'),
-            "Address": wallet["address"],
-        })
-    return message
+    block_number, balances = get_balances_batch([wallet["address"] for wallet in wallets], usdc_contract, web3)
+    return {"wallets": format_wallet_balances(wallets, balances, web3), "block": block_number}
     
 
-def search_wallets(wallet_name, wallet_email, wallets_file="wallets.enc", key_file="encryption_key.txt"):
-    wallets = get_wallets(wallets_file, key_file)
-    results = []
-    for wallet in wallets:
-        if (wallet_name and wallet["name"] == wallet_name) or (wallet_email and wallet["email"] == wallet_email):
-            results.append(wallet)
+def find_wallets(name=None, email=None, address=None, index=None, match="exact", enabled=None, limit=None, wallets_file="wallets.enc", key_file="encryption_key.txt"):
+    """Indexed wallet lookup by name, email, address or HD index (see WalletDB.find_wallets).
+
+    Only the matching rows are read and decrypted, the full wallet list is never loaded.
+    """
+    if not _wallet_store_exists(wallets_file, key_file):
+        logging.error("Wallets file or key file does not exist")
+        return []
+    with _open_wallet_db(wallets_file, key_file) as db:
+        return db.find_wallets(name=name, email=email, address=address, index=index, match=match, enabled=enabled, limit=limit)
+
+def search_wallets(wallet_name, wallet_email, wallets_file="wallets.enc", key_file="encryption_key.txt", match="exact"):
+    results = find_wallets(name=wallet_name, email=wallet_email, match=match, wallets_file=wallets_file, key_file=key_file)
     if results:
         logging.info(f"Found {len(results)} wallets matching search criteria")
     else:
         logging.info("No wallets found matching search criteria")
     return results
 
-def transfer_usdc_if_above_one(wallet_address, private_key):
-    """Transfer USDC to Kraken wallet if balance > $1 and enough ETH for gas."""
+class _SendError(Exception):
+    def __init__(self, error, nonce):
+        super().__init__(str(error))
+        self.error = error
+        self.nonce = nonce  # Nonce held when the send failed, for the caller to release
+
+def _send_with_fresh_nonce(web3, address, nonce, tx, private_key):
+    """Sign tx with nonce and broadcast it. Returns (tx_hash, nonce).
+
+    If the node says the nonce is used (another process sent with it), resync the nonce
+    manager with the node's pending count and send again with a fresh nonce. An "already
+    known" answer means this exact transaction is in the mempool, which counts as sent.
+    Raises _SendError with the nonce still held on any other failure.
+    """
+    for attempt in range(NONCE_RESYNC_ATTEMPTS):
+        signed_tx = web3.eth.account.sign_transaction(dict(tx, nonce=nonce), private_key)
+        try:
+            return web3.eth.send_raw_transaction(signed_tx.raw_transaction), nonce
+        except Exception as e:
+            if is_known_transaction_error(e):
+                return signed_tx.hash, nonce
+            if not is_stale_nonce_error(e) or attempt == NONCE_RESYNC_ATTEMPTS - 1:
+                raise _SendError(e, nonce)
+            logging.warning(f"Nonce {nonce} for {address} is already used ({str(e)}), resyncing with the node")
+            nonce = get_nonce_manager().resync(address)
+
+def transfer_usdc_if_above_one(wallet_address, private_key, wait=True):
+    """Transfer USDC to Kraken wallet if balance > $1 and enough ETH for gas.
+
+    With wait=False the function returns once the transaction is broadcast; its nonce and
+    worst case gas cost stay reserved in the nonce manager so more transactions can follow.
+    """
     # Load environment variables
     load_dotenv()
     KRAKEN_ADDRESS = os.getenv('KRAKEN_ADDRESS')
@@ -227,6 +534,9 @@ def transfer_usdc_if_above_one(wallet_address, private_key):
         return False
     
     usdc_contract, web3 = getUSDCContractAndWeb3()  # Need to send USDC
+    nonce_manager = get_nonce_manager()
+    nonce = None
+    sent = False
 
     try:
         # Convert addresses to checksum format
@@ -242,19 +552,21 @@ def transfer_usdc_if_above_one(wallet_address, private_key):
             logging.info(f"USDC balance ({usdc_balance_decimal}) is less than $1, skipping transfer")
             return True
 
-        # Estimate gas for USDC transfer
+        # Estimate gas for USDC transfer, fees from the shared per-block oracle
+        fees = get_fee_oracle().suggest()
+        nonce = nonce_manager.next_nonce(address)
         usdc_transfer_tx = usdc_contract.functions.transfer(
             kraken_address,
             usdc_balance
         ).build_transaction({
             'from': address,
-            'nonce': web3.eth.get_transaction_count(address),
-            'gasPrice': web3.eth.gas_price
+            'nonce': nonce,
+            'maxFeePerGas': fees['maxFeePerGas'],
+            'maxPriorityFeePerGas': fees['maxPriorityFeePerGas']
         })
         gas_estimate = web3.eth.estimate_gas(usdc_transfer_tx)
         gas_estimate_buffered = int(gas_estimate * 1.15)  # Increase gas estimate by 15%
-        gas_price = web3.eth.gas_price  # Current gas price in wei
-        gas_cost_wei = gas_estimate_buffered * gas_price  # Use buffered gas for cost
+        gas_cost_wei = gas_estimate_buffered * fees['maxFeePerGas']  # Worst case cost with buffered gas
         gas_cost_eth = web3.from_wei(gas_cost_wei, 'ether')
 
         # Get ETH balance
@@ -262,36 +574,37 @@ def transfer_usdc_if_above_one(wallet_address, private_key):
         eth_balance_decimal = web3.from_wei(eth_balance, 'ether')
 
         # Check if enough ETH for gas with buffer
-        if eth_balance < gas_cost_wei:
+        if eth_balance - nonce_manager.pending_cost(address) < gas_cost_wei:
             logging.error(f"Insufficient ETH for gas: {eth_balance_decimal} ETH available, {gas_cost_eth} ETH needed (with 15% buffer)")
+            nonce_manager.release(address, nonce)
             return False
 
         # Build and sign USDC transfer transaction with buffered gas
         usdc_transfer_tx['gas'] = gas_estimate_buffered  # Use buffered gas for transaction
-        signed_tx = web3.eth.account.sign_transaction(usdc_transfer_tx, private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        tx_hash, nonce = _send_with_fresh_nonce(web3, address, nonce, usdc_transfer_tx, private_key)
+        sent = True
+        nonce_manager.record(address, nonce, gas_cost_wei)
         logging.info(f"USDC transfer sent: {tx_hash.hex()}")
 
         # Wait for transaction confirmation
-        web3.eth.wait_for_transaction_receipt(tx_hash)
+        if wait:
+            web3.eth.wait_for_transaction_receipt(tx_hash)
+            nonce_manager.confirm(address, nonce)
         return True
 
     except Exception as e:
         logging.error(f"Error during USDC transfer: {e}")
+        if isinstance(e, _SendError):
+            nonce_manager.release(address, e.nonce)
+        elif nonce is not None and not sent:
+            nonce_manager.release(address, nonce)
         return False
     
 
 def transfer_eth_to_enabled_wallet(wallet, wallets, min_transfer_eth=0.001):
     try:
-        # Load environment variables
-        load_dotenv()
-        INFURA_API_KEY = os.getenv("INFURA_API_KEY")
-
-        # Initialize Web3
-        infura_url = f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"
-        web3 = Web3(Web3.HTTPProvider(infura_url))
-        if not web3.is_connected():
-            raise ConnectionError("Failed to connect to Infura")
+        # Shared Web3 instance
+        web3 = ensure_connected()
 
         # Validate and convert source wallet address to checksum format
         source_address = web3.to_checksum_address(wallet["address"])
@@ -315,21 +628,22 @@ def transfer_eth_to_enabled_wallet(wallet, wallets, min_transfer_eth=0.001):
 
         logging.info(f"Transferring ETH from {source_address} to {destination_address}")
 
-        # Get ETH balance
-        eth_balance = web3.eth.get_balance(source_address)
+        # Get ETH balance, minus what this wallet's in-flight transactions (e.g. the USDC sweep) may still spend
+        nonce_manager = get_nonce_manager()
+        reserved_wei = nonce_manager.pending_cost(source_address)
+        eth_balance = max(web3.eth.get_balance(source_address) - reserved_wei, 0)
         balance_eth = web3.from_wei(eth_balance, "ether")
-        logging.info(f"Source wallet balance: {eth_balance} wei ({balance_eth:.6f} ETH)")
+        logging.info(f"Source wallet balance: {eth_balance} wei ({balance_eth:.6f} ETH) after {reserved_wei} wei reserved for in-flight transactions")
 
         if eth_balance == 0:
             logging.info(f"No ETH to transfer from {source_address}")
             return True
 
-        # Get gas price (EIP-1559 compatible)
-        latest_block = web3.eth.get_block("latest")
-        base_fee = latest_block.get("baseFeePerGas", web3.eth.gas_price)
-        max_priority_fee = web3.eth.max_priority_fee or web3.to_wei(2, "gwei")
-        gas_price = base_fee + max_priority_fee
-        logging.info(f"Gas price: {web3.from_wei(gas_price, 'gwei'):.2f} Gwei (base: {web3.from_wei(base_fee, 'gwei'):.2f}, priority: {web3.from_wei(max_priority_fee, 'gwei'):.2f})")
+        # Get gas price (EIP-1559, shared per-block oracle)
+        fees = get_fee_oracle().suggest()
+        gas_price = fees["maxFeePerGas"]
+        max_priority_fee = fees["maxPriorityFeePerGas"]
+        logging.info(f"Gas price: {web3.from_wei(gas_price, 'gwei'):.2f} Gwei (base: {web3.from_wei(get_fee_oracle().base_fee(), 'gwei'):.2f}, priority: {web3.from_wei(max_priority_fee, 'gwei'):.2f})")
 
         # Estimate gas (use 21000 for standard ETH transfer, fallback to estimate_gas)
         gas_limit = 21000
@@ -370,15 +684,17 @@ def transfer_eth_to_enabled_wallet(wallet, wallets, min_transfer_eth=0.001):
             "gas": gas_limit,
             "maxFeePerGas": gas_price,
             "maxPriorityFeePerGas": max_priority_fee,
-            "nonce": web3.eth.get_transaction_count(source_address),
+            "nonce": nonce_manager.next_nonce(source_address),
             "chainId": web3.eth.chain_id,
         }
 
-        # Sign the transaction
-        signed_tx = web3.eth.account.sign_transaction(tx, private_key)
-
-        # Send the transaction
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        # Sign and send the transaction
+        try:
+            tx_hash, tx["nonce"] = _send_with_fresh_nonce(web3, source_address, tx["nonce"], tx, private_key)
+        except _SendError as e:
+            nonce_manager.release(source_address, e.nonce)
+            raise e.error
+        nonce_manager.record(source_address, tx["nonce"], transfer_value + gas_cost_wei)
         logging.info(f"ETH transfer sent: {tx_hash.hex()}, transferring {web3.from_wei(transfer_value, 'ether'):.6f} ETH with gas price {web3.from_wei(gas_price, 'gwei'):.2f} Gwei")
 
         return True
@@ -389,44 +705,41 @@ def transfer_eth_to_enabled_wallet(wallet, wallets, min_transfer_eth=0.001):
         
 
 def disable_wallet(wallet_email, wallet_name, wallets_file="wallets.enc", key_file="encryption_key.txt"):
-    wallets = get_wallets(wallets_file, key_file)
-    mnemonic = get_mnemonic(wallets_file, key_file)
-    for wallet in wallets:
-        if (wallet["email"] == wallet_email or wallet["name"] == wallet_name) and wallet.get("enabled", True):
+    matches = find_wallets(name=wallet_name, email=wallet_email, enabled=True, limit=1, wallets_file=wallets_file, key_file=key_file)
+    for wallet in matches:
 
-            if transfer_usdc_if_above_one(wallet["address"], wallet["private_key"]):
-                logging.info(f"Transferred USDC from {wallet['address']} to master wallet before disabling")
+        # Don't wait for the USDC transfer, the ETH transfer goes out right behind it on the next nonce
+        if transfer_usdc_if_above_one(wallet["address"], wallet["private_key"], wait=False):
+            logging.info(f"Transferred USDC from {wallet['address']} to master wallet before disabling")
 
-            if transfer_eth_to_enabled_wallet(wallet, wallets, min_transfer_eth=0.001):
-                logging.info(f"Transferred ETH from {wallet['address']} to other wallet before disabling")
-            
-            wallet["enabled"] = False
-            logging.info(f"Disabled wallet for email: {wallet_email}")
+        # Only need one enabled wallet other than this one as the ETH destination
+        destinations = find_wallets(enabled=True, limit=2, wallets_file=wallets_file, key_file=key_file)
+        if transfer_eth_to_enabled_wallet(wallet, destinations, min_transfer_eth=0.001):
+            logging.info(f"Transferred ETH from {wallet['address']} to other wallet before disabling")
 
-            save_wallets(wallets, mnemonic, wallets_file, key_file)
-            if wallet["name"] == wallet_name:
-                logging.info(f"Disabled wallet for name: {wallet_name}")
-            elif wallet["email"] == wallet_email:
-                logging.info(f"Disabled wallet for email: {wallet_email}")
-            return True
+        _set_wallet_enabled(wallet, False, wallets_file, key_file)
+        logging.info(f"Disabled wallet for email: {wallet_email}")
+
+        if wallet["name"] == wallet_name:
+            logging.info(f"Disabled wallet for name: {wallet_name}")
+        elif wallet["email"] == wallet_email:
+            logging.info(f"Disabled wallet for email: {wallet_email}")
+        return True
     logging.info(f"No valid matching wallet found for email: {wallet_email} or name: {wallet_name}")
     return False #Couldn't find wallet
 
 #COPY PASTA FROM DISABLE IMPLEMENTATION THE SAME
 def enable_wallet(wallet_email, wallet_name, wallets_file="wallets.enc", key_file="encryption_key.txt"):
-    wallets = get_wallets(wallets_file, key_file)
-    mnemonic = get_mnemonic(wallets_file, key_file)
-    for wallet in wallets:
-        if (wallet["email"] == wallet_email or wallet["name"] == wallet_name) and not wallet.get("enabled", True):
-            
-            wallet["enabled"] = True
-
-            save_wallets(wallets, mnemonic, wallets_file, key_file)
-            if wallet["name"] == wallet_name:
-                logging.info(f"Enabled wallet for name: {wallet_name}")
-            elif wallet["email"] == wallet_email:
-                logging.info(f"Enabled wallet for email: {wallet_email}")
-            return True
+    matches = find_wallets(name=wallet_name, email=wallet_email, enabled=False, limit=1, wallets_file=wallets_file, key_file=key_file)
+    for wallet in matches:
+
+        _set_wallet_enabled(wallet, True, wallets_file, key_file)
+
+        if wallet["name"] == wallet_name:
+            logging.info(f"Enabled wallet for name: {wallet_name}")
+        elif wallet["email"] == wallet_email:
+            logging.info(f"Enabled wallet for email: {wallet_email}")
+        return True
     logging.info(f"No valid matching wallet found for email: {wallet_email} or name: {wallet_name}")
     return False #Couldn't find wallet
 
@@ -460,11 +773,12 @@ def cancel_pending_transaction(address, private_key, web3):
             'chainId': web3.eth.chain_id
         }
 
-        # Get current gas price and increase it by 20% to ensure replacement
-        current_gas_price = web3.eth.gas_price
-        new_gas_price = int(current_gas_price * 1.2)  # 20% higher gas price
+        # Take current fees from the shared oracle and increase them by 20% to ensure replacement
+        fees = get_fee_oracle().suggest(multiplier=1.2)
+        new_gas_price = fees['maxFeePerGas']
 
-        tx['gasPrice'] = new_gas_price
+        tx['maxFeePerGas'] = new_gas_price
+        tx['maxPriorityFeePerGas'] = fees['maxPriorityFeePerGas']
 
         # Estimate gas (should be 21000 for a simple transfer, but confirm)
         estimated_gas = web3.eth.estimate_gas(tx)
@@ -479,6 +793,9 @@ def cancel_pending_transaction(address, private_key, web3):
         # Calculate total cost in ETH
         total_gas_cost_eth = web3.from_wei(estimated_gas * new_gas_price, 'ether')
 
+        # The replacement changes what is in flight for this address, resync on next use
+        get_nonce_manager().reset(address)
+
         logging.info(f"Cancel transaction sent. Transaction hash: {tx_hash.hex()}")
         logging.info(f"Nonce used: {nonce}")
         logging.info(f"Estimated gas: {estimated_gas}")
@@ -490,6 +807,11 @@ def cancel_pending_transaction(address, private_key, web3):
         return False
 
 
+LOG_CHUNK_SIZE = 64 * 1024  # Bytes read per block when tailing logs
+# Cron, the dashboard job runner and the planner daemon append to the same log, so timestamps
+# can be slightly out of order. A since filter stops reading only past this margin.
+LOG_ORDER_MARGIN = datetime.timedelta(minutes=5)
+
 class CustomFileReader:
     def __init__(self, file_path, mode='rb', encoding='utf-8'):
         self.file_path = file_path
@@ -517,35 +839,88 @@ class CustomFileReader:
     def readlines(self):
         return self.file.readlines()
     
-    def read_last_n_lines(self, n):
-        # If n is more than number of lines total, it will return all lines
-        if self.file:
-            # Go to end of file
-            self.file.seek(0, 2)
-            # Get position
-            pos = self.file.tell()
-            # Initialize num lines, result lines
-            num_lines = 0
-            result_lines = []
-            while pos > 0: # While not at beginning of file (prevent going backwards too far)
-                # Move position of file pointer backwards and read 1 byte. Compare is newline
-                pos -= 1
-                self.file.seek(pos)
-                if self.file.read(1) == b'\n':
-                    num_lines += 1
-                    if num_lines == n: # If we reached our goal of going back n lines, return the lines decoded. File must be opened in binary mode
-                        for line in self.readlines():
-                                result_lines.append(line.decode())
-                        return result_lines
-            # If less than n lines in file, return all lines
-            for line in self.readlines():
-                result_lines.append(line.decode())
-            return result_lines  # Return all lines if less than n lines in file
-        else:
+    def iter_lines_reverse(self, chunk_size=LOG_CHUNK_SIZE):
+        """Yield the file's lines as bytes (newline stripped), last line first.
+
+        Reads fixed-size blocks backwards from the end instead of one byte per seek. Lines are
+        split on b"\n" before decoding, and that byte never occurs inside a multibyte UTF-8
+        sequence, so characters cut in half at a block boundary are joined back together.
+        File must be opened in binary mode.
+        """
+        self.file.seek(0, 2)
+        pos = self.file.tell()
+        remainder = b""
+        at_end = True
+        while pos > 0:
+            read_size = min(chunk_size, pos)
+            pos -= read_size
+            self.file.seek(pos)
+            lines = (self.file.read(read_size) + remainder).split(b"\n")
+            remainder = lines.pop(0)  # Possibly the tail of a line that starts in the previous block
+            if at_end and lines and lines[-1] == b"":
+                lines.pop()  # File ends with a newline
+            at_end = False
+            for line in reversed(lines):
+                yield line
+        if not at_end:
+            yield remainder  # First line of the file, empty if the file starts with a newline
+
+    def read_last_n_lines(self, n, level=None, address=None, since=None, until=None, chunk_size=LOG_CHUNK_SIZE):
+        """Return the last n lines (oldest first), optionally only those matching the filters.
+
+        level is a level name or list of names, address matches case-insensitively anywhere in
+        the line, since/until are datetimes compared against the line's asctime prefix.
+        If fewer lines match, all matching lines are returned.
+        """
+        if not self.file:
             return None
-def read_last_n_lines(num_lines: int, file_name="usdc_transfer.log"):
+        if n <= 0:
+            return []
+        result_lines = []
+        for raw_line in self.iter_lines_reverse(chunk_size):
+            line = raw_line.decode(self.encoding, errors="replace")
+            if since is not None:
+                line_time = parse_log_time(line)
+                if line_time is not None and line_time < since - LOG_ORDER_MARGIN:
+                    break  # Everything further back is older, even allowing for interleaved writers
+            if not log_line_matches(line, level, address, since, until):
+                continue
+            result_lines.append(line + "\n")
+            if len(result_lines) >= n:
+                break
+        result_lines.reverse()
+        return result_lines
+
+LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S,%f"  # logging's default asctime
+
+def parse_log_time(line):
+    """Datetime from the asctime prefix of a log line, None for lines without one (tracebacks)."""
+    try:
+        return datetime.datetime.strptime(line[:23], LOG_TIME_FORMAT)
+    except ValueError:
+        return None
+
+def log_line_matches(line, level=None, address=None, since=None, until=None):
+    """Filter for lines in the '%(asctime)s - %(levelname)s - %(message)s' format."""
+    if level:
+        levels = [level] if isinstance(level, str) else level
+        if not any(f" - {lvl.upper()} - " in line for lvl in levels):
+            return False
+    if address and address.lower() not in line.lower():
+        return False
+    if since is not None or until is not None:
+        line_time = parse_log_time(line)
+        if line_time is None:
+            return False
+        if since is not None and line_time < since:
+            return False
+        if until is not None and line_time > until:
+            return False
+    return True
+
+def read_last_n_lines(num_lines: int, file_name="usdc_transfer.log", **filters):
     with CustomFileReader(file_name, "rb") as f:
-        return f.read_last_n_lines(num_lines)
+        return f.read_last_n_lines(num_lines, **filters)
 
 # Schedule transfers
 def main():
@@ -0,0 +1,187 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for long operations started from the UI (sweeps, gas refills). Each job gets
+# an id, progress counters and a cancel flag; the status can be polled by any number of
+# clients without changing it. Only one job per lock key (e.g. "sweep") runs at a time.
+
+MAX_WORKERS = 2  # Jobs running at once, across all kinds
+MAX_HISTORY = 50  # Finished jobs kept for status lookups
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class JobConflict(Exception):
+    """A job with the same lock key is already queued or running."""
+    def __init__(self, job):
+        super().__init__(f"{job.kind} job {job.id} is already {job.status}")
+        self.job = job
+
+
+class Job:
+    def __init__(self, kind, lock_key):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.lock_key = lock_key
+        self.status = QUEUED
+        self.message = ""
+        self.error = None
+        self.total = None
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    # Progress hooks used by the job functions
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+
+    def advance(self, outcome):
+        """Count one processed item. outcome is "succeeded", "failed" or "skipped"."""
+        with self._lock:
+            self.processed += 1
+            if outcome == "succeeded":
+                self.succeeded += 1
+            elif outcome == "failed":
+                self.failed += 1
+            else:
+                self.skipped += 1
+
+    def set_message(self, message):
+        with self._lock:
+            self.message = message
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def to_dict(self):
+        with self._lock:
+            now = self.finished_at or time.time()
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "message": self.message,
+                "error": self.error,
+                "total": self.total,
+                "processed": self.processed,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "cancel_requested": self.cancelled(),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "seconds": round(now - self.started_at, 2) if self.started_at else 0,
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers=MAX_WORKERS, max_history=MAX_HISTORY):
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}  # id -> Job, in submission order
+        self._active = {}  # lock_key -> Job
+
+    def submit(self, kind, func, *args, lock_key=None, **kwargs):
+        """Queue func(job, *args, **kwargs) and return the Job.
+
+        Raises JobConflict if a job with the same lock key (default: kind) is still active.
+        A job whose function returns False ends as failed, one that raises as failed with
+        the error recorded.
+        """
+        lock_key = lock_key or kind
+        with self._lock:
+            active = self._active.get(lock_key)
+            if active is not None:
+                raise JobConflict(active)
+            job = Job(kind, lock_key)
+            self._jobs[job.id] = job
+            self._active[lock_key] = job
+            self._prune()
+        logging.info(f"Queued {kind} job {job.id}")
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        with job._lock:
+            job.status = RUNNING
+            job.started_at = time.time()
+        logging.info(f"Started {job.kind} job {job.id}")
+        try:
+            if job.cancelled():
+                status = CANCELLED
+            else:
+                result = func(job, *args, **kwargs)
+                if job.cancelled():
+                    status = CANCELLED
+                else:
+                    status = FAILED if result is False else SUCCEEDED
+        except Exception as e:
+            logging.error(f"{job.kind} job {job.id} crashed: {str(e)}")
+            job.error = str(e)
+            status = FAILED
+        with job._lock:
+            job.status = status
+            job.finished_at = time.time()
+        with self._lock:
+            if self._active.get(job.lock_key) is job:
+                del self._active[job.lock_key]
+        logging.info(f"{job.kind} job {job.id} {status} after {job.finished_at - job.started_at:.2f}s: "
+                     f"{job.processed} processed, {job.succeeded} succeeded, {job.failed} failed, {job.skipped} skipped")
+
+    def _prune(self):
+        # Drop the oldest finished jobs beyond max_history
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, kind=None):
+        """Jobs newest first, optionally only one kind."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in reversed(jobs) if kind is None or job.kind == kind]
+
+    def cancel(self, job_id):
+        """Ask a job to stop. Returns the Job, or None if unknown. Finished jobs are unaffected."""
+        job = self.get(job_id)
+        if job is not None and job.status in ACTIVE_STATES:
+            job.cancel()
+            logging.info(f"Cancellation requested for {job.kind} job {job.id}")
+        return job
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """Return the process-wide JobManager."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
@@ -0,0 +1,240 @@
+import os
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+import krakenex
+from dotenv import load_dotenv
+from metrics import KRAKEN_CALLS, KRAKEN_LATENCY
+
+# Kraken private API client that models Kraken's call-rate limit instead of sleeping a fixed
+# time between calls. Kraken keeps an API counter per key: every call adds its cost, the
+# counter decays at a tier-dependent rate, and calls past the tier maximum fail with
+# "EAPI:Rate limit exceeded". A token bucket with the same capacity and refill rate lets us
+# send as fast as the limit allows, and rate limit errors are retried with backoff.
+
+# Tier -> (max counter, decay per second), from Kraken's REST rate limit documentation
+KRAKEN_TIERS = {
+    "starter": (15, 0.33),
+    "intermediate": (20, 0.5),
+    "pro": (20, 1.0),
+}
+KRAKEN_TIER = os.getenv("KRAKEN_TIER", "starter")
+# Counter cost per private method, everything else costs 1
+CALL_COSTS = {"Ledgers": 2, "QueryLedgers": 2, "TradesHistory": 2, "QueryTrades": 2}
+RATE_LIMIT_ERRORS = ("EAPI:Rate limit exceeded", "EGeneral:Temporary lockout")
+MAX_RETRIES = 5
+BACKOFF_BASE = 2  # Seconds, doubled on each rate limited retry
+
+
+class TokenBucket:
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost=1):
+        """Block until cost tokens are available and take them. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return waited
+                wait = (cost - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def drain(self):
+        """The server says we are over the limit, so assume the counter is full."""
+        with self._lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class KrakenClient:
+    def __init__(self, api=None, tier=KRAKEN_TIER, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+        if api is None:
+            load_dotenv()
+            api = krakenex.API(key=os.getenv('KRAKEN_API_KEY'), secret=os.getenv('KRAKEN_API_SECRET'))
+        self.api = api
+        capacity, rate = KRAKEN_TIERS[tier]
+        self.bucket = TokenBucket(capacity, rate)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.stats = {"calls": 0, "rate_limited": 0, "retries": 0, "waited": 0.0}
+        self._lock = threading.Lock()  # Kraken nonces must increase, so private calls go one at a time
+
+    def query_private(self, method, data=None):
+        """Rate limited query_private with the krakenex response format ({"error": [...], "result": ...}).
+
+        Rate limit errors are retried with exponential backoff, other errors are returned as is.
+        Network errors are raised after max_retries attempts, or right away for Withdraw.
+        """
+        cost = CALL_COSTS.get(method, 1)
+        for attempt in range(self.max_retries):
+            waited = self.bucket.acquire(cost)
+            with self._lock:
+                self.stats["calls"] += 1
+                self.stats["waited"] += waited
+                started = time.perf_counter()
+                try:
+                    response = self.api.query_private(method, data or {})
+                except Exception as e:
+                    KRAKEN_LATENCY.observe(time.perf_counter() - started, method=method)
+                    KRAKEN_CALLS.inc(method=method, result="exception")
+                    # A Withdraw that timed out may still have gone through, never resend it blindly
+                    if method == "Withdraw" or attempt == self.max_retries - 1:
+                        raise
+                    logging.warning(f"Kraken {method} failed ({str(e)}), retrying")
+                    self.stats["retries"] += 1
+                    time.sleep(self.backoff_base * 2 ** attempt)
+                    continue
+                KRAKEN_LATENCY.observe(time.perf_counter() - started, method=method)
+            errors = response.get("error") or []
+            rate_limited = any(err.startswith(RATE_LIMIT_ERRORS) for err in errors)
+            KRAKEN_CALLS.inc(method=method, result="rate_limited" if rate_limited else "error" if errors else "ok")
+            if not rate_limited:
+                return response
+            self.stats["rate_limited"] += 1
+            self.bucket.drain()
+            if attempt == self.max_retries - 1:
+                return response
+            self.stats["retries"] += 1
+            wait = self.backoff_base * 2 ** attempt
+            logging.warning(f"Kraken {method} rate limited ({errors}), retry {attempt + 1}/{self.max_retries - 1} in {wait}s")
+            time.sleep(wait)
+        return response
+
+
+class WithdrawalScheduler:
+    """Priority queue of ETH withdrawals sent through a rate limited KrakenClient.
+
+    Lower priority values go first (e.g. the wallet's ETH balance in USD, so the emptiest
+    wallets are refilled before the rate limit budget is spent on the others).
+    """
+    def __init__(self, client):
+        self.client = client
+        self._queue = []
+        self._counter = itertools.count()  # Keeps equal priorities in submission order
+
+    def submit(self, address, key, amount, priority=0.0, asset="ETH", context=None):
+        heapq.heappush(self._queue, (priority, next(self._counter), {
+            "asset": asset,
+            "key": str(key),
+            "amount": amount,
+            "address": str(address).lower(),
+            "context": context,
+        }))
+
+    def __len__(self):
+        return len(self._queue)
+
+    def run(self, on_result=None, cancelled=None):
+        """Send queued withdrawals in priority order and return a throughput report.
+
+        on_result(withdrawal, response_or_None) is called after each one. cancelled, if
+        given, is checked before every withdrawal and stops the run when it returns True.
+        """
+        report = {"withdrawals": 0, "succeeded": 0, "failed": 0, "refids": []}
+        calls_before = dict(self.client.stats)
+        started = time.time()
+        while self._queue:
+            if cancelled and cancelled():
+                logging.info(f"Withdrawal run cancelled with {len(self._queue)} withdrawals left")
+                break
+            _, _, withdrawal = heapq.heappop(self._queue)
+            report["withdrawals"] += 1
+            try:
+                response = self.client.query_private('Withdraw', {
+                    'asset': withdrawal["asset"],
+                    'key': withdrawal["key"],
+                    'amount': str(withdrawal["amount"]),
+                    'address': withdrawal["address"],
+                })
+            except Exception as e:
+                logging.error(f"Error sending {withdrawal['asset']} to {withdrawal['address']}: {str(e)}")
+                response = None
+            if response is None or response.get("error"):
+                report["failed"] += 1
+                if response is not None:
+                    logging.error(f"Kraken API error for {withdrawal['address']}: {response['error']}")
+            else:
+                report["succeeded"] += 1
+                refid = response.get('result', {}).get('refid', 'N/A')
+                report["refids"].append(refid)
+                logging.info(f"Initiated withdrawal of {float(withdrawal['amount']):.6f} {withdrawal['asset']} to {withdrawal['address']}, Ref ID: {refid}")
+            if on_result:
+                on_result(withdrawal, response)
+
+        seconds = time.time() - started
+        report["seconds"] = round(seconds, 2)
+        report["per_minute"] = round(report["withdrawals"] / seconds * 60, 1) if seconds > 0 else None
+        report["rate_limited"] = self.client.stats["rate_limited"] - calls_before["rate_limited"]
+        report["waited"] = round(self.client.stats["waited"] - calls_before["waited"], 2)
+        logging.info(f"Kraken withdrawals: {report['succeeded']}/{report['withdrawals']} succeeded in {report['seconds']}s "
+                     f"({report['per_minute']}/min), {report['rate_limited']} rate limited, {report['waited']}s waiting on the limit")
+        return report
+
+
+class FakeKrakenAPI:
+    """Local stand-in for krakenex.API with Kraken's API counter and error format.
+
+    Withdrawals are recorded in self.withdrawals instead of being sent. latency is added to
+    every call, fail_rate makes that fraction of withdrawals fail with an EFunding error.
+    """
+    def __init__(self, tier=KRAKEN_TIER, latency=0.0, fail_rate=0.0, seed=None):
+        self.max_counter, self.decay = KRAKEN_TIERS[tier]
+        self.counter = 0.0
+        self.updated = time.monotonic()
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.withdrawals = []
+        self.calls = 0
+        self._refids = itertools.count(1)
+
+    def query_private(self, method, data=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        now = time.monotonic()
+        self.counter = max(0.0, self.counter - (now - self.updated) * self.decay)
+        self.updated = now
+        cost = CALL_COSTS.get(method, 1)
+        if self.counter + cost > self.max_counter:
+            return {"error": ["EAPI:Rate limit exceeded"]}
+        self.counter += cost
+        if method == "Withdraw":
+            if self.random.random() < self.fail_rate:
+                return {"error": ["EFunding:Unknown withdraw key"]}
+            refid = f"FAKE{next(self._refids):08d}"
+            self.withdrawals.append(dict(data or {}, refid=refid))
+            return {"error": [], "result": {"refid": refid}}
+        if method == "Balance":
+            return {"error": [], "result": {"XETH": "100.0"}}
+        return {"error": [], "result": {}}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_kraken_client():
+    """Return the process-wide KrakenClient. KRAKEN_FAKE=1 uses FakeKrakenAPI, for local runs."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api = FakeKrakenAPI() if os.getenv("KRAKEN_FAKE") == "1" else None
+                _client = KrakenClient(api=api)
+    return _client
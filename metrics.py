@@ -0,0 +1,171 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# In-process operational metrics in the Prometheus text exposition format, served by the
+# dashboard at /metrics. Counters and histograms are plain dicts under a lock, cheap enough
+# to update on every RPC call. Values live in the process that records them, so sweeps and
+# gas refills started from the dashboard (jobs.py) show up, runs from cron do not.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # Seconds
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)  # Seconds, whole runs
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} if self.labelnames else {(): 0}  # Unlabelled counters report 0 from the start
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        if not self.labelnames:
+            self._values[()] = [0] * len(self.buckets) + [0.0, 0]
+        self._lock = threading.Lock()
+
+    _key = Counter._key
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with histogram.time(): ... observes the block's duration, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[-1] if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {state[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def render():
+    return REGISTRY.render()
+
+
+# Ethereum RPC (provider.InstrumentedHTTPProvider)
+RPC_REQUESTS = counter("usdc_rpc_requests_total", "JSON-RPC requests sent to the node, batched ones counted per request", ["method"])
+RPC_ERRORS = counter("usdc_rpc_errors_total", "Failed JSON-RPC requests, kind is rate_limited (HTTP 429), http, rpc or exception", ["method", "kind"])
+RPC_LATENCY = histogram("usdc_rpc_request_seconds", "JSON-RPC round trip time, batches under method=\"batch\"", ["method"])
+
+# Sweeps (sweep_to_main.sweep_wallets)
+SWEEP_DURATION = histogram("usdc_sweep_duration_seconds", "Duration of sweep runs", buckets=DURATION_BUCKETS)
+SWEEP_WALLETS = counter("usdc_sweep_wallets_total", "Wallets handled by sweeps", ["outcome"])
+SWEEP_USDC = counter("usdc_sweep_usdc_total", "USDC swept to the master wallet")
+
+# Gas refills and Kraken (send_out_gas, kraken_client.KrakenClient)
+GAS_REFILLS = counter("usdc_gas_refills_total", "Wallets handled by gas refills, outcome is succeeded, failed, skipped or unread (balance read failed)", ["outcome"])
+KRAKEN_CALLS = counter("usdc_kraken_calls_total", "Kraken private API calls, result is ok, error, rate_limited or exception", ["method", "result"])
+KRAKEN_LATENCY = histogram("usdc_kraken_call_seconds", "Kraken private API round trip time", ["method"])
+
+# Sheets ledger (sheets_logger.SheetLogger)
+SHEETS_APPEND_LATENCY = histogram("usdc_sheets_append_seconds", "Google Sheets append_rows call time", ["result"])
+SHEETS_ROWS = counter("usdc_sheets_rows_total", "Rows appended to Google Sheets")
+
+# Wallet store (funcs)
+WALLET_STORE_LOAD = histogram("usdc_wallet_store_load_seconds", "Time to decrypt and load the wallet store on a cache miss")
+WALLET_STORE_CACHE_HITS = counter("usdc_wallet_store_cache_hits_total", "Wallet store reads served from the in-process cache")
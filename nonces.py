@@ -0,0 +1,158 @@
+import logging
+import threading
+from provider import get_web3
+
+# Local nonce tracking so one address can have several transactions in flight (e.g. the USDC
+# sweep and the ETH consolidation in disable_wallet) without asking the node for
+# get_transaction_count before every send.
+
+# Node errors meaning the nonce was already used (e.g. by the cron sweep in another process),
+# or that the exact same signed transaction is already in the mempool
+STALE_NONCE_ERRORS = ("nonce too low", "nonce is too low", "oldnonce", "invalid nonce")
+KNOWN_TRANSACTION_ERRORS = ("already known", "known transaction", "alreadyknown")
+NONCE_RESYNC_ATTEMPTS = 3  # Sends tried with a fresh nonce after a stale nonce error
+
+
+def is_stale_nonce_error(error):
+    message = str(error).lower()
+    return any(hint in message for hint in STALE_NONCE_ERRORS)
+
+def is_known_transaction_error(error):
+    message = str(error).lower()
+    return any(hint in message for hint in KNOWN_TRANSACTION_ERRORS)
+
+
+class NonceManager:
+    def __init__(self, web3=None):
+        self.web3 = web3
+        self._lock = threading.Lock()
+        self._state = {}  # address -> {"next": int, "inflight": {nonce: max_cost_wei}, "lock": Lock}
+
+    def _address_state(self, address):
+        with self._lock:
+            state = self._state.get(address)
+            if state is None:
+                state = {"next": None, "inflight": {}, "lock": threading.Lock()}
+                self._state[address] = state
+            return state
+
+    def _reconcile_locked(self, address, state):
+        web3 = self.web3 or get_web3()
+        latest = web3.eth.get_transaction_count(address, 'latest')
+        pending = web3.eth.get_transaction_count(address, 'pending')
+
+        # Anything below the latest count is mined (or was replaced by something that was)
+        for nonce in [n for n in state["inflight"] if n < latest]:
+            del state["inflight"][nonce]
+
+        local_next = state["next"]
+        if local_next is None or local_next < pending:
+            # First use, or transactions were sent from outside this process
+            state["next"] = pending
+        elif local_next > pending:
+            # Gap: nonces pending..local_next-1 were handed out but the node does not know them
+            # (dropped from the mempool or never broadcast). Reuse them from the node's count.
+            dropped = [n for n in state["inflight"] if n >= pending]
+            logging.warning(f"Nonce gap for {address}: local next {local_next}, node pending {pending}, "
+                            f"dropping in-flight nonces {sorted(dropped)}")
+            for nonce in dropped:
+                del state["inflight"][nonce]
+            state["next"] = pending
+        return latest, pending
+
+    def reconcile(self, address):
+        """Sync with the node's latest/pending counts. Returns (latest, pending)."""
+        state = self._address_state(address)
+        with state["lock"]:
+            return self._reconcile_locked(address, state)
+
+    def resync(self, address):
+        """The node rejected a nonce as too low: sync with its pending count and hand out a fresh one."""
+        self.reconcile(address)
+        return self.next_nonce(address)
+
+    def next_nonce(self, address):
+        """Hand out the next nonce for address, only asking the node on first use."""
+        state = self._address_state(address)
+        with state["lock"]:
+            if state["next"] is None:
+                self._reconcile_locked(address, state)
+            nonce = state["next"]
+            state["next"] += 1
+            return nonce
+
+    def record(self, address, nonce, max_cost_wei=0):
+        """Mark nonce as broadcast, reserving its worst case ETH cost (gas * maxFeePerGas + value)."""
+        state = self._address_state(address)
+        with state["lock"]:
+            state["inflight"][nonce] = max_cost_wei
+
+    def confirm(self, address, nonce):
+        """Transaction with this nonce was mined (successfully or not)."""
+        state = self._address_state(address)
+        with state["lock"]:
+            state["inflight"].pop(nonce, None)
+
+    def release(self, address, nonce):
+        """Give back a nonce whose transaction was never broadcast.
+
+        The nonce is only reused if the node has not counted it yet (another process may have
+        sent with it meanwhile), in-flight entries the chain has passed are dropped.
+        """
+        state = self._address_state(address)
+        with state["lock"]:
+            state["inflight"].pop(nonce, None)
+            if state["next"] == nonce + 1:
+                web3 = self.web3 or get_web3()
+                try:
+                    latest = web3.eth.get_transaction_count(address, 'latest')
+                    pending = web3.eth.get_transaction_count(address, 'pending')
+                except Exception as e:
+                    logging.warning(f"Could not check nonce {nonce} for {address} against the node ({str(e)}), resetting")
+                    state["next"] = None
+                    return
+                for mined in [n for n in state["inflight"] if n < latest]:
+                    del state["inflight"][mined]
+                state["next"] = max(nonce, pending)
+            else:
+                # Later nonces are already out, so this leaves a gap. Resync before the next send.
+                logging.warning(f"Released nonce {nonce} for {address} leaves a gap, resetting")
+                state["next"] = None
+
+    def reset(self, address):
+        """Forget local state for address, e.g. after a dropped or externally replaced transaction."""
+        with self._lock:
+            self._state.pop(address, None)
+
+    def _expire_mined(self, address, state):
+        """Drop in-flight entries whose nonce the chain has passed (mined, or replaced by something that was)."""
+        if not state["inflight"]:
+            return
+        web3 = self.web3 or get_web3()
+        try:
+            latest = web3.eth.get_transaction_count(address, 'latest')
+        except Exception as e:
+            logging.warning(f"Could not expire in-flight nonces for {address} ({str(e)}), keeping them reserved")
+            return
+        for nonce in [n for n in state["inflight"] if n < latest]:
+            del state["inflight"][nonce]
+
+    def pending_cost(self, address):
+        """Sum of ETH (wei) reserved by this address's in-flight transactions that are not mined yet."""
+        state = self._address_state(address)
+        with state["lock"]:
+            self._expire_mined(address, state)
+            return sum(state["inflight"].values())
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_nonce_manager():
+    """Return the process-wide NonceManager bound to the shared Web3 instance."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = NonceManager()
+    return _manager
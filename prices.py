@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import logging
+import threading
+from pycoingecko import CoinGeckoAPI
+
+# Shared ETH/USD price service. Every module asks here instead of calling CoinGecko itself:
+# - prices are cached for PRICE_TTL seconds,
+# - concurrent lookups while a fetch is running wait for that fetch (single flight),
+# - the last good price is persisted to PRICE_CACHE_FILE and used when CoinGecko fails.
+
+PRICE_TTL = 60  # Seconds
+PRICE_CACHE_FILE = "eth_price.json"
+FETCH_WAIT_TIMEOUT = 30  # Seconds a follower waits for the in-flight fetch
+RETRY_BACKOFF = 15  # Seconds to serve the last known price after a failed fetch before retrying
+
+cg = CoinGeckoAPI()
+_lock = threading.Lock()
+_price = None
+_fetched_at = 0.0
+_retry_after = 0.0
+_inflight = None  # threading.Event set when the running fetch finishes
+
+
+def _load_last_known():
+    """Read the persisted (price, timestamp), or (None, 0.0) if there is none."""
+    try:
+        with open(PRICE_CACHE_FILE, "r") as f:
+            data = json.load(f)
+        return float(data["usd"]), float(data["timestamp"])
+    except (OSError, ValueError, KeyError):
+        return None, 0.0
+
+def _save_last_known(price, timestamp):
+    tmp_file = PRICE_CACHE_FILE + ".tmp"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump({"usd": price, "timestamp": timestamp}, f)
+        os.replace(tmp_file, PRICE_CACHE_FILE)
+    except OSError as e:
+        logging.warning(f"Could not persist ETH price: {e}")
+
+def _fetch():
+    global _price, _fetched_at, _retry_after
+    try:
+        eth_price_data = cg.get_price(ids='ethereum', vs_currencies='usd')
+        price = float(eth_price_data['ethereum']['usd'])
+    except Exception as e:
+        _retry_after = time.time() + RETRY_BACKOFF
+        if _price is None:
+            _price, _fetched_at = _load_last_known()
+        if _price is None:
+            raise ConnectionError(f"ETH price unavailable and no last known price: {e}")
+        logging.warning(f"CoinGecko lookup failed ({e}), using last known ETH price ${_price:.2f} "
+                        f"from {time.time() - _fetched_at:.0f}s ago")
+        return
+    now = time.time()
+    with _lock:
+        _price, _fetched_at = price, now
+    _save_last_known(price, now)
+
+def get_eth_price_usd(max_age=PRICE_TTL):
+    """Return the ETH price in USD, at most max_age seconds old when CoinGecko is reachable.
+
+    Raises ConnectionError only if CoinGecko fails and no price was ever fetched.
+    """
+    global _inflight
+    with _lock:
+        now = time.time()
+        if _price is not None and (now - _fetched_at < max_age or now < _retry_after):
+            return _price
+        leader = _inflight is None
+        if leader:
+            _inflight = threading.Event()
+        event = _inflight
+
+    if not leader:
+        event.wait(FETCH_WAIT_TIMEOUT)
+        if _price is None:
+            raise ConnectionError("ETH price unavailable")
+        return _price
+
+    try:
+        _fetch()
+        return _price
+    finally:
+        with _lock:
+            _inflight = None
+        event.set()
+
+def eth_to_usd(amount_eth):
+    return float(amount_eth) * get_eth_price_usd()
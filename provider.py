@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from dotenv import load_dotenv
+from metrics import RPC_REQUESTS, RPC_ERRORS, RPC_LATENCY
+
+# Process-wide Web3 registry. Every module gets the same Web3 instance, which talks to the
+# node over one keep-alive requests.Session, so connections are reused instead of opening a
+# new TCP/TLS connection for every helper call.
+
+USDC_CONTRACT_ADDRESS = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"  # USDC on Ethereum mainnet
+USDC_ABI = [
+    {
+        "constant": True,
+        "inputs": [{"name": "_owner", "type": "address"}],
+        "name": "balanceOf",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": False,
+        "inputs": [{"name": "_to", "type": "address"}, {"name": "_value", "type": "uint256"}],
+        "name": "transfer",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function"
+    }
+]
+
+POOL_SIZE = 32  # Max pooled connections, keep above SWEEP_CONCURRENCY
+REQUEST_TIMEOUT = 30  # Seconds
+HEALTH_CHECK_TTL = 60  # Seconds a successful is_connected() is trusted for
+
+_lock = threading.Lock()
+_web3 = None
+_usdc_contract = None
+_last_health_check = 0.0
+
+
+def get_rpc_url():
+    load_dotenv()
+    # RPC_URL overrides the default Infura endpoint (e.g. for a local node)
+    rpc_url = os.getenv("RPC_URL")
+    if rpc_url:
+        return rpc_url
+    return f"https://mainnet.infura.io/v3/{os.getenv('INFURA_API_KEY')}"
+
+def _build_session(pool_size=POOL_SIZE):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _rpc_error_kind(error):
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    return "http" if status else "exception"
+
+class InstrumentedHTTPProvider(Web3.HTTPProvider):
+    """HTTPProvider that records request counts, errors and latency per RPC method (metrics.py)."""
+    def make_request(self, method, params):
+        started = time.perf_counter()
+        try:
+            response = super().make_request(method, params)
+        except Exception as e:
+            RPC_ERRORS.inc(method=method, kind=_rpc_error_kind(e))
+            raise
+        finally:
+            RPC_REQUESTS.inc(method=method)
+            RPC_LATENCY.observe(time.perf_counter() - started, method=method)
+        if isinstance(response, dict) and response.get("error"):
+            RPC_ERRORS.inc(method=method, kind="rpc")
+        return response
+
+    def make_batch_request(self, batch_requests):
+        started = time.perf_counter()
+        methods = [method for method, _ in batch_requests]
+        for method in methods:
+            RPC_REQUESTS.inc(method=method)
+        try:
+            responses = super().make_batch_request(batch_requests)
+        except Exception as e:
+            for method in methods:
+                RPC_ERRORS.inc(method=method, kind=_rpc_error_kind(e))
+            raise
+        finally:
+            RPC_LATENCY.observe(time.perf_counter() - started, method="batch")
+        if isinstance(responses, dict):
+            # The whole batch was refused with a single error response
+            for method in methods:
+                RPC_ERRORS.inc(method=method, kind="rpc")
+        else:
+            # HTTPProvider returns the responses sorted by id, i.e. in request order
+            for method, response in zip(methods, responses):
+                if response.get("error"):
+                    RPC_ERRORS.inc(method=method, kind="rpc")
+        return responses
+
+def get_web3():
+    """Return the shared Web3 instance, creating it on first use."""
+    global _web3
+    if _web3 is None:
+        with _lock:
+            if _web3 is None:
+                provider = InstrumentedHTTPProvider(get_rpc_url(), request_kwargs={"timeout": REQUEST_TIMEOUT}, session=_build_session())
+                _web3 = Web3(provider)
+                logging.info("Created shared Web3 provider")
+    return _web3
+
+def get_usdc_contract():
+    """Return the shared USDC contract bound to the shared Web3 instance."""
+    global _usdc_contract
+    if _usdc_contract is None:
+        web3 = get_web3()
+        with _lock:
+            if _usdc_contract is None:
+                _usdc_contract = web3.eth.contract(address=web3.to_checksum_address(USDC_CONTRACT_ADDRESS), abi=USDC_ABI)
+    return _usdc_contract
+
+def ensure_connected(max_age=HEALTH_CHECK_TTL):
+    """Check the node connection at most once every max_age seconds. Raises ConnectionError."""
+    global _last_health_check
+    if time.time() - _last_health_check < max_age:
+        return get_web3()
+    web3 = get_web3()
+    if not web3.is_connected():
+        logging.error("Failed to connect to Ethereum mainnet")
+        raise ConnectionError("Cannot connect to Ethereum mainnet")
+    _last_health_check = time.time()
+    return web3
+
+def set_web3(web3):
+    """Replace the shared Web3 instance (e.g. with a local chain stand-in)."""
+    global _web3, _usdc_contract, _last_health_check
+    with _lock:
+        _web3 = web3
+        _usdc_contract = None
+        _last_health_check = 0.0
@@ -1,12 +1,13 @@
 import os
-import json
 import logging
-import time
-import krakenex
-from web3 import Web3
-from pycoingecko import CoinGeckoAPI
+import numpy as np
+from prices import get_eth_price_usd
 from dotenv import load_dotenv
-from funcs import get_wallets
+from funcs import get_wallets, get_balances_batch
+from provider import get_web3, get_usdc_contract, ensure_connected
+from fees import get_fee_oracle
+from kraken_client import get_kraken_client, WithdrawalScheduler
+from metrics import GAS_REFILLS
 
 # Set up logging
 logging.basicConfig(filename='usdc_transfer.log', level=logging.INFO, 
@@ -14,98 +15,127 @@ logging.basicConfig(filename='usdc_transfer.log', level=logging.INFO,
 
 # Load environment variables
 load_dotenv()
-INFURA_API_KEY = os.getenv('INFURA_API_KEY')
 KRAKEN_API_KEY = os.getenv('KRAKEN_API_KEY')
 KRAKEN_API_SECRET = os.getenv('KRAKEN_API_SECRET')
 KRAKEN_ADDRESS = os.getenv('KRAKEN_ADDRESS')
 
-MAINNET_RPC_URL = f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"
-
-# Initialize web3, CoinGecko, and Kraken
-web3 = Web3(Web3.HTTPProvider(MAINNET_RPC_URL))
-cg = CoinGeckoAPI()
-kraken = krakenex.API(key=KRAKEN_API_KEY, secret=KRAKEN_API_SECRET)
-
-def getEthBalanaceUSD(address):
-    """Get the ETH balance of an address in USD."""
-    try:
-        address = web3.to_checksum_address(address)
-        balance_wei = web3.eth.get_balance(address)
-        balance_eth = web3.from_wei(balance_wei, 'ether')
-
-        eth_price_data = cg.get_price(ids='ethereum', vs_currencies='usd')
-        eth_price_usd = eth_price_data['ethereum']['usd']
-        balance_usd = float(balance_eth) * eth_price_usd
-
-        return balance_usd
-    except Exception as e:
-        logging.error(f"Error getting balance for {address}: {str(e)}")
-        return 10.0
-
-def needGas(wallet):
-    """Check if wallet balance is less than $4 worth of ETH."""
+# Initialize web3 (shared, pooled provider) and Kraken (rate limited client, see kraken_client.py)
+web3 = get_web3()
+kraken = get_kraken_client()
+
+GAS_THRESHOLD_USD = 4.0  # Refill wallets holding less ETH than this
+GAS_TOPUP_USD = 6.0  # Amount sent per refill
+SWEEP_MIN_USDC = 8.0  # Same minimum as sweep_to_main.MIN_SWEEP_USDC
+SWEEP_GAS_ESTIMATE = 65000  # Gas for a USDC transfer, the nightly sweep must be able to pay it
+
+def plan_gas_refills(wallets, threshold_usd=GAS_THRESHOLD_USD, topup_usd=GAS_TOPUP_USD):
+    """Work out which wallets need gas from one batched balance read and one price snapshot.
+
+    A wallet needs a refill when its ETH is worth less than threshold_usd, or when it holds
+    USDC waiting to be swept but cannot pay the sweep's worst case gas cost. The refill sends
+    topup_usd, or more when that is not enough for the sweep. Wallets with stuck USDC are
+    refilled first (most USDC first), then the rest by ETH balance, lowest first.
+    Wallets whose balance read failed are never refilled, they are listed under "unread".
+    Returns a plan dict with the snapshot block, prices and the "refills" and "unread" lists.
+    """
+    addresses = [web3.to_checksum_address(w["address"]) for w in wallets]
+    block_number, balances = get_balances_batch(addresses, get_usdc_contract(), web3)
+    eth_price_usd = get_eth_price_usd()
+    sweep_cost_wei = SWEEP_GAS_ESTIMATE * get_fee_oracle().suggest()["maxFeePerGas"]
+    sweep_cost_usd = sweep_cost_wei / 10**18 * eth_price_usd
+
+    read = np.array([a in balances for a in addresses], dtype=bool)
+    raw = np.array([balances.get(a, (0, 0)) for a in addresses], dtype=np.float64).reshape(-1, 2)
+    usdc = raw[:, 0] / 10**6
+    eth_usd = raw[:, 1] / 10**18 * eth_price_usd
+
+    # A failed read is not an empty wallet, never pay for a withdrawal on a guess
+    stuck = read & (usdc >= SWEEP_MIN_USDC) & (eth_usd < sweep_cost_usd)
+    needs_gas = read & ((eth_usd < threshold_usd) | stuck)
+    amount_usd = np.maximum(topup_usd, sweep_cost_usd * 1.5 - eth_usd)  # Headroom for a fee spike before the sweep
+    priority = np.where(stuck, -usdc, eth_usd)
+
+    refills = []
+    for i in np.flatnonzero(needs_gas):
+        refills.append({
+            "wallet": wallets[i],
+            "address": addresses[i],
+            "eth_usd": float(eth_usd[i]),
+            "usdc": float(usdc[i]),
+            "amount_usd": float(amount_usd[i]),
+            "amount_eth": float(amount_usd[i]) / eth_price_usd,
+            "priority": float(priority[i]),
+            "reason": "stuck_usdc" if stuck[i] else "low_eth",
+        })
+    refills.sort(key=lambda r: r["priority"])
+    unread = [addresses[i] for i in np.flatnonzero(~read)]
+    logging.info(f"Gas plan at block {block_number}: {len(refills)} of {len(wallets)} wallets need gas "
+                 f"({int(stuck.sum())} with USDC they cannot sweep), ETH ${eth_price_usd:.2f}, sweep cost ${sweep_cost_usd:.2f}")
+    if unread:
+        logging.warning(f"Gas plan skipped {len(unread)} wallets whose balance could not be read: {', '.join(unread[:20])}"
+                        f"{' ...' if len(unread) > 20 else ''}")
+    return {
+        "block": block_number,
+        "eth_price_usd": eth_price_usd,
+        "sweep_cost_usd": sweep_cost_usd,
+        "checked": len(wallets) - len(unread),
+        "refills": refills,
+        "unread": unread,
+    }
+
+def execute_gas_plan(plan, job=None):
+    """Send the plan's refills through the rate limited Kraken withdrawal scheduler."""
+    scheduler = WithdrawalScheduler(kraken)
+    for refill in plan["refills"]:
+        scheduler.submit(refill["address"], refill["wallet"]["kraken_nickname"], refill["amount_eth"],
+                         priority=refill["priority"], context=refill["wallet"])
+
+    def on_result(withdrawal, response):
+        wallet = withdrawal["context"]
+        success = response is not None and not response.get("error")
+        GAS_REFILLS.inc(outcome="succeeded" if success else "failed")
+        if success:
+            logging.info(f"Successfully initiated gas transfer to {wallet['address']} - Owner: {wallet['name']} ({wallet['email']})")
+        else:
+            logging.error(f"Failed to initiate gas transfer to {wallet['address']}")
+        if job:
+            job.advance("succeeded" if success else "failed")
+
+    logging.info(f"Queued {len(scheduler)} gas withdrawals")
+    return scheduler.run(on_result=on_result, cancelled=job.cancelled if job else None)
+
+def refillGas(job=None):
+    """Main function to check and distribute gas to wallets.
+
+    All enabled wallets are evaluated in one pass (plan_gas_refills), then the refills are
+    sent as fast as Kraken's rate limit allows. job (a jobs.Job) gets per-wallet progress
+    and stops the run when cancelled.
+    """
+    logging.info("Starting gas distribution script")
+    
     try:
-        address = wallet['address']
-        balance_usd = getEthBalanaceUSD(address)
-        is_below_4_usd = balance_usd < 4.0
-        logging.info(f"Wallet {address}: ETH (${balance_usd:.2f}), Below $4: {is_below_4_usd}")
-        return is_below_4_usd
-    except Exception as e:
-        logging.error(f"Error checking balance for {wallet['address']}: {str(e)}")
+        ensure_connected()
+    except ConnectionError:
+        logging.error("Failed to connect to Ethereum network")
         return False
 
-def sendGas(to_address, nickname, usd_amount=6.0):
-    """Send ETH equivalent to ~$6 USD from Kraken account."""
+    wallets = [wallet for wallet in get_wallets() if wallet.get("enabled", False)]
+    if job:
+        job.set_total(len(wallets))
     try:
-        # Get ETH price
-        eth_price_data = cg.get_price(ids='ethereum', vs_currencies='usd')
-        eth_price_usd = eth_price_data['ethereum']['usd']
-
-        # Calculate ETH amount (~$6 USD)
-        eth_amount = usd_amount / eth_price_usd
-
-        # Initiate withdrawal via Kraken API
-        withdrawal_info = {
-            'asset': 'ETH',
-            'key': str(nickname),#+"!",  # Withdrawal key name configured in Kraken
-            'amount': str(eth_amount),
-            'address': str(to_address).lower()
-        }
-
-        logging.info(f"Preparing to send {eth_amount:.6f} ETH to {to_address} via Kraken account '{nickname}'")
-
-        # Send withdrawal request
-        response = kraken.query_private('Withdraw', withdrawal_info)
-        
-        if 'error' in response and response['error']:
-            logging.error(f"Kraken API error for {to_address}: {response['error']}")
-            return False
-
-        logging.info(f"Initiated withdrawal of {eth_amount:.6f} ETH to {to_address}, Ref ID: {response.get('result', {}).get('refid', 'N/A')}")
-        return True
+        plan = plan_gas_refills(wallets)
     except Exception as e:
-        logging.error(f"Error sending ETH to {to_address}: {str(e)}")
+        logging.error(f"Error planning gas refills: {str(e)}")
         return False
-
-def refillGas():
-    """Main function to check and distribute gas to wallets."""
-    logging.info("Starting gas distribution script")
-    
-    if not web3.is_connected():
-        logging.error("Failed to connect to Ethereum network")
-        return
-
-    wallets = get_wallets()
-    for wallet in wallets:
-        if wallet.get("enabled", False):
-            if needGas(wallet):
-                success = sendGas(wallet["address"], wallet["kraken_nickname"], 6.0)
-                if success:
-                    logging.info(f"Successfully initiated gas transfer to {wallet['address']} - Owner: {wallet['name']} ({wallet['email']})")
-                else:
-                    logging.error(f"Failed to initiate gas transfer to {wallet['address']}")
-                # Avoid rate limiting
-                time.sleep(2)
+    skipped = plan["checked"] - len(plan["refills"])
+    GAS_REFILLS.inc(skipped, outcome="skipped")
+    GAS_REFILLS.inc(len(plan["unread"]), outcome="unread")
+    if job:
+        for _ in range(skipped):
+            job.advance("skipped")
+        for _ in plan["unread"]:
+            job.advance("failed")  # Not checked, so not known to be fine either
+    execute_gas_plan(plan, job=job)
     return True # If successful
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+import gspread
+from google.oauth2.service_account import Credentials
+from metrics import SHEETS_APPEND_LATENCY, SHEETS_ROWS
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, one process at a time
+    fcntl = None
+
+# Buffered Google Sheets ledger. Rows go to a local spool file first (flushed and fsynced),
+# then are written to the sheet in batches with append_rows. A row only leaves the spool
+# after the batch containing it was accepted, so quota errors or a crash never lose a row;
+# whatever is left is sent by the next flush, e.g. at the start of the next run.
+#
+# The cron sweep, the dashboard's job runner and the planner daemon share one spool, so every
+# read-modify-write of it holds an flock on <spool>.lock, and only one process flushes at a
+# time (<spool>.flush.lock). Sheets calls are made without holding the spool lock.
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+CREDS_FILE = "credentials.json"
+
+
+def transaction_row(transaction_data):
+    # Assuming transaction_data is a dict like: {"amount": 100.50, "recipient": "John Doe", "status": "Success"}
+    return [
+        datetime.datetime.now().isoformat(),  # Timestamp
+        transaction_data.get("recipient", ""),
+        transaction_data.get("email", ""),
+        transaction_data.get("address", ""),
+        transaction_data.get("amount", ""),
+        transaction_data.get("gasUSD", ""),
+    ]
+
+
+class SheetLogger:
+    def __init__(self, sheet_id, sheet_name, spool_file, creds_file=CREDS_FILE, batch_size=100, max_retries=5):
+        self.sheet_id = sheet_id
+        self.sheet_name = sheet_name
+        self.spool_file = spool_file
+        self.creds_file = creds_file
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._worksheet = None
+        self._pending = None  # Rows in the spool, counted on first use
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_thread = None
+
+    def _get_worksheet(self):
+        # Authorize and open the worksheet once per process
+        if self._worksheet is None:
+            creds = Credentials.from_service_account_file(self.creds_file, scopes=SCOPES)
+            client = gspread.authorize(creds)
+            self._worksheet = client.open_by_key(self.sheet_id).worksheet(self.sheet_name)
+        return self._worksheet
+
+    def _read_spool(self):
+        if not os.path.exists(self.spool_file):
+            return []
+        rows = []
+        with open(self.spool_file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    logging.warning(f"Skipping unreadable line in {self.spool_file}: {line[:80]}")
+        return rows
+
+    def _write_spool(self, rows):
+        tmp_file = self.spool_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.spool_file)
+
+    @contextmanager
+    def _spool_lock(self):
+        """Thread lock plus an exclusive flock shared with other processes using the spool."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.spool_file + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _flusher(self):
+        """Yields True if this process may flush now, False if another process is flushing."""
+        with self._flush_lock:
+            if fcntl is None:
+                yield True
+                return
+            with open(self.spool_file + ".flush.lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def pending(self):
+        with self._spool_lock():
+            if self._pending is None:
+                self._pending = len(self._read_spool())
+            return self._pending
+
+    def log(self, row):
+        """Durably queue a row. A full batch is flushed on a background thread, so callers
+        (e.g. the sweep's confirmation callbacks) never wait on Sheets quota backoff."""
+        with self._spool_lock():
+            if self._pending is None:
+                self._pending = len(self._read_spool())
+            with open(self.spool_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending += 1
+            full = self._pending >= self.batch_size
+        if full:
+            self.flush_in_background()
+
+    def flush_in_background(self):
+        with self._lock:
+            if self._flush_thread is not None and self._flush_thread.is_alive():
+                return  # The running flush picks up the new rows too
+            self._flush_thread = threading.Thread(target=self.flush, name="sheets-flush", daemon=True)
+            self._flush_thread.start()
+
+    def flush(self):
+        """Send spooled rows in batches. Returns the number of rows written to the sheet.
+
+        If another process is already flushing this spool, returns 0 right away; that flush
+        keeps going until the spool is empty, so it sends our rows as well.
+        """
+        written = 0
+        with self._flusher() as may_flush:
+            if not may_flush:
+                logging.info(f"Another process is flushing {self.spool_file}, leaving the rows to it")
+                return 0
+            while True:
+                with self._spool_lock():
+                    rows = self._read_spool()
+                    self._pending = len(rows)
+                batch = rows[:self.batch_size]
+                if not batch:
+                    break
+                if not self._append_with_retry(batch):
+                    logging.error(f"Sheets flush stopped, {len(rows)} rows stay in {self.spool_file} for the next run")
+                    break
+                with self._spool_lock():
+                    # Other processes may have appended meanwhile, remove exactly the rows that were sent
+                    remaining = self._read_spool()
+                    for row in batch:
+                        if row in remaining:
+                            remaining.remove(row)
+                    self._write_spool(remaining)
+                    self._pending = len(remaining)
+                written += len(batch)
+        if written:
+            logging.info(f"Logged {written} transactions to Google Sheets")
+        return written
+
+    def _append_with_retry(self, batch):
+        for attempt in range(self.max_retries):
+            started = time.perf_counter()
+            try:
+                self._get_worksheet().append_rows(batch)
+                SHEETS_APPEND_LATENCY.observe(time.perf_counter() - started, result="ok")
+                SHEETS_ROWS.inc(len(batch))
+                return True
+            except Exception as e:
+                SHEETS_APPEND_LATENCY.observe(time.perf_counter() - started, result="error")
+                if isinstance(e, gspread.exceptions.APIError) and e.response.status_code == 401:
+                    self._worksheet = None  # Token expired, authorize again
+                wait = 2 ** attempt * 5  # Sheets write quota is per minute
+                logging.warning(f"Sheets append of {len(batch)} rows failed (attempt {attempt + 1}/{self.max_retries}): {e}. Retrying in {wait}s")
+                if attempt < self.max_retries - 1:
+                    time.sleep(wait)
+        return False
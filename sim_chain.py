@@ -0,0 +1,469 @@
+import os
+import time
+import random
+import threading
+import itertools
+from collections import Counter
+from eth_abi import decode, encode
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from eth_keys import keys
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+from provider import USDC_CONTRACT_ADDRESS
+from funcs import MULTICALL3_ADDRESS
+
+# Offline stand-in for mainnet, used to measure sweep and gas refill throughput without real
+# funds. SimulatedChain keeps ETH/USDC balances, nonces, a mempool and EIP-1559 blocks in
+# memory and understands exactly the contract calls this repo makes (USDC balanceOf/transfer,
+# Multicall3 aggregate3/getEthBalance). SimulatedProvider serves it over web3's JSON-RPC
+# interface with optional latency and error injection, and counts every call.
+#
+# eth_call and eth_getBalance always answer from the current state, whatever block is asked.
+
+USDC_TRANSFER_GAS = 60000
+ETH_TRANSFER_GAS = 21000
+CHAIN_ID = 1
+
+USDC = Web3.to_checksum_address(USDC_CONTRACT_ADDRESS)
+MULTICALL3 = Web3.to_checksum_address(MULTICALL3_ADDRESS)
+TRANSFER_TOPIC = "0x" + Web3.keccak(text="Transfer(address,address,uint256)").hex().removeprefix("0x")
+SELECTOR_BALANCE_OF = bytes.fromhex("70a08231")
+SELECTOR_TRANSFER = bytes.fromhex("a9059cbb")
+SELECTOR_AGGREGATE3 = bytes(Web3.keccak(text="aggregate3((address,bool,bytes)[])")[:4])
+SELECTOR_GET_ETH_BALANCE = bytes(Web3.keccak(text="getEthBalance(address)")[:4])
+MAX_LOGS = 10000  # Like hosted providers, getLogs fails past this many results
+
+
+class SimError(Exception):
+    """A JSON-RPC error the node would return."""
+    def __init__(self, message, code=-32000):
+        super().__init__(message)
+        self.code = code
+
+
+def _hex(value):
+    return hex(value)
+
+def _quantity(value):
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+class SimulatedChain:
+    def __init__(self, base_fee_gwei=20.0, priority_fee_gwei=1.0, block_time=1.0, block_gas_limit=30_000_000,
+                 fee_volatility=0.0, drop_rate=0.0, seed=None):
+        self.block_time = block_time
+        self.block_gas_limit = block_gas_limit
+        self.priority_fee = int(priority_fee_gwei * 10**9)
+        self.fee_volatility = fee_volatility  # Random +- share applied to each block's base fee
+        self.drop_rate = drop_rate  # Share of accepted transactions that silently never get mined
+        self.random = random.Random(seed)
+        self.eth = Counter()
+        self.usdc = Counter()
+        self.nonces = Counter()
+        self.mempool = {}  # sender -> {nonce: (tx_hash, tx)}
+        self.receipts = {}  # tx_hash -> receipt dict (JSON form)
+        self.logs = []  # Transfer logs (JSON form), in block order
+        self.block_number = 0
+        self.base_fee = int(base_fee_gwei * 10**9)
+        self.base_fees = [self.base_fee]  # Per block, for eth_feeHistory
+        self.gas_used_ratios = [0.5]
+        self.genesis = time.monotonic()
+        self.sim_seconds = 0.0  # CPU time spent inside the simulator (signature recovery etc.)
+        self._log_index = itertools.count()
+        self._lock = threading.RLock()
+
+    # Funding
+
+    def fund(self, address, eth_wei=0, usdc_raw=0, sender="0x000000000000000000000000000000000000dEaD"):
+        """Credit ETH and USDC. USDC arrives as a Transfer from sender, so it shows up in getLogs."""
+        address = Web3.to_checksum_address(address)
+        with self._lock:
+            self._advance()
+            self.eth[address] += eth_wei
+            if usdc_raw:
+                self.usdc[address] += usdc_raw
+                self._add_transfer_log(Web3.to_checksum_address(sender), address, usdc_raw,
+                                       "0x" + os.urandom(32).hex(), self.block_number + 1)
+
+    # Blocks
+
+    def _advance(self):
+        """Mine every block that is due by wall clock time."""
+        due = int((time.monotonic() - self.genesis) / self.block_time)
+        while self.block_number < due:
+            if not self.mempool and due - self.block_number > 10:
+                # Skip a long idle stretch in one step
+                skipped = due - 1 - self.block_number
+                self.block_number += skipped
+                self.base_fees.extend([self.base_fee] * skipped)
+                self.gas_used_ratios.extend([0.5] * skipped)
+            self._mine_block()
+
+    def _mine_block(self):
+        self.block_number += 1
+        block = self.block_number
+        gas_used = 0
+        ready = []
+        for sender, queued in self.mempool.items():
+            nonce = self.nonces[sender]
+            if nonce in queued:
+                ready.append(sender)
+        # Highest tip first, then fill the block
+        ready.sort(key=lambda s: -self._tip(self.mempool[s][self.nonces[s]][1]))
+        index = 0
+        for sender in ready:
+            queued = self.mempool[sender]
+            while self.nonces[sender] in queued:
+                tx_hash, tx = queued[self.nonces[sender]]
+                gas_needed = USDC_TRANSFER_GAS if tx["to"] == USDC else ETH_TRANSFER_GAS
+                # Half of every block is taken by the rest of mainnet
+                if gas_used + gas_needed > self.block_gas_limit // 2 or tx["maxFeePerGas"] < self.base_fee:
+                    break
+                del queued[self.nonces[sender]]
+                gas_used += self._execute(tx_hash, tx, sender, block, index)
+                index += 1
+        self.mempool = {s: q for s, q in self.mempool.items() if q}
+
+        # EIP-1559 base fee update. The rest of mainnet is modelled as a steady load at the
+        # gas target, so only our own transactions (and the optional noise) move the fee.
+        target = self.block_gas_limit // 2
+        block_gas = min(self.block_gas_limit, target + gas_used)
+        self.base_fee = max(7, self.base_fee + self.base_fee * (block_gas - target) // target // 8)
+        if self.fee_volatility:
+            self.base_fee = max(7, int(self.base_fee * (1 + self.random.uniform(-self.fee_volatility, self.fee_volatility))))
+        self.base_fees.append(self.base_fee)
+        self.gas_used_ratios.append(block_gas / self.block_gas_limit)
+
+    def _tip(self, tx):
+        return min(tx["maxPriorityFeePerGas"], tx["maxFeePerGas"] - self.base_fee)
+
+    def _execute(self, tx_hash, tx, sender, block, index):
+        price = self.base_fee + self._tip(tx)
+        status = 1
+        to = tx["to"]
+        if to == USDC:
+            gas_used = min(USDC_TRANSFER_GAS, tx["gas"])
+            data = tx["data"]
+            if tx["gas"] < USDC_TRANSFER_GAS or data[:4] != SELECTOR_TRANSFER:
+                status = 0
+            else:
+                recipient, amount = decode(["address", "uint256"], data[4:])
+                recipient = Web3.to_checksum_address(recipient)
+                if self.usdc[sender] < amount:
+                    status = 0
+                else:
+                    self.usdc[sender] -= amount
+                    self.usdc[recipient] += amount
+                    self._add_transfer_log(sender, recipient, amount, tx_hash, block)
+        else:
+            gas_used = ETH_TRANSFER_GAS
+            self.eth[to] += tx["value"]
+        self.eth[sender] -= gas_used * price + (tx["value"] if status and to != USDC else 0)
+        self.nonces[sender] += 1
+        self.receipts[tx_hash] = {
+            "transactionHash": tx_hash,
+            "transactionIndex": _hex(index),
+            "blockNumber": _hex(block),
+            "blockHash": "0x" + block.to_bytes(32, "big").hex(),
+            "from": sender,
+            "to": to,
+            "cumulativeGasUsed": _hex(gas_used),
+            "gasUsed": _hex(gas_used),
+            "effectiveGasPrice": _hex(price),
+            "contractAddress": None,
+            "logs": [],
+            "logsBloom": "0x" + "00" * 256,
+            "status": _hex(status),
+            "type": "0x2",
+        }
+        return gas_used
+
+    def _add_transfer_log(self, sender, recipient, amount, tx_hash, block):
+        self.logs.append({
+            "address": USDC,
+            "topics": [TRANSFER_TOPIC, "0x" + "00" * 12 + sender[2:].lower(), "0x" + "00" * 12 + recipient[2:].lower()],
+            "data": "0x" + amount.to_bytes(32, "big").hex(),
+            "blockNumber": _hex(block),
+            "blockHash": "0x" + block.to_bytes(32, "big").hex(),
+            "transactionHash": tx_hash,
+            "transactionIndex": "0x0",
+            "logIndex": _hex(next(self._log_index)),
+            "removed": False,
+        })
+
+    # JSON-RPC methods
+
+    def rpc(self, method, params):
+        with self._lock:
+            self._advance()
+            handler = getattr(self, "rpc_" + method, None)
+            if handler is None:
+                raise SimError(f"the method {method} does not exist/is not available", -32601)
+            return handler(*params)
+
+    def rpc_web3_clientVersion(self):
+        return "SimulatedChain/v1"
+
+    def rpc_net_version(self):
+        return str(CHAIN_ID)
+
+    def rpc_eth_chainId(self):
+        return _hex(CHAIN_ID)
+
+    def rpc_eth_blockNumber(self):
+        return _hex(self.block_number)
+
+    def rpc_eth_gasPrice(self):
+        return _hex(self.base_fee + self.priority_fee)
+
+    def rpc_eth_maxPriorityFeePerGas(self):
+        return _hex(self.priority_fee)
+
+    def rpc_eth_getBlockByNumber(self, block, full=False):
+        number = self.block_number if block in ("latest", "pending", "safe", "finalized") else _quantity(block)
+        return {
+            "number": _hex(number),
+            "hash": "0x" + number.to_bytes(32, "big").hex(),
+            "parentHash": "0x" + max(number - 1, 0).to_bytes(32, "big").hex(),
+            "timestamp": _hex(int(time.time())),
+            "baseFeePerGas": _hex(self.base_fees[min(number, len(self.base_fees) - 1)]),
+            "gasLimit": _hex(self.block_gas_limit),
+            "gasUsed": "0x0",
+            "transactions": [],
+        }
+
+    def rpc_eth_feeHistory(self, count, newest, percentiles):
+        count = _quantity(count)
+        newest = self.block_number if newest in ("latest", "pending") else _quantity(newest)
+        oldest = max(0, newest - count + 1)
+        blocks = range(oldest, newest + 1)
+        return {
+            "oldestBlock": _hex(oldest),
+            "baseFeePerGas": [_hex(self.base_fees[b]) for b in blocks] + [_hex(self.base_fee)],
+            "gasUsedRatio": [self.gas_used_ratios[b] for b in blocks],
+            "reward": [[_hex(int(self.priority_fee * (0.5 + p / 100))) for p in percentiles] for _ in blocks],
+        }
+
+    def rpc_eth_getBalance(self, address, block="latest"):
+        return _hex(self.eth[Web3.to_checksum_address(address)])
+
+    def rpc_eth_getTransactionCount(self, address, block="latest"):
+        address = Web3.to_checksum_address(address)
+        nonce = self.nonces[address]
+        if block == "pending":
+            queued = self.mempool.get(address, {})
+            while nonce in queued:
+                nonce += 1
+        return _hex(nonce)
+
+    def _call(self, to, data):
+        to = Web3.to_checksum_address(to)
+        if to == USDC and data[:4] == SELECTOR_BALANCE_OF:
+            (owner,) = decode(["address"], data[4:])
+            return encode(["uint256"], [self.usdc[Web3.to_checksum_address(owner)]])
+        if to == MULTICALL3 and data[:4] == SELECTOR_GET_ETH_BALANCE:
+            (owner,) = decode(["address"], data[4:])
+            return encode(["uint256"], [self.eth[Web3.to_checksum_address(owner)]])
+        if to == MULTICALL3 and data[:4] == SELECTOR_AGGREGATE3:
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            results = []
+            for target, allow_failure, call_data in calls:
+                try:
+                    results.append((True, self._call(target, call_data)))
+                except SimError:
+                    if not allow_failure:
+                        raise
+                    results.append((False, b""))
+            return encode(["(bool,bytes)[]"], [results])
+        raise SimError("execution reverted")
+
+    def rpc_eth_call(self, tx, block="latest", *overrides):
+        return "0x" + self._call(tx["to"], bytes.fromhex(tx.get("data", tx.get("input", "0x"))[2:])).hex()
+
+    def rpc_eth_estimateGas(self, tx, block="latest"):
+        to = Web3.to_checksum_address(tx["to"])
+        if to != USDC:
+            return _hex(ETH_TRANSFER_GAS)
+        data = bytes.fromhex(tx.get("data", tx.get("input", "0x"))[2:])
+        if data[:4] == SELECTOR_TRANSFER:
+            _, amount = decode(["address", "uint256"], data[4:])
+            if self.usdc[Web3.to_checksum_address(tx.get("from", "0x" + "00" * 20))] < amount:
+                raise SimError("execution reverted: ERC20: transfer amount exceeds balance", 3)
+        return _hex(USDC_TRANSFER_GAS)
+
+    def rpc_eth_sendRawTransaction(self, raw_hex):
+        started = time.process_time()
+        raw = HexBytes(raw_hex)
+        fields = TypedTransaction.from_bytes(raw).as_dict()
+        sender = Account.recover_transaction(raw)
+        self.sim_seconds += time.process_time() - started
+        tx = {
+            "to": Web3.to_checksum_address(fields["to"]),
+            "value": fields["value"],
+            "data": bytes(fields["data"]),
+            "nonce": fields["nonce"],
+            "gas": fields["gas"],
+            "maxFeePerGas": fields["maxFeePerGas"],
+            "maxPriorityFeePerGas": fields["maxPriorityFeePerGas"],
+        }
+        tx_hash = "0x" + bytes(Web3.keccak(raw)).hex()
+        nonce = tx["nonce"]
+        if nonce < self.nonces[sender]:
+            raise SimError("nonce too low")
+        if self.eth[sender] < tx["gas"] * tx["maxFeePerGas"] + tx["value"]:
+            raise SimError("insufficient funds for gas * price + value")
+        queued = self.mempool.setdefault(sender, {})
+        if nonce in queued:
+            previous = queued[nonce][1]
+            if tx["maxFeePerGas"] < previous["maxFeePerGas"] * 1.1 or tx["maxPriorityFeePerGas"] < previous["maxPriorityFeePerGas"] * 1.1:
+                raise SimError("replacement transaction underpriced")
+        if self.random.random() < self.drop_rate:
+            return tx_hash  # Accepted, but never mined
+        queued[nonce] = (tx_hash, tx)
+        return tx_hash
+
+    def rpc_eth_getTransactionReceipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+    def rpc_eth_getLogs(self, log_filter):
+        def block_param(value, default):
+            if value is None or value in ("latest", "pending", "safe", "finalized"):
+                return default
+            return 0 if value == "earliest" else _quantity(value)
+        from_block = block_param(log_filter.get("fromBlock"), self.block_number)
+        to_block = block_param(log_filter.get("toBlock"), self.block_number)
+        topics = log_filter.get("topics") or []
+        address = log_filter.get("address")
+        addresses = {a.lower() for a in (address if isinstance(address, list) else [address])} if address else None
+        results = []
+        for log in self.logs:
+            number = int(log["blockNumber"], 16)
+            if number < from_block or number > to_block:
+                continue
+            if number > self.block_number:
+                continue  # Credited in the pending block
+            if addresses and log["address"].lower() not in addresses:
+                continue
+            if not all(t is None or log["topics"][i] in (t if isinstance(t, list) else [t])
+                       for i, t in enumerate(topics)):
+                continue
+            results.append(log)
+            if len(results) > MAX_LOGS:
+                raise SimError(f"query returned more than {MAX_LOGS} results", -32005)
+        return results
+
+
+class SimulatedProvider(JSONBaseProvider):
+    """web3 provider backed by a SimulatedChain.
+
+    latency is added once per HTTP round trip (a batch is one round trip) and error_rate is
+    the share of JSON-RPC calls answered with an error. calls counts every call by method.
+    """
+    def __init__(self, chain, latency=0.0, error_rate=0.0, seed=None):
+        super().__init__()
+        self.chain = chain
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = Counter()
+            self.round_trips = 0
+
+    def _respond(self, method, params, request_id):
+        with self._lock:
+            self.calls[method] += 1
+            inject = self.error_rate and self.random.random() < self.error_rate
+        if inject:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": "simulated upstream error"}}
+        try:
+            return {"jsonrpc": "2.0", "id": request_id, "result": self.chain.rpc(method, params or [])}
+        except SimError as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": str(e)}}
+
+    def make_request(self, method, params):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(method, params, next(self.request_counter))
+
+    def make_batch_request(self, requests):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._respond(method, params, next(self.request_counter)) for method, params in requests]
+
+    def is_connected(self, show_traceback=False):
+        return True
+
+
+def generate_fleet(count, eth_price_usd=2500.0, active_share=0.2, dust_share=0.2, no_gas_share=0.05, seed=0):
+    """Synthetic wallets in the wallet store format plus the balances to fund them with.
+
+    active_share of the wallets hold a sweepable USDC balance (log-normal, median ~40 USDC),
+    dust_share hold less than the 8 USDC minimum and the rest hold none. Most wallets have
+    $1-$12 of ETH for gas, no_gas_share have none. Only wallets with sweepable USDC get a
+    real key pair (an EC multiplication each); the others get a random address, since the
+    sweep never signs for them. Returns (wallets, funding) with funding as
+    {address: (eth_wei, usdc_raw)}.
+    """
+    rng = random.Random(seed)
+    wallets = []
+    funding = {}
+    for i in range(count):
+        roll = rng.random()
+        if roll < active_share:
+            usdc = max(8.0, rng.lognormvariate(3.7, 1.0))
+        elif roll < active_share + dust_share:
+            usdc = rng.uniform(0.01, 7.99)
+        else:
+            usdc = 0.0
+        if usdc >= 8.0:
+            private_key = keys.PrivateKey(rng.getrandbits(256).to_bytes(32, "big"))
+            address = private_key.public_key.to_checksum_address()
+            key_hex = private_key.to_hex()
+        else:
+            address = Web3.to_checksum_address("0x" + rng.getrandbits(160).to_bytes(20, "big").hex())
+            key_hex = "0x" + rng.getrandbits(256).to_bytes(32, "big").hex()
+        eth_usd = 0.0 if rng.random() < no_gas_share else rng.uniform(1.0, 12.0)
+        funding[address] = (int(eth_usd / eth_price_usd * 10**18), int(usdc * 10**6))
+        wallets.append({
+            "address": address,
+            "private_key": key_hex,
+            "name": f"sim-user-{i}",
+            "email": f"sim-user-{i}@example.com",
+            "kraken_nickname": f"sim-{i}",
+            "enabled": True,
+            "index": i,
+        })
+    return wallets, funding
+
+def fund_fleet(chain, funding):
+    for address, (eth_wei, usdc_raw) in funding.items():
+        chain.fund(address, eth_wei=eth_wei, usdc_raw=usdc_raw)
+
+
+class SimCoinGecko:
+    """Fixed-price stand-in for pycoingecko's CoinGeckoAPI."""
+    def __init__(self, eth_price_usd):
+        self.eth_price_usd = eth_price_usd
+
+    def get_price(self, ids, vs_currencies):
+        return {"ethereum": {"usd": self.eth_price_usd}}
+
+
+class NullWorksheet:
+    """Accepts Sheets appends without sending them anywhere."""
+    def __init__(self):
+        self.rows = 0
+
+    def append_rows(self, rows):
+        self.rows += len(rows)
@@ -0,0 +1,126 @@
+import os
+import time
+import logging
+import argparse
+import numpy as np
+from funcs import get_wallets, get_balances_batch
+from prices import get_eth_price_usd
+from fees import get_fee_oracle
+import sweep_to_main
+from sweep_to_main import sweep_wallets, MIN_SWEEP_USDC, SWEEP_CONCURRENCY
+
+# Cost-aware sweep planning. Instead of sweeping every wallet over the minimum at whatever
+# gas price midnight brings, compare each wallet's expected gas cost with its USDC balance
+# across the whole fleet at once (NumPy), sweep the wallets where gas is a small share now
+# and leave the rest for a block whose base fee is under SWEEP_DEFER_BASE_FEE_GWEI.
+# daemon() watches the base fee block by block and sweeps the deferred wallets when it drops.
+
+MAX_GAS_SHARE = float(os.getenv("SWEEP_MAX_GAS_SHARE", "0.05"))  # Sweep now if gas is at most this share of the balance
+DEFER_BASE_FEE_GWEI = float(os.getenv("SWEEP_DEFER_BASE_FEE_GWEI", "5"))  # Deferred wallets are swept below this base fee
+MAX_DEFER_HOURS = float(os.getenv("SWEEP_MAX_DEFER_HOURS", "48"))  # Sweep anyway once a wallet waited this long
+SWEEP_GAS_ESTIMATE = 65000  # Gas for a USDC transfer
+PLAN_INTERVAL = 3600  # Seconds between regular sweeps of the economic set in daemon mode
+BLOCK_POLL_INTERVAL = 4  # Seconds between eth_blockNumber checks in daemon mode
+
+
+def plan_sweeps(wallets, max_gas_share=MAX_GAS_SHARE, force=False, force_addresses=None):
+    """Split wallets over MIN_SWEEP_USDC into the ones worth sweeping now and the deferred ones.
+
+    Uses one batched balance read, the fee oracle's expected gas price (base fee + tip) and
+    one ETH price. force puts every wallet over the minimum in the sweep set (cheap block),
+    force_addresses only those wallets (e.g. past their defer deadline). Returns a plan dict
+    with "sweep_now", "deferred", raw USDC "balances" and the fee snapshot.
+    """
+    web3 = sweep_to_main.web3
+    addresses = [web3.to_checksum_address(w["address"]) for w in wallets]
+    block_number, balances = get_balances_batch(addresses, sweep_to_main.USDC_CONTRACT, web3)
+    oracle = get_fee_oracle()
+    expected_gas_price = oracle.suggest()["expectedGasPrice"]
+    eth_price_usd = get_eth_price_usd()
+
+    usdc_raw = np.array([balances.get(a, (0, 0))[0] for a in addresses], dtype=np.float64)
+    usdc = usdc_raw / 10**6
+    gas_cost_usd = SWEEP_GAS_ESTIMATE * expected_gas_price / 10**18 * eth_price_usd  # Same for every wallet
+    gas_share = gas_cost_usd / np.maximum(usdc, 1e-6)
+    over_minimum = usdc >= MIN_SWEEP_USDC
+    forced = np.array([a in force_addresses for a in addresses], dtype=bool) if force_addresses else False
+    sweep_now = over_minimum & ((gas_share <= max_gas_share) | force | forced)
+    deferred = over_minimum & ~sweep_now
+
+    plan = {
+        "block": block_number,
+        "base_fee": oracle.next_base_fee,
+        "expected_gas_price": expected_gas_price,
+        "eth_price_usd": eth_price_usd,
+        "gas_cost_usd": gas_cost_usd,
+        "sweep_now": [wallets[i] for i in np.flatnonzero(sweep_now)],
+        "deferred": [wallets[i] for i in np.flatnonzero(deferred)],
+        "balances": {addresses[i]: int(usdc_raw[i]) for i in np.flatnonzero(over_minimum)},
+        "usdc_now": float(usdc[sweep_now].sum()),
+        "usdc_deferred": float(usdc[deferred].sum()),
+    }
+    logging.info(f"Sweep plan at block {block_number}: gas ${gas_cost_usd:.2f} per sweep at "
+                 f"{expected_gas_price / 10**9:.2f} gwei, {len(plan['sweep_now'])} wallets now "
+                 f"({plan['usdc_now']:.2f} USDC), {len(plan['deferred'])} deferred ({plan['usdc_deferred']:.2f} USDC)")
+    return plan
+
+def sweep_planned(wallets=None, force=False, force_addresses=None, max_workers=SWEEP_CONCURRENCY, job=None):
+    """Plan and sweep the economic set. Returns (plan, summary)."""
+    if wallets is None:
+        wallets = [w for w in get_wallets() if w.get("enabled", False)]
+    plan = plan_sweeps(wallets, force=force, force_addresses=force_addresses)
+    summary = sweep_wallets(plan["sweep_now"], max_workers=max_workers, job=job, balances=plan["balances"])
+    logging.info(f"Planned sweep finished in {summary['seconds']}s: {summary['swept']} swept, "
+                 f"{summary['skipped']} skipped, {summary['failed']} failed, {len(plan['deferred'])} deferred")
+    return plan, summary
+
+def base_fee_is_cheap(base_fee_wei, level_gwei=DEFER_BASE_FEE_GWEI):
+    return base_fee_wei is not None and base_fee_wei <= level_gwei * 10**9
+
+def daemon(level_gwei=DEFER_BASE_FEE_GWEI, plan_interval=PLAN_INTERVAL, max_defer_hours=MAX_DEFER_HOURS,
+           poll_interval=BLOCK_POLL_INTERVAL, max_workers=SWEEP_CONCURRENCY):
+    """Sweep the economic set every plan_interval and the deferred wallets on a cheap block.
+
+    The base fee is checked once per new block. Wallets deferred longer than max_defer_hours
+    are swept at the current fee so funds are never held back indefinitely, the other
+    deferred wallets keep waiting for a cheap block.
+    """
+    web3 = sweep_to_main.web3
+    oracle = get_fee_oracle()
+    deferred_since = {}  # address -> time it was first deferred
+    last_plan = 0.0
+    last_block = None
+    logging.info(f"Sweep daemon started: deferred wallets are swept below {level_gwei} gwei base fee")
+    while True:
+        try:
+            block_number = web3.eth.block_number
+            if block_number != last_block:
+                last_block = block_number
+                oracle.refresh(force=True)
+                cheap = base_fee_is_cheap(oracle.next_base_fee, level_gwei)
+                now = time.time()
+                overdue = [a for a, since in deferred_since.items() if now - since > max_defer_hours * 3600]
+                if now - last_plan >= plan_interval or (cheap and deferred_since) or overdue:
+                    if cheap and deferred_since:
+                        logging.info(f"Base fee {oracle.next_base_fee / 10**9:.2f} gwei at block {block_number}, sweeping {len(deferred_since)} deferred wallets")
+                    if overdue:
+                        logging.info(f"{len(overdue)} wallets were deferred for more than {max_defer_hours}h, sweeping at the current fee")
+                    plan, _ = sweep_planned(force=cheap, force_addresses=set(overdue), max_workers=max_workers)
+                    last_plan = now
+                    still_deferred = {web3.to_checksum_address(w["address"]) for w in plan["deferred"]}
+                    deferred_since = {a: deferred_since.get(a, now) for a in still_deferred}
+        except Exception as e:
+            logging.error(f"Sweep daemon iteration failed: {str(e)}")
+        time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost-aware USDC sweep: sweep wallets where gas is cheap relative to the balance")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and sweep deferred wallets when the base fee drops")
+    parser.add_argument("--force", action="store_true", help="Sweep every wallet over the minimum regardless of gas cost")
+    parser.add_argument("--level-gwei", type=float, default=DEFER_BASE_FEE_GWEI, help="Base fee at which deferred wallets are swept")
+    args = parser.parse_args()
+    if args.daemon:
+        daemon(level_gwei=args.level_gwei)
+    else:
+        sweep_planned(force=args.force or base_fee_is_cheap(get_fee_oracle().base_fee(), args.level_gwei))
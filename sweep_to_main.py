@@ -1,15 +1,19 @@
 import os
 import traceback
 import logging
-from web3 import Web3
+from web3.exceptions import TransactionNotFound
 from dotenv import load_dotenv
-from funcs import get_wallets
-from pycoingecko import CoinGeckoAPI
+from funcs import get_wallets, get_balances_batch
+from provider import get_web3, get_usdc_contract, ensure_connected
+from prices import eth_to_usd
+from fees import get_fee_oracle, REPLACEMENT_BUMP
+from nonces import get_nonce_manager, is_stale_nonce_error, is_known_transaction_error, NONCE_RESYNC_ATTEMPTS
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import gspread
-from google.oauth2.service_account import Credentials
-import datetime
+from sheets_logger import SheetLogger, transaction_row
+from deposit_indexer import DepositIndexer
+from metrics import SWEEP_DURATION, SWEEP_WALLETS, SWEEP_USDC
 
 
 # This script sweeps USDC from many individual wallets to a master wallet.
@@ -20,82 +24,41 @@ logging.basicConfig(filename='usdc_transfer.log', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-# Define the scope and load credentials
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-CREDS_FILE = "credentials.json"
-
 # Load environment variables
 load_dotenv()
 INFURA_API_KEY = os.getenv("INFURA_API_KEY")
 KRAKEN_ADDRESS = os.getenv("KRAKEN_ADDRESS")
 SHEET_ID = os.getenv("SHEET_ID") # Found in the Google Sheet URL: https://docs.google.com/spreadsheets/d/<SHEET_ID>/edit
 SHEET_NAME = os.getenv("SHEET_NAME")  # Name of the worksheet in your Google Sheet
+SWEEP_CONCURRENCY = int(os.getenv("SWEEP_CONCURRENCY", "8"))  # Max wallets swept in parallel
+SWEEP_MODE = os.getenv("SWEEP_MODE", "full")  # "full" visits every enabled wallet, "deposits" only wallets with new USDC
+MIN_SWEEP_USDC = 8.0  # Minimum transfer amount
+CONFIRM_POLL_INTERVAL = 2  # Seconds between block number checks while confirming
+CONFIRM_MAX_BACKOFF = 30  # Longest wait between polls while the node keeps erroring
+CONFIRM_DEADLINE = 900  # Seconds after which still unresolved transfers are given up
+GAS_LIMIT_BUFFER = 1.2  # Gas limit sent = estimate * this
+READ_ATTEMPTS = 3  # Tries per node read while preparing a transfer
+READ_RETRY_DELAY = 0.5  # Seconds, doubled after each failed read
+
 
+# Sheets ledger: rows are spooled locally and appended in batches (see sheets_logger.py)
+sheet_logger = SheetLogger(SHEET_ID, SHEET_NAME, "sheets_spool.jsonl")
 
 def log_transaction(transaction_data):
     try:
-        # Authenticate with Google Sheets API
-        creds = Credentials.from_service_account_file(CREDS_FILE, scopes=SCOPES)
-        client = gspread.authorize(creds)
-
-        # Open the Google Sheet
-        spreadsheet = client.open_by_key(SHEET_ID)
-        worksheet = spreadsheet.worksheet(SHEET_NAME)
-
-        # Prepare transaction data (example format)
-        # Assuming transaction_data is a dict like: {"amount": 100.50, "recipient": "John Doe", "status": "Success"}
-        row = [
-            datetime.datetime.now().isoformat(),  # Timestamp
-            transaction_data.get("recipient", ""),
-            transaction_data.get("email", ""),
-            transaction_data.get("address", ""),
-            transaction_data.get("amount", ""),
-            transaction_data.get("gasUSD", ""),
-        ]
-
-        # Append the row to the Google Sheet
-        worksheet.append_row(row)
-        logging.info("Transaction logged successfully!")
-
+        sheet_logger.log(transaction_row(transaction_data))
     except Exception as e:
         logging.info(f"Error logging transaction: {e}")
 
-# Ethereum configuration
-MAINNET_RPC_URL = f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"
-USDC_CONTRACT_ADDRESS = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
-USDC_ABI = [
-    {
-        "constant": True,
-        "inputs": [{"name": "_owner", "type": "address"}],
-        "name": "balanceOf",
-        "outputs": [{"name": "balance", "type": "uint256"}],
-        "type": "function",
-    },
-    {
-        "constant": False,
-        "inputs": [{"name": "_to", "type": "address"}, {"name": "_value", "type": "uint256"}],
-        "name": "transfer",
-        "outputs": [{"name": "", "type": "bool"}],
-        "type": "function",
-    },
-]
-
-
-
-# Setup Web3 and Contract
-web3 = Web3(Web3.HTTPProvider(MAINNET_RPC_URL))
-cg = CoinGeckoAPI()
-USDC_CONTRACT = web3.eth.contract(address=web3.to_checksum_address(USDC_CONTRACT_ADDRESS), abi=USDC_ABI)
+# Setup Web3 and Contract (shared, pooled provider)
+web3 = get_web3()
+USDC_CONTRACT = get_usdc_contract()
 MASTER_WALLET_ADDRESS = web3.to_checksum_address(KRAKEN_ADDRESS)
 
 def convertEthToUSD(balance_eth):
     """Get the ETH balance of an address in USD."""
     try:
-        eth_price_data = cg.get_price(ids='ethereum', vs_currencies='usd')
-        eth_price_usd = eth_price_data['ethereum']['usd']
-        balance_usd = float(balance_eth) * eth_price_usd
-
-        return balance_usd
+        return eth_to_usd(balance_eth)
     except Exception as e:
         logging.error(f"Error getting balance for USD of {balance_eth} ETH: {str(e)}")
         return 0.0
@@ -104,7 +67,8 @@ def get_balance(address):
     return USDC_CONTRACT.functions.balanceOf(address).call()
 
 def get_nonce(address):
-    return web3.eth.get_transaction_count(address, 'latest')
+    # Local nonce tracking, the node is only asked on first use of an address
+    return get_nonce_manager().next_nonce(address)
 
 def estimate_gas(address, balance): #, nonce
     return USDC_CONTRACT.functions.transfer(MASTER_WALLET_ADDRESS, balance).estimate_gas({"from": address})
@@ -112,14 +76,15 @@ def estimate_gas(address, balance): #, nonce
 
 def build_transaction(address, nonce, gas, balance, attempt):
     try:
-        gas_price = web3.eth.gas_price
-        logging.info(f"Current gas price (wei): {gas_price}")
-        # Use a multiplier for gas price to account for network fluctuations
-        adjusted_gas_price = int(gas_price * 1.1 * (1 + attempt * 0.4))  # Increase gas price with each attempt 20%
-        logging.info(f"Adjusted gas price for attempt {attempt}: {adjusted_gas_price}")
-        total_gas_cost_eth = web3.from_wei(gas * adjusted_gas_price, 'ether')
+        # Fees come from the shared per-block oracle, each retry bumps them enough to replace the previous attempt
+        fees = get_fee_oracle().suggest(multiplier=REPLACEMENT_BUMP ** attempt)
+        max_fee = fees["maxFeePerGas"]
+        logging.info(f"Fees for attempt {attempt}: max fee {max_fee} wei, priority fee {fees['maxPriorityFeePerGas']} wei")
+        # The node requires the balance to cover the worst case, gas limit * maxFeePerGas
+        gas_limit = int(gas * GAS_LIMIT_BUFFER)
+        total_gas_cost_eth = web3.from_wei(gas_limit * max_fee, 'ether')
 
-        logging.info(f"Building transaction for {address} with balance {balance} USDC, gas: {gas}, adjusted gas price: {adjusted_gas_price}, total cost in ETH: {total_gas_cost_eth}")
+        logging.info(f"Building transaction for {address} with balance {balance} USDC, gas limit: {gas_limit}, max fee: {max_fee}, max total cost in ETH: {total_gas_cost_eth}")
 
         #Check eth
         address = web3.to_checksum_address(address)
@@ -136,8 +101,9 @@ def build_transaction(address, nonce, gas, balance, attempt):
         return USDC_CONTRACT.functions.transfer(MASTER_WALLET_ADDRESS, balance).build_transaction(
             {
                 "chainId": 1,
-                "gas": int(gas * 1.2),  # 20% buffer for gas limit
-                "gasPrice": adjusted_gas_price,
+                "gas": gas_limit,
+                "maxFeePerGas": max_fee,
+                "maxPriorityFeePerGas": fees["maxPriorityFeePerGas"],
                 "nonce": nonce
             })
     except Exception as e:
@@ -150,68 +116,340 @@ def sign_transaction(tx, private_key):
 def send_transaction(signed_tx):
     return web3.eth.send_raw_transaction(signed_tx.raw_transaction)
 
-def wait_for_receipt(tx_hash):
-    return web3.eth.wait_for_transaction_receipt(tx_hash, 120)
-# Core transfer logic
-def transfer_usdc(wallet, max_attempts=3):
+def get_receipts_batch(tx_hashes):
+    """Fetch receipts for many transactions in one JSON-RPC batch request.
+
+    Returns {tx_hash_hex: receipt} for mined transactions only, with status, gasUsed and
+    effectiveGasPrice as ints. Falls back to one request per hash if batching fails; a hash
+    whose lookup errors is treated as not mined yet and asked for again on the next poll.
+    """
+    receipts = {}
+    if not tx_hashes:
+        return receipts
+    try:
+        responses = web3.provider.make_batch_request(
+            [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes])
+        if not isinstance(responses, list):
+            raise ValueError(responses.get("error", responses))
+        for tx_hash, response in zip(tx_hashes, responses):
+            receipt = response.get("result")
+            if receipt:
+                receipts[tx_hash] = {
+                    "status": int(receipt["status"], 16),
+                    "gasUsed": int(receipt["gasUsed"], 16),
+                    "effectiveGasPrice": int(receipt["effectiveGasPrice"], 16),
+                }
+    except Exception as e:
+        logging.warning(f"Batched receipt request failed ({str(e)}), polling receipts one by one")
+        for tx_hash in tx_hashes:
+            try:
+                receipt = web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            except Exception as e:
+                logging.warning(f"Receipt lookup for {tx_hash} failed ({str(e)}), checking again next poll")
+                continue
+            receipts[tx_hash] = {
+                "status": receipt["status"],
+                "gasUsed": receipt["gasUsed"],
+                "effectiveGasPrice": receipt["effectiveGasPrice"],
+            }
+    return receipts
+
+class ConfirmationTracker:
+    """Single polling loop that confirms every broadcast sweep transaction.
+
+    Once per new block all outstanding receipts are fetched with one batched request,
+    replacing one wait_for_transaction_receipt loop per transaction. A transfer may have
+    several hashes (gas-bumped replacements share a nonce); whichever is mined settles it.
+    RPC errors while polling are retried with backoff; transfers still unresolved after
+    deadline seconds are given up with on_failure(..., give_up=True).
+    """
+    def __init__(self, timeout=120, poll_interval=None, deadline=CONFIRM_DEADLINE):
+        self.timeout = timeout
+        self.poll_interval = poll_interval or CONFIRM_POLL_INTERVAL
+        self.deadline = deadline
+        self.outstanding = {}  # tx_hash hex -> transfer dict
+
+    def add(self, transfer):
+        transfer["sent_at"] = time.time()
+        self.outstanding[transfer["tx_hashes"][-1]] = transfer
+
+    def _settle(self, transfer):
+        for tx_hash in transfer["tx_hashes"]:
+            self.outstanding.pop(tx_hash, None)
+
+    def _transfers(self):
+        return {id(t): t for t in self.outstanding.values()}.values()
+
+    def run(self, on_success, on_failure):
+        last_block = None
+        errors = 0
+        give_up_at = time.time() + self.deadline
+        while self.outstanding:
+            if time.time() > give_up_at:
+                logging.error(f"Giving up on {len(self.outstanding)} unresolved sweep transactions after {self.deadline}s: "
+                              f"{', '.join(self.outstanding)}")
+                for transfer in list(self._transfers()):
+                    self._settle(transfer)
+                    on_failure(transfer, f"Unresolved after {self.deadline}s. Tx: {', '.join(transfer['tx_hashes'])}",
+                               retry=True, give_up=True)
+                break
+            try:
+                block = web3.eth.block_number
+                if block == last_block:
+                    time.sleep(self.poll_interval)
+                    continue
+                receipts = get_receipts_batch(list(self.outstanding))
+            except Exception as e:
+                errors += 1
+                wait = min(self.poll_interval * 2 ** errors, CONFIRM_MAX_BACKOFF)
+                logging.warning(f"Confirmation poll failed ({str(e)}), retrying in {wait}s")
+                time.sleep(wait)
+                continue
+            errors = 0
+            last_block = block
+
+            for tx_hash, receipt in receipts.items():
+                transfer = self.outstanding.get(tx_hash)
+                if transfer is None:  # Already settled by another hash of the same transfer
+                    continue
+                self._settle(transfer)
+                if receipt["status"] == 1:
+                    on_success(transfer, tx_hash, receipt)
+                else:
+                    on_failure(transfer, f"Transaction failed. Tx: {tx_hash}", retry=False)
+
+            now = time.time()
+            for transfer in list(self._transfers()):
+                if now - transfer["sent_at"] > self.timeout:
+                    self._settle(transfer)
+                    on_failure(transfer, f"Not mined after {self.timeout}s", retry=True)
+
+# Phase 1: read balance and decide whether the wallet needs sweeping
+# Returns "skipped", "failed" or a transfer dict ready to broadcast
+def with_read_retries(read, *args):
+    """read(*args), retried READ_ATTEMPTS times so one failed RPC call does not fail the wallet."""
+    for attempt in range(READ_ATTEMPTS):
+        try:
+            return read(*args)
+        except Exception as e:
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+            logging.warning(f"{read.__name__} failed ({str(e)}), retrying")
+            time.sleep(READ_RETRY_DELAY * 2 ** attempt)
+
+def prepare_transfer(wallet, balance=None):
+    """Check the wallet's USDC and gas estimate. balance (raw units) skips the balanceOf call
+    when it was already read, e.g. by the batched pre-filter."""
     try:
         address = web3.to_checksum_address(wallet["address"])
-        balance = get_balance(address)
+        if balance is None:
+            balance = with_read_retries(get_balance, address)
 
         if balance == 0:
             logging.info(f"No USDC in wallet {address}")
-            return
+            return "skipped"
         balance_usdc = balance / 10**6  # Convert to USDC (6 decimals)
         logging.info(f"Wallet {address} has {balance_usdc:.6f} USDC")
 
-        if balance_usdc < 8.0:  # Minimum transfer amount
+        if balance_usdc < MIN_SWEEP_USDC:
             logging.info(f"Skipping transfer for {address} due to low balance: {balance_usdc:.6f} USDC")
-            return
-        nonce = get_nonce(address)
-        gas_estimate = estimate_gas(address, balance) #, nonce
-        for attempt in range(max_attempts):
-            try:
-                time.sleep(1)
-                tx = build_transaction(address, nonce, gas_estimate, balance, attempt)
-                if not tx:
-                    logging.error(f"Failed to build transaction for {address}. Insufficient ETH for gas.")
-                    return
-                signed_tx = sign_transaction(tx, wallet["private_key"])
-                time.sleep(1)  # Wait a bit before sending to avoid nonce issues
-                tx_hash = send_transaction(signed_tx)
-                time.sleep(1)  # Wait a bit before checking receipt should fix the failed transaction but actually went through
-                receipt = wait_for_receipt(tx_hash)
-                if receipt["status"] == 1:
-                    logging.info(f"Transferred {balance_usdc:.6f} USDC from {address} to {MASTER_WALLET_ADDRESS}. Tx: {tx_hash.hex()}")
-                    #'''
-                    log_transaction({
-                    "recipient": wallet.get("name", "Unknown"),
-                    "email": wallet.get("email", "Unknown"),
-                    "address": address,
-                    "amount": balance_usdc,
-                    "gasUSD": convertEthToUSD(receipt['gasUsed'] * receipt['effectiveGasPrice'] / 10**18)  # Convert gas cost to USD
-                    })
-                    #'''
-                    return
-                else:
-                    logging.error(f"Transaction failed for {address}. Tx: {tx_hash.hex()}")
-                    return
-            except Exception as e:
-                if attempt == max_attempts - 1:
-                    logging.error(f"Failed to transfer from {address} after {max_attempts} attempts: {str(e)}")
-                    return
-                logging.warning(f"Retrying transfer for {address} (attempt {attempt + 1}) due to error: {str(e)}")
-                time.sleep(2 ** attempt)
+            return "skipped"
+        gas_estimate = with_read_retries(estimate_gas, address, balance)
+        return {
+            "wallet": wallet,
+            "address": address,
+            "balance": balance,
+            "balance_usdc": balance_usdc,
+            "nonce": with_read_retries(get_nonce, address),
+            "gas_estimate": gas_estimate,
+            "attempt": 0,
+            "tx_hashes": [],
+        }
     except Exception as e:
         logging.error(f"Error processing wallet {wallet.get('address', 'unknown')}: {str(e)}")
         logging.error(traceback.format_exc())
-
-def main():
+        return "failed"
+
+# Build, sign and send the transfer for its current attempt (gas price rises per attempt)
+# Returns True once the transaction is broadcast, False if the transfer is given up
+def broadcast_transfer(transfer, max_attempts=3):
+    address = transfer["address"]
+    while transfer["attempt"] < max_attempts:
+        attempt = transfer["attempt"]
+        try:
+            tx = build_transaction(address, transfer["nonce"], transfer["gas_estimate"], transfer["balance"], attempt)
+            if not tx:
+                logging.error(f"Failed to build transaction for {address}. Insufficient ETH for gas.")
+                return False
+            signed_tx = sign_transaction(tx, transfer["wallet"]["private_key"])
+            try:
+                tx_hash = send_transaction(signed_tx)
+            except Exception as e:
+                if not is_known_transaction_error(e):
+                    raise
+                tx_hash = signed_tx.hash  # This exact transaction is already in the mempool
+            get_nonce_manager().record(address, transfer["nonce"], tx["gas"] * tx["maxFeePerGas"])
+            transfer["tx_hashes"].append("0x" + bytes(tx_hash).hex())
+            logging.info(f"Broadcast sweep of {transfer['balance_usdc']:.6f} USDC from {address} (attempt {attempt}). Tx: {transfer['tx_hashes'][-1]}")
+            return True
+        except Exception as e:
+            if not transfer["tx_hashes"] and is_stale_nonce_error(e) and transfer.get("resyncs", 0) < NONCE_RESYNC_ATTEMPTS:
+                # Another process used this nonce, nothing of ours is pending on it yet
+                transfer["resyncs"] = transfer.get("resyncs", 0) + 1
+                logging.warning(f"Nonce {transfer['nonce']} for {address} is already used ({str(e)}), resyncing with the node")
+                transfer["nonce"] = get_nonce_manager().resync(address)
+                continue
+            transfer["attempt"] += 1
+            if transfer["attempt"] >= max_attempts:
+                logging.error(f"Failed to transfer from {address} after {max_attempts} attempts: {str(e)}")
+                return False
+            logging.warning(f"Retrying transfer for {address} (attempt {transfer['attempt']}) due to error: {str(e)}")
+            time.sleep(2 ** attempt)
+    return False
+
+def sweep_wallets(wallets, max_workers=SWEEP_CONCURRENCY, max_attempts=3, job=None, balances=None):
+    """Sweep wallets in two phases and return a summary dict.
+
+    Phase 1 prepares and broadcasts every transfer on a bounded thread pool; wallets are
+    independent, so a failure in one worker is recorded against that wallet only.
+    Phase 2 confirms all broadcast transfers with a single ConfirmationTracker, which
+    logs successes to Sheets and re-broadcasts timed out transfers with a higher gas price.
+    job (a jobs.Job) gets per-wallet progress; once it is cancelled no new transfers are
+    broadcast, but the ones already sent are still confirmed. balances maps checksum
+    addresses to already known raw USDC balances. summary["failed_stages"] counts failures
+    by the stage they happened in (prepare, broadcast, confirm or worker).
+    """
+    summary = {"swept": 0, "skipped": 0, "failed": 0, "failed_wallets": [],
+               "failed_stages": {"prepare": 0, "broadcast": 0, "confirm": 0, "worker": 0}}
+    started = time.time()
+    if job:
+        job.set_total(len(wallets))
+
+    def record_failure(address, stage):
+        summary["failed"] += 1
+        summary["failed_stages"][stage] += 1
+        summary["failed_wallets"].append(address)
+        if job:
+            job.advance("failed")
+
+    def prepare_and_broadcast(wallet):
+        # Returns (result, stage): a transfer to confirm, or "skipped"/"failed" and the failed stage
+        if job and job.cancelled():
+            return "skipped", None
+        balance = balances.get(web3.to_checksum_address(wallet["address"])) if balances else None
+        transfer = prepare_transfer(wallet, balance)
+        if isinstance(transfer, str):
+            return transfer, "prepare"
+        if broadcast_transfer(transfer, max_attempts):
+            return transfer, None
+        get_nonce_manager().release(transfer["address"], transfer["nonce"])  # Never broadcast
+        return "failed", "broadcast"
+
+    tracker = ConfirmationTracker()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(prepare_and_broadcast, wallet): wallet for wallet in wallets}
+        for future in as_completed(futures):
+            wallet = futures[future]
+            try:
+                result, stage = future.result()
+            except Exception as e:
+                logging.error(f"Sweep worker crashed for {wallet.get('address', 'unknown')}: {str(e)}")
+                result, stage = "failed", "worker"
+            if result == "skipped":
+                summary["skipped"] += 1
+                if job:
+                    job.advance("skipped")
+            elif result == "failed":
+                record_failure(wallet.get("address", "unknown"), stage)
+            else:
+                tracker.add(result)
+    logging.info(f"Broadcast phase finished in {time.time() - started:.2f}s, confirming {len(tracker.outstanding)} transfers")
+
+    def on_success(transfer, tx_hash, receipt):
+        summary["swept"] += 1
+        SWEEP_USDC.inc(transfer["balance_usdc"])
+        if job:
+            job.advance("succeeded")
+        address = transfer["address"]
+        get_nonce_manager().confirm(address, transfer["nonce"])
+        logging.info(f"Transferred {transfer['balance_usdc']:.6f} USDC from {address} to {MASTER_WALLET_ADDRESS}. Tx: {tx_hash}")
+        log_transaction({
+            "recipient": transfer["wallet"].get("name", "Unknown"),
+            "email": transfer["wallet"].get("email", "Unknown"),
+            "address": address,
+            "amount": transfer["balance_usdc"],
+            "gasUSD": convertEthToUSD(receipt['gasUsed'] * receipt['effectiveGasPrice'] / 10**18)  # Convert gas cost to USD
+        })
+
+    def on_failure(transfer, reason, retry, give_up=False):
+        address = transfer["address"]
+        if retry and not give_up and transfer["attempt"] + 1 < max_attempts:
+            transfer["attempt"] += 1
+            logging.warning(f"Retrying transfer for {address} (attempt {transfer['attempt']}): {reason}")
+            broadcast = broadcast_transfer(transfer, max_attempts)
+            if broadcast or transfer["tx_hashes"]:
+                # Keep watching earlier hashes too, the original transaction may still be mined
+                tracker.add(transfer)
+                for tx_hash in transfer["tx_hashes"]:
+                    tracker.outstanding[tx_hash] = transfer
+                return
+        logging.error(f"Transfer from {address} failed: {reason}")
+        if retry:
+            # Gave up on a transaction that may still be pending, resync before this address is used again
+            get_nonce_manager().reset(address)
+        else:
+            get_nonce_manager().confirm(address, transfer["nonce"])  # Mined but reverted, nonce is used
+        record_failure(address, "confirm")
+
+    tracker.run(on_success, on_failure)
+    sheet_logger.flush()
+    summary["seconds"] = round(time.time() - started, 2)
+    SWEEP_DURATION.observe(time.time() - started)
+    for outcome in ("swept", "skipped", "failed"):
+        SWEEP_WALLETS.inc(summary[outcome], outcome=outcome)
+    return summary
+
+def select_deposit_candidates(wallets, indexer):
+    """Wallets worth sweeping in deposits mode, with their raw USDC balances.
+
+    Candidates are wallets with a deposit indexed since the last sweep plus wallets whose
+    indexed balance is still over the minimum (e.g. a failed earlier sweep). One batched
+    Multicall3 read then drops candidates under MIN_SWEEP_USDC, so only wallets that will
+    actually be swept reach the transfer pipeline. Returns (wallets, balances, synced_block).
+    """
+    by_address = {web3.to_checksum_address(w["address"]): w for w in wallets}
+    sync = indexer.sync(addresses=list(by_address))
+    last_sweep_block = indexer.get_state("last_sweep_block", 0)
+    min_raw = int(MIN_SWEEP_USDC * 10**6)
+
+    candidates = indexer.addresses_with_deposits_since(last_sweep_block)
+    candidates.update(a for a, usdc_raw in indexer.balances().items() if usdc_raw >= min_raw)
+    candidates &= by_address.keys()
+    logging.info(f"Deposit sweep: {len(candidates)} of {len(by_address)} wallets had deposits or balance since block {last_sweep_block}")
+    if not candidates:
+        return [], {}, sync["to_block"]
+
+    # Pre-filter on live balances at one block, deposits in the last CONFIRMATIONS blocks are picked up next run
+    _, live = get_balances_batch(sorted(candidates), USDC_CONTRACT, web3)
+    balances = {a: live[a][0] for a in candidates if a in live and live[a][0] >= min_raw}
+    logging.info(f"Deposit sweep: {len(balances)} wallets at or above {MIN_SWEEP_USDC} USDC")
+    return [by_address[a] for a in sorted(balances, key=lambda a: by_address[a].get("index", 0))], balances, sync["to_block"]
+
+def main(max_workers=SWEEP_CONCURRENCY, job=None, mode=None):
     # Check Web3 connectivity
-    if not web3.is_connected():
+    try:
+        ensure_connected()
+    except ConnectionError:
         logging.error("Failed to connect to Ethereum network via Infura")
         return False
 
+    # Send ledger rows left over from an earlier run (quota errors or a crash)
+    if sheet_logger.pending():
+        logging.info(f"Flushing {sheet_logger.pending()} spooled Sheets rows from a previous run")
+        sheet_logger.flush()
+
     # Gather and validate wallets
     logging.info("Gathering wallets")
     wallets = get_wallets()
@@ -223,11 +461,30 @@ def main():
     valid_wallets = [w for w in wallets if w.get("enabled", False)]
     logging.info(f"Found {len(valid_wallets)} valid and enabled wallets")
 
-    for wallet in valid_wallets:
-        transfer_usdc(wallet)
-    logging.info("USDC sweep completed")
+    mode = mode or SWEEP_MODE
+    if mode == "deposits":
+        with DepositIndexer() as indexer:
+            valid_wallets, balances, synced_block = select_deposit_candidates(valid_wallets, indexer)
+            if job:
+                job.set_message(f"Sweeping {len(valid_wallets)} wallets with new deposits")
+            summary = sweep_wallets(valid_wallets, max_workers=max_workers, job=job, balances=balances)
+            # Failed wallets keep their indexed balance, so they are candidates again next run
+            indexer.set_state("last_sweep_block", synced_block)
+    else:
+        if job:
+            job.set_message(f"Sweeping {len(valid_wallets)} enabled wallets")
+        summary = sweep_wallets(valid_wallets, max_workers=max_workers, job=job)
+    logging.info(f"USDC sweep ({mode}) completed in {summary['seconds']}s with {max_workers} workers: "
+                 f"{summary['swept']} swept, {summary['skipped']} skipped, {summary['failed']} failed")
+    if summary["failed_wallets"]:
+        logging.warning(f"Failed wallets: {', '.join(summary['failed_wallets'])}")
     return True
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sweep USDC from user wallets to the main wallet")
+    parser.add_argument("--mode", choices=["full", "deposits"], default=SWEEP_MODE,
+                        help="full: every enabled wallet, deposits: only wallets with deposits since the last sweep")
+    args = parser.parse_args()
     logging.info("Starting USDC sweep script")
-    result = main()
+    result = main(mode=args.mode)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from web3 import Web3
+import provider
+import fees
+import nonces
+from sim_chain import SimulatedChain, SimulatedProvider
+
+
+@pytest.fixture
+def sim_web3(monkeypatch):
+    """sim_web3(**chain_kwargs) puts a fresh SimulatedChain behind the shared Web3, fee oracle
+    and nonce manager and returns that Web3 (chain: web3.provider.chain). Undone after the test."""
+    def make(**chain_kwargs):
+        chain_kwargs.setdefault("seed", 1)
+        web3 = Web3(SimulatedProvider(SimulatedChain(**chain_kwargs)))
+        monkeypatch.setattr(provider, "_web3", web3)
+        monkeypatch.setattr(provider, "_usdc_contract", None)
+        monkeypatch.setattr(provider, "_last_health_check", 0.0)
+        monkeypatch.setattr(fees, "_oracle", fees.FeeOracle(web3=web3))
+        monkeypatch.setattr(nonces, "_manager", nonces.NonceManager(web3=web3))
+        return web3
+    return make
@@ -0,0 +1,81 @@
+import threading
+import pytest
+from web3 import Web3
+import balance_cache
+from funcs import get_balances_batch
+
+
+@pytest.fixture
+def fleet(sim_web3, monkeypatch):
+    web3 = sim_web3()
+    chain = web3.provider.chain
+    wallets = []
+    for i in range(5):
+        address = Web3.to_checksum_address(f"0x{i + 1:040x}")
+        chain.fund(address, eth_wei=10**15, usdc_raw=(i + 1) * 10**6)
+        wallets.append({"name": f"User {i}", "address": address})
+
+    reads = []  # (addresses, block_number) passed to get_balances_batch
+    broken = set()  # Addresses whose read fails
+    def batch(addresses, usdc_contract, web3, block_number=None):
+        reads.append((list(addresses), block_number))
+        block_number, balances = get_balances_batch(addresses, usdc_contract, web3, block_number=block_number)
+        return block_number, {a: b for a, b in balances.items() if a not in broken}
+    monkeypatch.setattr(balance_cache, "get_balances_batch", batch)
+    monkeypatch.setattr(balance_cache, "get_wallets", lambda: list(wallets))
+    return wallets, reads, broken, web3
+
+
+def test_failed_read_is_unknown_and_not_refreshed_per_page_load(fleet):
+    wallets, reads, broken, web3 = fleet
+    broken.add(wallets[1]["address"])
+    cache = balance_cache.BalanceCache(web3=web3)
+
+    rows = cache.wallet_balances(wallets)["wallets"]
+    assert rows[0]["USDC"] == 1
+    assert rows[1]["USDC"] is None and rows[1]["ETH"] is None  # Unknown, not 0
+    assert len(reads) == 1
+
+    for _ in range(3):
+        cache.wallet_balances(wallets)
+    assert len(reads) == 1  # The failed wallet waits for the next background refresh
+
+
+def test_new_wallet_is_read_on_its_own_at_the_snapshot_block(fleet):
+    wallets, reads, broken, web3 = fleet
+    cache = balance_cache.BalanceCache(web3=web3)
+    cache.wallet_balances(wallets[:4])
+    assert len(reads[0][0]) == 5  # First snapshot covers the whole fleet
+
+    new_wallet = {"name": "New", "address": Web3.to_checksum_address("0x" + "ab" * 20)}
+    result = cache.wallet_balances(wallets + [new_wallet])
+    assert reads[1:] == [([new_wallet["address"]], cache.block_number)]
+    assert result["wallets"][-1]["USDC"] == 0 and result["wallets"][3]["USDC"] == 4
+
+
+def test_forced_refresh_does_not_reuse_a_read_started_before_it(fleet, monkeypatch):
+    wallets, reads, broken, web3 = fleet
+    cache = balance_cache.BalanceCache(web3=web3)
+    read_started, release = threading.Event(), threading.Event()
+    batch = balance_cache.get_balances_batch
+    def slow_first_read(*args, **kwargs):
+        if not read_started.is_set():
+            read_started.set()
+            release.wait(5)
+        return batch(*args, **kwargs)
+    monkeypatch.setattr(balance_cache, "get_balances_batch", slow_first_read)
+
+    background = threading.Thread(target=cache.refresh)
+    background.start()
+    read_started.wait(5)
+    web3.provider.chain.fund(wallets[0]["address"], usdc_raw=10**6)  # Lands after the background read began
+
+    forced = []
+    click = threading.Thread(target=lambda: forced.append(cache.wallet_balances(wallets, force=True)))
+    click.start()
+    release.set()
+    background.join(5)
+    click.join(5)
+
+    assert len(reads) == 2  # The click read again instead of reusing the older snapshot
+    assert forced[0]["wallets"][0]["USDC"] == 2
@@ -0,0 +1,61 @@
+from web3 import Web3
+from funcs import get_balances_batch, _get_balances_per_wallet
+from provider import USDC_CONTRACT_ADDRESS, USDC_ABI
+from sim_chain import SimulatedChain, SimulatedProvider
+
+
+def make_fleet(count):
+    chain = SimulatedChain(seed=1)
+    addresses = [Web3.to_checksum_address(f"0x{i + 1:040x}") for i in range(count)]
+    for i, address in enumerate(addresses):
+        chain.fund(address, eth_wei=i * 10**12, usdc_raw=i * 10**6)
+    provider = SimulatedProvider(chain)
+    web3 = Web3(provider)
+    usdc = web3.eth.contract(address=USDC_CONTRACT_ADDRESS, abi=USDC_ABI)
+    return addresses, provider, web3, usdc
+
+
+def test_one_eth_call_per_chunk():
+    addresses, provider, web3, usdc = make_fleet(600)
+    provider.reset_counters()
+    block_number, balances = get_balances_batch(addresses, usdc, web3, chunk_size=250)
+
+    assert provider.calls["eth_call"] == 3  # 600 wallets in chunks of 250
+    assert provider.calls["eth_getBalance"] == 0
+    batch_calls = sum(provider.calls.values())
+    assert len(balances) == 600
+    assert balances[addresses[7]] == (7 * 10**6, 7 * 10**12)
+
+    # Same snapshot one wallet at a time: two calls per wallet
+    provider.reset_counters()
+    per_wallet = _get_balances_per_wallet(addresses, usdc, web3, block_number)
+    assert per_wallet == balances
+    assert provider.calls["eth_call"] + provider.calls["eth_getBalance"] == 2 * 600
+    assert sum(provider.calls.values()) >= 100 * batch_calls
+
+
+class FlakyProvider(SimulatedProvider):
+    """Answers the first failures eth_calls with an error."""
+    def __init__(self, chain, failures):
+        super().__init__(chain)
+        self.failures = failures
+
+    def _respond(self, method, params, request_id):
+        if method == "eth_call" and self.failures:
+            self.failures -= 1
+            self.calls[method] += 1
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": "upstream error"}}
+        return super()._respond(method, params, request_id)
+
+
+def test_failed_chunk_is_retried_not_split_per_wallet():
+    addresses, provider, _, _ = make_fleet(500)
+    flaky = FlakyProvider(provider.chain, failures=1)
+    web3 = Web3(flaky)
+    usdc = web3.eth.contract(address=USDC_CONTRACT_ADDRESS, abi=USDC_ABI)
+
+    _, balances = get_balances_batch(addresses, usdc, web3, chunk_size=250)
+
+    assert len(balances) == 500
+    assert flaky.calls["eth_call"] == 3  # Two chunks plus one retry
+    assert flaky.calls["eth_getBalance"] == 0
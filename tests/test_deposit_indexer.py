@@ -0,0 +1,37 @@
+import time
+from web3 import Web3
+import deposit_indexer
+from deposit_indexer import DepositIndexer
+from funcs import get_balances_batch
+
+BLOCK_TIME = 0.05
+
+
+def test_failed_seed_read_is_retried_on_next_sync(sim_web3, tmp_path, monkeypatch):
+    web3 = sim_web3(block_time=BLOCK_TIME)
+    chain = web3.provider.chain
+    ok, flaky = (Web3.to_checksum_address(f"0x{i:040x}") for i in (1, 2))
+    chain.fund(ok, usdc_raw=5 * 10**6)
+    chain.fund(flaky, usdc_raw=7 * 10**6)
+    time.sleep(BLOCK_TIME * 2)
+
+    failing = {flaky}
+    def batch(addresses, usdc_contract, web3, block_number=None):
+        block_number, balances = get_balances_batch(addresses, usdc_contract, web3, block_number=block_number)
+        return block_number, {a: b for a, b in balances.items() if a not in failing}
+    monkeypatch.setattr(deposit_indexer, "get_balances_batch", batch)
+
+    with DepositIndexer(db_file=str(tmp_path / "deposits.db"), web3=web3, confirmations=0) as indexer:
+        indexer.sync([ok, flaky])
+        assert indexer.balance(ok) == 5 * 10**6
+        assert indexer.balance(flaky) is None  # Not seeded as 0
+
+        failing.clear()
+        indexer.sync([ok, flaky])
+        assert indexer.balance(flaky) == 7 * 10**6
+
+        # Tracked from now on, later deposits come from the Transfer logs
+        chain.fund(flaky, usdc_raw=10**6)
+        time.sleep(BLOCK_TIME * 2)
+        indexer.sync([ok, flaky])
+        assert indexer.balance(flaky) == 8 * 10**6
@@ -0,0 +1,47 @@
+import pytest
+from web3 import Web3
+import fees
+from sim_chain import SimulatedChain, SimulatedProvider
+
+
+class FailingFeeHistory(SimulatedProvider):
+    """Answers the next `failures` eth_feeHistory calls with an error."""
+    def __init__(self, chain):
+        super().__init__(chain)
+        self.failures = 0
+
+    def _respond(self, method, params, request_id):
+        if method == "eth_feeHistory" and self.failures:
+            self.failures -= 1
+            self.calls[method] += 1
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": "simulated upstream error"}}
+        return super()._respond(method, params, request_id)
+
+
+@pytest.fixture
+def oracle(monkeypatch):
+    monkeypatch.setattr(fees, "REFRESH_RETRY_DELAY", 0)
+    provider = FailingFeeHistory(SimulatedChain(block_time=0.05, seed=1))
+    return fees.FeeOracle(web3=Web3(provider)), provider
+
+
+def test_transient_error_is_retried(oracle):
+    oracle, provider = oracle
+    provider.failures = fees.REFRESH_ATTEMPTS - 1
+    assert oracle.suggest()["maxFeePerGas"] > 0
+    assert provider.calls["eth_feeHistory"] == fees.REFRESH_ATTEMPTS
+
+
+def test_falls_back_to_the_last_snapshot(oracle):
+    oracle, provider = oracle
+    before = oracle.suggest()
+    provider.failures = fees.REFRESH_ATTEMPTS
+    oracle.refresh(force=True)  # Every attempt fails, the old snapshot stays
+    assert oracle.suggest() == before
+
+
+def test_raises_without_any_snapshot(oracle):
+    oracle, provider = oracle
+    provider.failures = fees.REFRESH_ATTEMPTS
+    with pytest.raises(Exception, match="simulated upstream error"):
+        oracle.suggest()
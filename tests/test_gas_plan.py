@@ -0,0 +1,34 @@
+import pytest
+from web3 import Web3
+from funcs import get_balances_batch
+
+ETH_PRICE_USD = 2500.0
+
+
+@pytest.fixture
+def send_out_gas(sim_web3, monkeypatch):
+    web3 = sim_web3()
+    monkeypatch.setenv("KRAKEN_FAKE", "1")
+    import send_out_gas
+    monkeypatch.setattr(send_out_gas, "web3", web3)
+    monkeypatch.setattr(send_out_gas, "get_eth_price_usd", lambda: ETH_PRICE_USD)
+    return send_out_gas, web3.provider.chain
+
+
+def test_wallet_with_failed_balance_read_is_not_refilled(send_out_gas, monkeypatch):
+    module, chain = send_out_gas
+    empty, unread, healthy = (Web3.to_checksum_address(f"0x{i:040x}") for i in (1, 2, 3))
+    chain.fund(healthy, eth_wei=Web3.to_wei(0.01, "ether"))  # $25
+    wallets = [{"address": a, "kraken_nickname": f"Wallet#{i}"} for i, a in enumerate((empty, unread, healthy))]
+
+    def batch(addresses, usdc_contract, web3):
+        block_number, balances = get_balances_batch(addresses, usdc_contract, web3)
+        balances.pop(unread)
+        return block_number, balances
+    monkeypatch.setattr(module, "get_balances_batch", batch)
+
+    plan = module.plan_gas_refills(wallets)
+
+    assert [r["address"] for r in plan["refills"]] == [empty]
+    assert plan["unread"] == [unread]
+    assert plan["checked"] == 2
@@ -0,0 +1,26 @@
+import hashlib
+import hmac
+from eth_account import Account
+import funcs
+
+MNEMONIC = "legal winner thank year wave sausage worth useful legal winner thank yellow"
+
+
+def from_mnemonic(index):
+    Account.enable_unaudited_hdwallet_features()
+    account = Account.from_mnemonic(MNEMONIC, account_path=f"{funcs.ETH_ACCOUNT_PARENT_PATH}/{index}")
+    return account.address, account.key.hex()
+
+
+def test_fast_path_matches_from_mnemonic(monkeypatch):
+    monkeypatch.setattr(funcs, "_fast_derivation_ok", None)
+    assert funcs.derive_accounts(MNEMONIC, 5, 3) == [from_mnemonic(i) for i in range(5, 8)]
+    assert funcs._fast_derivation_ok is True
+
+
+def test_changed_internals_fall_back_to_from_mnemonic(monkeypatch):
+    # An upgrade that changes a helper's output must not change the derived keys
+    monkeypatch.setattr(funcs, "_fast_derivation_ok", None)
+    monkeypatch.setattr(funcs, "hmac_sha512", lambda key, data: hmac.new(key, data, hashlib.sha256).digest() * 2)
+    assert funcs.derive_accounts(MNEMONIC, 0, 2) == [from_mnemonic(0), from_mnemonic(1)]
+    assert funcs._fast_derivation_ok is False
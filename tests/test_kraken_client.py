@@ -0,0 +1,92 @@
+import time
+import pytest
+import kraken_client
+from kraken_client import TokenBucket, KrakenClient, FakeKrakenAPI, WithdrawalScheduler
+
+CAPACITY, RATE = 5, 50.0  # Fast tier so the tests run in well under a second
+
+
+@pytest.fixture(autouse=True)
+def fast_tier(monkeypatch):
+    monkeypatch.setitem(kraken_client.KRAKEN_TIERS, "test", (CAPACITY, RATE))
+
+
+class AlwaysRateLimited:
+    def __init__(self):
+        self.calls = 0
+
+    def query_private(self, method, data=None):
+        self.calls += 1
+        return {"error": ["EAPI:Rate limit exceeded"]}
+
+
+class Unreachable:
+    def __init__(self):
+        self.calls = 0
+
+    def query_private(self, method, data=None):
+        self.calls += 1
+        raise ConnectionError("connection reset")
+
+
+def test_bucket_allows_a_burst_then_throttles_to_the_rate():
+    bucket = TokenBucket(CAPACITY, RATE)
+    assert [bucket.acquire() for _ in range(CAPACITY)] == [0.0] * CAPACITY
+
+    started = time.monotonic()
+    waited = sum(bucket.acquire() for _ in range(10))
+    elapsed = time.monotonic() - started
+    assert waited > 0
+    assert 10 / RATE * 0.8 <= elapsed < 10 / RATE * 3
+
+
+def test_client_stays_under_the_server_limit():
+    api = FakeKrakenAPI(tier="test")
+    client = KrakenClient(api=api, tier="test", backoff_base=0.01)
+    scheduler = WithdrawalScheduler(client)
+    for i in range(30):
+        scheduler.submit(f"0x{i:040x}", f"Wallet#{i}", 0.002, priority=i)
+
+    report = scheduler.run()
+
+    assert report["succeeded"] == 30
+    assert report["rate_limited"] == 0
+    assert api.calls == 30  # Throttled locally, no call wasted on a rate limit error
+    assert [w["key"] for w in api.withdrawals] == [f"Wallet#{i}" for i in range(30)]
+
+
+def test_rate_limit_error_is_retried_after_backoff():
+    api = FakeKrakenAPI(tier="test")
+    api.counter = CAPACITY  # Another process already spent the key's counter
+    client = KrakenClient(api=api, tier="test", backoff_base=0.05)
+
+    response = client.query_private("Withdraw", {"asset": "ETH", "key": "Wallet#1", "amount": "0.002"})
+
+    assert response["error"] == []
+    assert client.stats["rate_limited"] >= 1
+    assert client.stats["retries"] == client.stats["rate_limited"]
+    assert len(api.withdrawals) == 1
+
+
+def test_rate_limit_error_is_returned_after_max_retries():
+    api = AlwaysRateLimited()
+    client = KrakenClient(api=api, tier="test", max_retries=3, backoff_base=0.001)
+
+    response = client.query_private("Withdraw", {})
+
+    assert response["error"] == ["EAPI:Rate limit exceeded"]
+    assert api.calls == 3
+    assert client.stats["retries"] == 2
+
+
+def test_network_error_is_retried_except_for_withdraw():
+    api = Unreachable()
+    client = KrakenClient(api=api, tier="test", max_retries=3, backoff_base=0.001)
+    with pytest.raises(ConnectionError):
+        client.query_private("Balance")
+    assert api.calls == 3
+
+    api.calls = 0
+    with pytest.raises(ConnectionError):
+        client.query_private("Withdraw", {})
+    assert api.calls == 1  # May have gone through, never resent
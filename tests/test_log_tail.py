@@ -0,0 +1,49 @@
+import datetime
+import pytest
+from funcs import CustomFileReader, read_last_n_lines
+
+CASES = [
+    b"",
+    b"\n",
+    b"\n\n",
+    b"one",
+    b"one\n",
+    b"\nfirst line was empty\nlast\n",
+    b"\n\nsecond\n\nfourth",
+    "café ✓\nnaïve\n".encode("utf-8"),
+]
+
+
+@pytest.mark.parametrize("content", CASES)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64 * 1024])
+def test_iter_lines_reverse_matches_tail(tmp_path, content, chunk_size):
+    path = tmp_path / "usdc_transfer.log"
+    path.write_bytes(content)
+    # What tail prints: every line, a final newline does not start another one
+    expected = content.split(b"\n")
+    if expected[-1] == b"":
+        expected.pop()
+    with CustomFileReader(str(path)) as f:
+        assert list(f.iter_lines_reverse(chunk_size)) == expected[::-1]
+
+
+def test_since_keeps_lines_written_slightly_out_of_order(tmp_path):
+    path = tmp_path / "usdc_transfer.log"
+    path.write_text(
+        "2026-10-17 12:00:00,000 - INFO - before\n"
+        "2026-10-17 12:00:10,000 - INFO - daemon\n"
+        "2026-10-17 12:00:08,000 - INFO - cron, flushed late\n"
+        "2026-10-17 12:00:11,000 - INFO - ui\n")
+    since = datetime.datetime(2026, 10, 17, 12, 0, 9)
+    lines = read_last_n_lines(10, str(path), since=since)
+    assert [line.split(" - ")[-1].strip() for line in lines] == ["daemon", "ui"]
+
+    since = datetime.datetime(2026, 10, 17, 12, 0, 5)
+    lines = read_last_n_lines(10, str(path), since=since)
+    assert [line.split(" - ")[-1].strip() for line in lines] == ["daemon", "cron, flushed late", "ui"]
+
+
+def test_no_lines_requested(tmp_path):
+    path = tmp_path / "usdc_transfer.log"
+    path.write_text("2026-10-17 12:00:00,000 - INFO - only\n")
+    assert read_last_n_lines(0, str(path)) == []
@@ -0,0 +1,79 @@
+import time
+import pytest
+from eth_account import Account
+from web3 import Web3
+import nonces
+from sim_chain import SimulatedProvider
+from funcs import transfer_eth_to_enabled_wallet
+
+BLOCK_TIME = 0.1
+
+
+@pytest.fixture
+def chain(sim_web3):
+    return sim_web3(block_time=BLOCK_TIME).provider.chain
+
+
+def wallet(chain, eth):
+    account = Account.create()
+    chain.fund(account.address, eth_wei=Web3.to_wei(eth, "ether"))
+    return {"address": account.address, "private_key": account.key.hex(), "enabled": True}
+
+
+def wait_for_block(chain):
+    block = chain.block_number
+    while chain.rpc("eth_blockNumber", []) == hex(block):
+        time.sleep(BLOCK_TIME / 4)
+    time.sleep(BLOCK_TIME)
+
+
+def test_mined_transfers_stop_reserving_eth(chain):
+    source, destination = wallet(chain, 1), wallet(chain, 0)
+    manager = nonces.get_nonce_manager()
+
+    assert transfer_eth_to_enabled_wallet(source, [source, destination])
+    assert manager.pending_cost(source["address"]) > 0
+    wait_for_block(chain)
+    assert manager.pending_cost(source["address"]) == 0
+
+    # Topped up again: the second consolidation must move the new ETH, not see it as reserved
+    chain.fund(source["address"], eth_wei=Web3.to_wei(0.5, "ether"))
+    received = chain.eth[destination["address"]]
+    assert transfer_eth_to_enabled_wallet(source, [source, destination])
+    wait_for_block(chain)
+    assert chain.eth[destination["address"]] - received > Web3.to_wei(0.49, "ether")
+
+
+def send_from_other_process(chain, sender, nonce):
+    web3 = Web3(SimulatedProvider(chain))
+    signed = web3.eth.account.sign_transaction({
+        "to": sender["address"], "value": 0, "gas": 21000, "nonce": nonce, "chainId": 1,
+        "maxFeePerGas": 10**11, "maxPriorityFeePerGas": 10**9,
+    }, sender["private_key"])
+    web3.eth.send_raw_transaction(signed.raw_transaction)
+
+
+def test_stale_nonce_is_resynced_instead_of_failing(chain):
+    source, destination = wallet(chain, 1), wallet(chain, 0)
+    manager = nonces.get_nonce_manager()
+    manager.release(source["address"], manager.next_nonce(source["address"]))  # Local state says nonce 0 is next
+
+    # The cron sweep (another process) uses nonce 0 and 1 behind our back
+    send_from_other_process(chain, source, 0)
+    send_from_other_process(chain, source, 1)
+    wait_for_block(chain)
+
+    assert transfer_eth_to_enabled_wallet(source, [source, destination])
+    wait_for_block(chain)
+    assert chain.eth[destination["address"]] > 0
+
+
+def test_release_never_goes_below_the_chain(chain):
+    source = wallet(chain, 1)
+    manager = nonces.get_nonce_manager()
+    nonce = manager.next_nonce(source["address"])
+    send_from_other_process(chain, source, nonce)
+    wait_for_block(chain)
+
+    manager.release(source["address"], nonce)
+    assert manager.next_nonce(source["address"]) == nonce + 1
@@ -0,0 +1,35 @@
+import pytest
+from web3 import Web3
+import provider
+
+
+@pytest.fixture
+def sweep_planner(sim_web3, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # Sheets spool and log stay out of the repo
+    monkeypatch.setenv("KRAKEN_ADDRESS", "0x000000000000000000000000000000000000bEEF")
+    web3 = sim_web3(base_fee_gwei=50.0)  # Gas is ~8% of a 100 USDC sweep
+    chain = web3.provider.chain
+    import sweep_planner
+    import sweep_to_main
+    monkeypatch.setattr(sweep_to_main, "web3", web3)
+    monkeypatch.setattr(sweep_to_main, "USDC_CONTRACT", provider.get_usdc_contract())
+    monkeypatch.setattr(sweep_planner, "get_eth_price_usd", lambda: 2500.0)
+    return sweep_planner, chain
+
+
+def test_only_overdue_wallets_are_forced(sweep_planner):
+    module, chain = sweep_planner
+    overdue, waiting = (Web3.to_checksum_address(f"0x{i:040x}") for i in (1, 2))
+    for address in (overdue, waiting):
+        chain.fund(address, usdc_raw=100 * 10**6)
+    wallets = [{"address": overdue}, {"address": waiting}]
+
+    plan = module.plan_sweeps(wallets)
+    assert plan["sweep_now"] == [] and len(plan["deferred"]) == 2
+
+    plan = module.plan_sweeps(wallets, force_addresses={overdue})
+    assert plan["sweep_now"] == [{"address": overdue}]
+    assert plan["deferred"] == [{"address": waiting}]
+
+    plan = module.plan_sweeps(wallets, force=True)
+    assert len(plan["sweep_now"]) == 2
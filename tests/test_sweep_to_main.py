@@ -0,0 +1,54 @@
+import pytest
+from web3 import Web3
+import provider
+from fees import get_fee_oracle
+
+GAS_ESTIMATE = 65000
+
+
+@pytest.fixture
+def sweep_to_main(sim_web3, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # Sheets spool and log stay out of the repo
+    monkeypatch.setenv("KRAKEN_ADDRESS", "0x000000000000000000000000000000000000bEEF")
+    web3 = sim_web3(block_time=60)  # No new block, so the fee suggestion stays the same
+    import sweep_to_main
+    monkeypatch.setattr(sweep_to_main, "web3", web3)
+    monkeypatch.setattr(sweep_to_main, "USDC_CONTRACT", provider.get_usdc_contract())
+    return sweep_to_main, web3.provider.chain
+
+
+@pytest.mark.parametrize("share, builds", [(1.1, False), (1.2, True)])
+def test_eth_check_covers_the_buffered_gas_limit(sweep_to_main, share, builds):
+    module, chain = sweep_to_main
+    address = Web3.to_checksum_address("0x" + "11" * 20)
+    max_fee = get_fee_oracle().suggest()["maxFeePerGas"]
+    chain.fund(address, eth_wei=int(GAS_ESTIMATE * share) * max_fee, usdc_raw=100 * 10**6)
+
+    tx = module.build_transaction(address, 0, GAS_ESTIMATE, 100 * 10**6, 0)
+
+    if builds:
+        assert tx["gas"] == int(GAS_ESTIMATE * module.GAS_LIMIT_BUFFER)
+        assert tx["gas"] * tx["maxFeePerGas"] <= chain.eth[address]
+    else:
+        assert tx is None  # Would be rejected by the node for gas limit * maxFeePerGas
+
+
+def test_prepare_transfer_retries_failed_reads(sweep_to_main, monkeypatch):
+    module, chain = sweep_to_main
+    monkeypatch.setattr(module, "READ_RETRY_DELAY", 0)
+    address = Web3.to_checksum_address("0x" + "22" * 20)
+    chain.fund(address, eth_wei=10**17, usdc_raw=50 * 10**6)
+    calls = []
+    get_balance = module.get_balance
+    def flaky_get_balance(address):
+        calls.append(address)
+        if len(calls) < module.READ_ATTEMPTS:
+            raise ConnectionError("simulated upstream error")
+        return get_balance(address)
+    flaky_get_balance.__name__ = "get_balance"
+    monkeypatch.setattr(module, "get_balance", flaky_get_balance)
+
+    transfer = module.prepare_transfer({"address": address})
+
+    assert transfer["balance"] == 50 * 10**6
+    assert len(calls) == module.READ_ATTEMPTS
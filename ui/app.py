@@ -1,26 +1,34 @@
-from flask import Flask, render_template, request, jsonify
-import time, threading
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+import time
 import sys, os
 import logging
 from dotenv import load_dotenv
-from web3 import Web3
 from pycoingecko import CoinGeckoAPI
 import krakenex
-import asyncio
 
 sys.path.append("..")  # Adjust the path to import from the parent directory
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from funcs import generate_wallets, search_wallets, get_wallets, disable_wallet, enable_wallet, jsonify_walletBalances, get_mnemonic, read_last_n_lines, cancel_pending_transaction
+from funcs import generate_wallets, search_wallets, find_wallets, get_wallets, disable_wallet, enable_wallet, get_mnemonic, read_last_n_lines, log_line_matches, cancel_pending_transaction, LOG_CHUNK_SIZE
 
 from send_out_gas import refillGas
+from provider import get_web3
 from sweep_to_main import main as sweep_to_main
+from jobs import get_job_manager, JobConflict
+from balance_cache import get_balance_cache
+import metrics
 
 # TODO
 # Add edit button/functionality
 # Track errors in send out gas using global var?
 app = Flask(__name__)
 
-operation_status = "Uninitialized"
+def start_job(kind, func):
+    """Queue a background job and answer right away with its id (409 if one is already active)."""
+    try:
+        job = get_job_manager().submit(kind, func)
+    except JobConflict as e:
+        return jsonify({"result": f"A {kind} is already {e.job.status} (job {e.job.id})", "job_id": e.job.id}), 409
+    return jsonify({"result": f"{kind.replace('_', ' ').capitalize()} started as job {job.id}", "job_id": job.id}), 202
 
 
 @app.route('/')
@@ -56,7 +64,8 @@ def action():
         if not search_email and not search_name:
             return jsonify({"result": "At least one of name or email is required for search"}), 400
         try:
-            search_results = search_wallets(wallet_name=search_name, wallet_email=search_email)
+            match = data.get('match', 'exact')  # exact, iexact or prefix
+            search_results = search_wallets(wallet_name=search_name, wallet_email=search_email, match=match)
             if search_results:
                 return jsonify({"result": search_results}), 200
             else:
@@ -119,8 +128,8 @@ def action():
             return jsonify({"result": f"An internal error occurred: {str(e)}"}), 500
     elif button_clicked == "force_sweep":
         try:
-            sweep_to_main()
-            return jsonify({"result": "Sweep wallets to main wallet operation started."}), 200
+            mode = data.get('mode')  # "full" or "deposits", defaults to SWEEP_MODE
+            return start_job("sweep", lambda job: sweep_to_main(job=job, mode=mode))
         except Exception as e:
             return jsonify({"result": f"An internal error occurred during sweep: {str(e)}"}), 500
     elif button_clicked == "list_all_balances":
@@ -131,22 +140,17 @@ def action():
                 wallets = [wallet for wallet in wallets if wallet.get("enabled", True)]  # Filter enabled wallets
             elif scope.lower() == 'disabled':
                 wallets = [wallet for wallet in wallets if not wallet.get("enabled", True)]
-            wallets_balances = jsonify_walletBalances(wallets=wallets)
-            if not wallets_balances["wallets"]:
+            if not wallets:
                 return jsonify({"result": "No wallets found or no balances available"}), 404
-            else:
-                sorted_wallets = sorted(wallets_balances["wallets"], key=lambda wallet: wallet.get("name", "").lower())
-                return jsonify({"result": sorted_wallets}), 200
+            # Served from the shared background snapshot, force_refresh re-reads the chain now
+            wallets_balances = get_balance_cache().wallet_balances(wallets, force=bool(data.get('force_refresh')))
+            sorted_wallets = sorted(wallets_balances["wallets"], key=lambda wallet: wallet.get("name", "").lower())
+            return jsonify({"result": sorted_wallets, "block": wallets_balances["block"], "age": wallets_balances["age"]}), 200
         except Exception as e:
             return jsonify({"result": f"An internal error occurred: {str(e)}"}), 500
     elif button_clicked == "refill_gas":
         try:
-            def run_refill_thread():
-                refillGas()
-
-            thread = threading.Thread(target=run_refill_thread)
-            thread.start()
-            return jsonify({"result": "Gas refill operation started"}), 200
+            return start_job("gas_refill", lambda job: refillGas(job=job))
         except Exception as e:
             return jsonify({"result": f"An internal error occurred during gas refill: {str(e)}"}), 500
     elif button_clicked == "get_mnemonic":
@@ -174,11 +178,9 @@ def action():
             name = data.get('name', None)
             email = data.get('email', None)
             
-            wallets = get_wallets()
-            for wallet in wallets:
-                if (wallet["email"] == email or wallet["name"] == name):
-                    cancel_pending_transaction(wallet["address"], wallet["private_key"], web3)
-                    return jsonify({"result": "Finished Canceling"}), 200
+            for wallet in find_wallets(name=name, email=email, limit=1):
+                cancel_pending_transaction(wallet["address"], wallet["private_key"], get_web3())
+                return jsonify({"result": "Finished Canceling"}), 200
                 
             return jsonify({"result": "No matching wallet found or wallet is enabled"}), 404
 
@@ -186,15 +188,120 @@ def action():
             return jsonify({"result": f"An internal error occurred: {str(e)}"}), 500
     return jsonify({"result": "Undefined Action"}), 400
 
+LOG_FILE = "usdc_transfer.log"
+LOG_POLL_INTERVAL = 1  # Seconds between checks for new log lines
+LOG_KEEPALIVE_INTERVAL = 15  # Seconds between SSE comments on an idle stream
+
+def follow_log(offset, level=None, address=None, log_file=LOG_FILE):
+    """Yield (end_offset, line) for every complete line appended after byte offset, forever.
+
+    Only the new bytes are read on each poll, LOG_CHUNK_SIZE at a time. If the file shrinks
+    (rotated or truncated) the stream restarts from the beginning. Yields (None, None) when
+    idle so the caller can send keep-alives.
+    """
+    while True:
+        try:
+            size = os.path.getsize(log_file)
+        except OSError:
+            size = 0
+        if size < offset:
+            offset = 0
+        if size > offset:
+            with open(log_file, "rb") as f:
+                f.seek(offset)
+                partial = b""  # Start of a line that continues in the next chunk
+                while offset + len(partial) < size:
+                    # Bounded reads, a client resuming from an old offset must not load the whole backlog
+                    chunk = f.read(min(LOG_CHUNK_SIZE, size - offset - len(partial)))
+                    if not chunk:
+                        break
+                    data = partial + chunk
+                    complete = data.rfind(b"\n") + 1  # A partially written last line waits for the next poll
+                    for raw_line in data[:complete].split(b"\n")[:-1]:
+                        offset += len(raw_line) + 1
+                        line = raw_line.decode("utf-8", errors="replace")
+                        if log_line_matches(line, level, address):
+                            yield offset, line
+                    partial = data[complete:]
+        yield None, None
+        time.sleep(LOG_POLL_INTERVAL)
+
+@app.route('/api/logs/stream', methods=['GET'])
+def stream_logs():
+    """Server-sent events stream of new usdc_transfer.log lines.
+
+    Query params: level, address (filters), tail (send the last N matching lines first).
+    Each event id is the byte offset after its line, so a reconnecting EventSource resumes
+    from Last-Event-ID without a full re-read.
+    """
+    level = request.args.get('level') or None
+    address = request.args.get('address') or None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('offset')
+    tail = request.args.get('tail', 0, type=int)
+
+    def generate():
+        if last_event_id and last_event_id.isdigit():
+            offset = int(last_event_id)
+        else:
+            offset = os.path.getsize(LOG_FILE) if os.path.exists(LOG_FILE) else 0
+            if tail > 0 and offset:
+                for line in read_last_n_lines(tail, LOG_FILE, level=level, address=address):
+                    yield f"data: {line.rstrip()}\n\n"
+                yield f"id: {offset}\n\n"
+        last_sent = time.time()
+        for end_offset, line in follow_log(offset, level, address):
+            if line is not None:
+                yield f"id: {end_offset}\ndata: {line}\n\n"
+                last_sent = time.time()
+            elif time.time() - last_sent > LOG_KEEPALIVE_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.time()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    jobs = get_job_manager().list(kind=request.args.get('kind'))
+    return jsonify({"result": [job.to_dict() for job in jobs]})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"result": "Unknown job"}), 404
+    return jsonify({"result": job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({"result": "Unknown job"}), 404
+    return jsonify({"result": job.to_dict()})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Counters and histograms from metrics.py in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/status', methods=['GET'])
 def status():
-    global operation_status
-    if "finished" in operation_status.lower() or "error" in operation_status.lower(): # If done, reset
-        operation_status_copy = operation_status
-        operation_status = "Uninitialized"
-        return jsonify({"result": f"Status: {operation_status_copy}"})
+    """Human readable status of one job (job_id param) or of the most recent one. Read only."""
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = get_job_manager().get(job_id)
     else:
-        return jsonify({"result": f"Status: {operation_status}"})
+        jobs = get_job_manager().list()
+        job = jobs[0] if jobs else None
+    if job is None:
+        return jsonify({"result": "Status: No operations started"})
+    info = job.to_dict()
+    total = info["total"] if info["total"] is not None else "?"
+    text = (f"Status: {info['kind']} job {info['id']} {info['status']} - {info['processed']}/{total} wallets processed, "
+            f"{info['succeeded']} succeeded, {info['failed']} failed, {info['skipped']} skipped ({info['seconds']}s)")
+    if info["error"]:
+        text += f" - error: {info['error']}"
+    return jsonify({"result": text, "job": info})
 
 if __name__ == '__main__':
     # Set up logging
@@ -202,14 +309,11 @@ if __name__ == '__main__':
                         format='%(asctime)s - %(levelname)s - %(message)s')
     # Load environment variables
     load_dotenv()
-    INFURA_API_KEY = os.getenv('INFURA_API_KEY')
     KRAKEN_API_KEY = os.getenv('KRAKEN_API_KEY')
     KRAKEN_API_SECRET = os.getenv('KRAKEN_API_SECRET')
 
-    MAINNET_RPC_URL = f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"
-
-    # Initialize web3, CoinGecko, and Kraken
-    web3 = Web3(Web3.HTTPProvider(MAINNET_RPC_URL))
+    # Initialize web3 (shared, pooled provider), CoinGecko, and Kraken
+    web3 = get_web3()
     cg = CoinGeckoAPI()
     kraken = krakenex.API(key=KRAKEN_API_KEY, secret=KRAKEN_API_SECRET)
     app.run(host='0.0.0.0', port=80,debug=True)
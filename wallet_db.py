@@ -0,0 +1,211 @@
+import os
+import json
+import logging
+import sqlite3
+from cryptography.fernet import Fernet
+
+# Record-level wallet storage. Each wallet is one SQLite row whose private key is encrypted
+# on its own with the Fernet key from key_file, so adding or toggling one wallet is a
+# single-row write inside one atomic transaction instead of re-encrypting the whole fleet.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS wallets (
+    hd_index INTEGER PRIMARY KEY,
+    address TEXT NOT NULL UNIQUE,
+    private_key BLOB NOT NULL,
+    name TEXT,
+    email TEXT,
+    kraken_nickname TEXT,
+    enabled INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_wallets_name ON wallets (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_wallets_email ON wallets (email COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_wallets_address ON wallets (address COLLATE NOCASE);
+"""
+
+MATCH_MODES = ("exact", "iexact", "prefix")
+
+WALLET_COLUMNS = "hd_index, address, private_key, name, email, kraken_nickname, enabled"
+
+
+def db_path_for(wallets_file):
+    """wallets.enc -> wallets.db, masterWallets.enc -> masterWallets.db"""
+    return os.path.splitext(wallets_file)[0] + ".db"
+
+def load_or_create_key(key_file):
+    """Read the Fernet key, creating it once if missing. The key is never rotated on save."""
+    if os.path.exists(key_file):
+        with open(key_file, "rb") as f:
+            return f.read()
+    key = Fernet.generate_key()
+    with open(key_file, "wb") as f:
+        f.write(key)
+    return key
+
+
+class WalletDB:
+    def __init__(self, db_file, key):
+        self.db_file = db_file
+        self.cipher = Fernet(key)
+        self.conn = sqlite3.connect(db_file)
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def _row_to_wallet(self, row):
+        hd_index, address, private_key, name, email, kraken_nickname, enabled = row
+        return {
+            "address": address,
+            "private_key": self.cipher.decrypt(private_key).decode(),
+            "name": name,
+            "email": email,
+            "kraken_nickname": kraken_nickname,
+            "enabled": bool(enabled),
+            "index": hd_index,
+        }
+
+    def _wallet_to_row(self, wallet):
+        return (
+            wallet["index"],
+            wallet["address"],
+            self.cipher.encrypt(wallet["private_key"].encode()),
+            wallet.get("name"),
+            wallet.get("email"),
+            wallet.get("kraken_nickname"),
+            int(wallet.get("enabled", True)),
+        )
+
+    def get_mnemonic(self):
+        row = self.conn.execute("SELECT value FROM metadata WHERE key = 'mnemonic'").fetchone()
+        if row is None:
+            return None
+        return self.cipher.decrypt(row[0]).decode()
+
+    def set_mnemonic(self, mnemonic):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('mnemonic', ?)",
+                              (self.cipher.encrypt(mnemonic.encode()),))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM wallets").fetchone()[0]
+
+    def next_index(self):
+        row = self.conn.execute("SELECT MAX(hd_index) FROM wallets").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def load_wallets(self):
+        rows = self.conn.execute(f"SELECT {WALLET_COLUMNS} FROM wallets ORDER BY hd_index").fetchall()
+        return [self._row_to_wallet(row) for row in rows]
+
+    def find_wallets(self, name=None, email=None, address=None, index=None, match="exact", enabled=None, limit=None):
+        """Indexed lookup that only reads and decrypts the matching rows.
+
+        A wallet matches if any of the given name/email/address/index criteria match (same
+        "or" rule as the old linear scan). match is "exact" (case-sensitive), "iexact" or
+        "prefix" (case-insensitive) and applies to name, email and address. enabled, when not
+        None, filters on the flag. Results are ordered by HD index.
+        """
+        if match not in MATCH_MODES:
+            raise ValueError(f"match must be one of {MATCH_MODES}, got {match!r}")
+        clauses = []
+        params = []
+        for column, value in (("name", name), ("email", email), ("address", address)):
+            if not value:
+                continue
+            if match == "prefix":
+                # Range scan on the NOCASE index: column >= prefix AND column < next prefix
+                value = value.lower()
+                upper = value[:-1] + chr(ord(value[-1]) + 1)
+                clauses.append(f"({column} >= ? COLLATE NOCASE AND {column} < ? COLLATE NOCASE)")
+                params.extend([value, upper])
+            elif match == "iexact":
+                clauses.append(f"{column} = ? COLLATE NOCASE")
+                params.append(value)
+            else:
+                # NOCASE comparison uses the index, the binary one keeps it case-sensitive
+                clauses.append(f"({column} = ? COLLATE NOCASE AND {column} = ?)")
+                params.extend([value, value])
+        if index is not None:
+            clauses.append("hd_index = ?")
+            params.append(int(index))
+
+        query = f"SELECT {WALLET_COLUMNS} FROM wallets"
+        conditions = []
+        if clauses:
+            conditions.append("(" + " OR ".join(clauses) + ")")
+        elif enabled is None:
+            return []  # No criteria given
+        if enabled is not None:
+            conditions.append("enabled = ?")
+            params.append(int(enabled))
+        query += " WHERE " + " AND ".join(conditions) + " ORDER BY hd_index"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [self._row_to_wallet(row) for row in self.conn.execute(query, params)]
+
+    def add_wallets(self, wallets):
+        """Insert new wallets (each with its HD "index") in one transaction."""
+        with self.conn:
+            self.conn.executemany(f"INSERT INTO wallets ({WALLET_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  [self._wallet_to_row(w) for w in wallets])
+
+    def save_all(self, wallets, mnemonic):
+        """Bulk write of the mnemonic and every wallet, committed as one transaction."""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('mnemonic', ?)",
+                              (self.cipher.encrypt(mnemonic.encode()),))
+            self.conn.executemany(f"INSERT OR REPLACE INTO wallets ({WALLET_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  [self._wallet_to_row(w) for w in wallets])
+
+    def set_enabled(self, address, enabled):
+        """Single-row update of the enabled flag. Returns True if a wallet was updated."""
+        with self.conn:
+            cursor = self.conn.execute("UPDATE wallets SET enabled = ? WHERE address = ?", (int(enabled), address))
+        return cursor.rowcount == 1
+
+
+def migrate_from_enc(wallets_file, key_file, db_file=None):
+    """One-shot migration of a legacy wallets.enc/encryption_key.txt pair into SQLite.
+
+    The database is built in a temporary file and moved into place only once complete, so a
+    crash never leaves a half-migrated store. The legacy files are left untouched as a backup.
+    Returns True if a migration happened.
+    """
+    db_file = db_file or db_path_for(wallets_file)
+    if os.path.exists(db_file) or not (os.path.exists(wallets_file) and os.path.exists(key_file)):
+        return False
+
+    logging.info(f"Migrating {wallets_file} to record-level store {db_file}")
+    with open(key_file, "rb") as f:
+        key = f.read()
+    with open(wallets_file, "rb") as f:
+        data = json.loads(Fernet(key).decrypt(f.read()).decode())
+
+    wallets = []
+    for i, wallet in enumerate(data["wallets"]):  # HD index is the position in the legacy list
+        wallet = dict(wallet)
+        wallet["index"] = i
+        wallets.append(wallet)
+
+    tmp_file = db_file + ".tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    with WalletDB(tmp_file, key) as db:
+        db.save_all(wallets, data["metadata"]["mnemonic"])
+    os.replace(tmp_file, db_file)
+    logging.info(f"Migrated {len(wallets)} wallets to {db_file}")
+    return True